@@ -1,16 +1,21 @@
 from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-from google.genai import types
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 from pydantic import BaseModel
-import requests
+from urllib.parse import urlparse
 import sys
 import os
 import base64
+import json
 import ssl
+import asyncio
+import contextvars
+import functools
 
 
 # --- Request DTOs ---
@@ -40,6 +45,12 @@ class GenerateInvitationRequest(BaseModel):
     additionalRequest: Optional[str] = ""
     tone: Optional[str] = "WARM"
     # frame: Optional[str] = "CLASSIC"
+    # true 면 결과 캐시(INVITATION_CACHE_TTL)를 무시하고 새로 생성
+    forceRegenerate: Optional[bool] = False
+    # model 또는 hybrid (없으면 RENDER_MODE, nanobanana_api.py 참고)
+    renderMode: Optional[str] = None
+    # 고친 문구 {"greeting", "invitation", "location"} (주면 문구 생성 생략)
+    texts: Optional[Dict[str, str]] = None
 
 
 # 전역 SSL 인증서 검증 비활성화
@@ -51,10 +62,26 @@ except Exception:
 # 프로젝트 루트를 sys.path에 추가
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from gemini_text_api import generate_wedding_texts
-from nanobanana_api import generate_invitation_with_nanobanana
-from gemini_invitation_api import generate_invitation_with_gemini
-from imagen_design_api import generate_invitation_design
+# 파이프라인 모듈(google-genai, boto3, Pillow, requests 포함)은 각 엔드포인트에서
+# 처음 쓸 때 import 합니다. 서버 기동/--reload 시간을 줄이기 위함
+from utils.tracing import begin_trace, current_trace, end_context, response_header_enabled, set_attributes, span
+from utils.usage import budgets, summarize_trace
+from utils.genai_client import MissingGeminiKeyError, get_key_pool
+from utils.shared_cache import shared_cache
+from utils import admission, idempotency, invitation_cache, memory, metrics, uploads, warmup
+from utils.singleflight import AsyncSingleFlight, SingleFlight
+from utils.uploads import UploadLimitMiddleware
+from utils.log import configure_logging, get_logger, reset_request_id, set_request_id, shutdown_logging
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+configure_logging()
+logger = get_logger(__name__)
+
+# 같은 작업이 동시에 들어오면 한 번만 실행 (utils/singleflight.py)
+_invitation_flight = AsyncSingleFlight("invitation")
+_download_flight = SingleFlight("image_download")
 
 app = FastAPI(
     title="Wedding OS - Model API",
@@ -66,15 +93,23 @@ app = FastAPI(
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     error_details = exc.errors()
-    print("❌ Validation Error Details:")
-    for error in error_details:
-        print(f"   - Field: {error.get('loc')}, Message: {error.get('msg')}, Type: {error.get('type')}")
+    logger.warning("validation error", extra={"fields": {
+        "path": request.url.path,
+        "errors": [{"loc": error.get("loc"), "msg": error.get("msg"), "type": error.get("type")} for error in error_details],
+    }})
     
     return JSONResponse(
         status_code=422,
         content={"success": False, "error": "Validation Error", "detail": error_details},
     )
 
+# 업로드 경로 본문 크기 제한 (Content-Length 초과 시 본문을 읽기 전에 413, utils/uploads.py)
+app.add_middleware(UploadLimitMiddleware, paths=("/api/generate-invitation-test",))
+
+@app.exception_handler(uploads.UploadRejected)
+async def upload_rejected_handler(request: Request, exc: uploads.UploadRejected):
+    return uploads.rejection_response(exc)
+
 # CORS 설정
 app.add_middleware(
     CORSMiddleware,
@@ -84,6 +119,116 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 요청 단위 트레이싱 (/api/* 만)
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+
+    # 테넌트 일일 예산 (X-Tenant-ID 헤더, utils/usage.py)
+    tenant = request.headers.get("x-tenant-id") or "default"
+    if budgets.exceeded(tenant):
+        metrics.BUDGET_REJECTIONS.inc()
+        logger.warning("daily budget exceeded", extra={"fields": {"tenant": tenant, "spent_usd": budgets.spent(tenant)}})
+        return JSONResponse(
+            status_code=429,
+            content={"success": False, "error": "테넌트 일일 예산을 초과했습니다", "tenant": tenant},
+        )
+
+    # 경로별 레인 입장 (넘치면 429 + Retry-After, 포화도에 따라 브라운아웃 단계 설정, utils/admission.py)
+    # → 이미지 버퍼 메모리 예산 예약 (예산이 찰 때까지 대기, utils/memory.py)
+    # 메트릭 라벨/예산 키는 등록된 라우트만 (404·스캔 경로마다 시계열이 늘지 않도록 나머지는 "other")
+    endpoint = _endpoint_label(request)
+    try:
+        ticket = await admission.controller.acquire(endpoint)
+        try:
+            reservation = await memory.budget.reserve(endpoint)
+        except BaseException:
+            ticket.release()
+            raise
+    except admission.Overloaded as e:
+        return JSONResponse(
+            status_code=429,
+            content={"success": False, "error": "요청이 많아 잠시 후 다시 시도해 주세요", "retryAfter": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    in_flight = metrics.IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    trace, token = begin_trace(
+        f"{request.method} {request.url.path}",
+        http_method=request.method,
+        http_path=request.url.path,
+        endpoint=endpoint,
+        bytes_in=int(request.headers.get("content-length") or 0),
+        tenant=tenant,
+        brownout_level=ticket.level,
+    )
+    # 상관관계 ID: 호출 측(백엔드)이 보낸 X-Request-ID 를 우선 사용
+    request_id = request.headers.get("x-request-id") or trace.trace_id[:16]
+    trace.root.set(request_id=request_id)
+    request_id_token = set_request_id(request_id)
+    try:
+        response = await call_next(request)
+    except BaseException as e:
+        # 취소(종료, 태스크 그룹 취소)도 포함해야 레인 자리/메모리 예약이 새지 않음
+        reservation.release()
+        trace.finish(error=repr(e))
+        in_flight.dec()
+        ticket.release()
+        raise
+    finally:
+        end_context(token)
+        reset_request_id(request_id_token)
+
+    trace.root.set(http_status=response.status_code)
+    response.headers["X-Trace-Id"] = trace.trace_id
+    response.headers["X-Request-ID"] = request_id
+    if ticket.level:
+        response.headers["X-Brownout-Level"] = str(ticket.level)
+    if response_header_enabled():
+        # SSE 응답은 헤더 전송 시점까지 끝난 구간만 포함됩니다
+        response.headers["Server-Timing"] = trace.server_timing()
+
+    finished = False
+
+    def finish() -> None:
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        reservation.release()
+        if reservation.account.peak:
+            trace.root.set(image_bytes_peak=reservation.account.peak)
+        trace.finish()
+        in_flight.dec()
+        ticket.release()
+
+    # 루트 span 종료와 레인 자리/메모리 예약 반환은 본문 전송까지 끝난 뒤 (스트리밍 응답 포함).
+    # 본문을 한 번도 읽지 않고 끊겨도(응답 시작 전 연결 종료 등) 응답 전송이 끝나는 시점에 반드시 실행
+    return _FinishAfterSend(response, finish)
+
+
+def _endpoint_label(request: Request) -> str:
+    """메트릭 endpoint 라벨: 등록된 /api 라우트 경로, 그 외(404·스캔 경로)는 other"""
+    path = request.url.path
+    routes = {route.path for route in request.app.routes if isinstance(route, APIRoute)}
+    return path if path in routes else "other"
+
+
+class _FinishAfterSend:
+    """응답 전송(ASGI 호출)이 끝나면 정상/오류/취소와 관계없이 on_finish 실행"""
+
+    def __init__(self, response: Response, on_finish: Callable[[], None]):
+        self.response = response
+        self.on_finish = on_finish
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self.on_finish()
+
 # 정적 파일 서빙 설정 (생성된 이미지 로컬 저장용)
 static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
 if not os.path.exists(static_dir):
@@ -101,7 +246,9 @@ async def root():
         "version": "1.0.0",
         "endpoints": [
             "GET /health - 헬스 체크",
-            "POST /api/generate-text - 텍스트 생성 (Gemini)",
+            "GET /ready - 준비 상태 (워밍업 완료 전 503)",
+            "GET /metrics - Prometheus 메트릭",
+            "POST /api/generate-text - 텍스트 생성 (Gemini, \"stream\": true 시 SSE)",
             "POST /api/generate-invitation - 청첩장 이미지 생성 (Gemini/Imagen)",
         ]
     }
@@ -110,28 +257,166 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    """워밍업(utils/warmup.py)이 끝나야 200, 그 전에는 503"""
+    return JSONResponse(status_code=200 if warmup.is_ready() else 503, content=warmup.state.to_dict())
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 메트릭 (multiprocess 모드면 모든 워커 합산)"""
+    body, content_type = metrics.render_metrics()
+    if body is None:
+        return Response("prometheus_client not installed\n", status_code=503, media_type="text/plain")
+    return Response(body, media_type=content_type)
+
+def _admin_denied(request: Request) -> Optional[JSONResponse]:
+    """관리 엔드포인트 인증 (ADMIN_TOKEN 미설정이면 비활성화)"""
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        return JSONResponse(status_code=404, content={"success": False, "error": "ADMIN_TOKEN 이 설정되지 않았습니다"})
+    if request.headers.get("x-admin-token") != expected:
+        return JSONResponse(status_code=403, content={"success": False, "error": "관리자 토큰이 올바르지 않습니다"})
+    return None
+
+@app.get("/admin/memory")
+async def admin_memory(request: Request):
+    """메모리 예산 / 진행 중 요청별 이미지 버퍼 / RSS (utils/memory.py)"""
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    return {
+        "rss": memory.rss_bytes(),
+        "budget": memory.budget.stats(),
+        "requests": memory.in_flight(),
+    }
+
+@app.get("/admin/keys")
+async def admin_keys(request: Request):
+    """API 키 풀 키별 사용량 / 429 / 휴식 상태 (utils/genai_client.py, 키는 해시 이름만)"""
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    try:
+        return {"keys": get_key_pool().stats()}
+    except MissingGeminiKeyError as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)})
+
+@app.post("/admin/tracemalloc/{action}")
+async def admin_tracemalloc_control(action: str, request: Request, frames: int = 10):
+    """tracemalloc 시작/중지 (action: start | stop)"""
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    if action == "start":
+        memory.start_tracemalloc(frames)
+    elif action == "stop":
+        memory.stop_tracemalloc()
+    else:
+        return JSONResponse(status_code=400, content={"success": False, "error": f"알 수 없는 action: {action}"})
+    return {"success": True, "action": action}
+
+@app.get("/admin/tracemalloc")
+async def admin_tracemalloc(request: Request, top: int = 20, group: str = "lineno", diff: bool = False):
+    """
+    tracemalloc 스냅숏 상위 할당 위치 (group: lineno | filename | traceback)
+
+    diff=true 면 직전 스냅숏 대비 증가량 순. 스냅숏은 스레드에서 찍습니다 (수백 ms 걸릴 수 있음).
+    """
+    denied = _admin_denied(request)
+    if denied:
+        return denied
+    if group not in ("lineno", "filename", "traceback"):
+        return JSONResponse(status_code=400, content={"success": False, "error": f"알 수 없는 group: {group}"})
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(memory.tracemalloc_report, top=top, group=group, diff=diff))
+
+@app.on_event("startup")
+async def start_runtime_sampler():
+    # 이벤트 루프 지연 / 스레드풀 포화도 샘플링
+    app.state.runtime_sampler = asyncio.create_task(metrics.sample_runtime())
+
+@app.on_event("startup")
+async def start_warmup():
+    # 프롬프트/코덱/클라이언트/연결 워밍업 (끝날 때까지 /ready 는 503)
+    app.state.warmup = asyncio.create_task(warmup.warmup_in_background())
+
+@app.on_event("shutdown")
+async def stop_runtime_sampler():
+    sampler = getattr(app.state, "runtime_sampler", None)
+    if sampler:
+        sampler.cancel()
+    metrics.mark_process_dead()
+    shutdown_logging()
+
 @app.post("/api/generate-text")
 async def generate_text(request: dict):
     """
     청첩장 텍스트 생성 API (Gemini Flash 2.5)
+
+    요청 본문에 "stream": true 를 넣으면 문구가 완성되는 대로
+    Server-Sent Events(text/event-stream)로 전송합니다.
     """
+    text_kwargs = dict(
+        tone=request.get("tone", "romantic"),
+        groom_name=request.get("groom_name"),
+        bride_name=request.get("bride_name"),
+        groom_father=request.get("groom_father"),
+        groom_mother=request.get("groom_mother"),
+        bride_father=request.get("bride_father"),
+        bride_mother=request.get("bride_mother"),
+        venue=request.get("venue"),
+        wedding_date=request.get("wedding_date"),
+        wedding_time=request.get("wedding_time"),
+        address=request.get("address", "")
+    )
+
+    if request.get("stream"):
+        return StreamingResponse(
+            _stream_text_events(text_kwargs),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     try:
-        result = generate_wedding_texts(
-            tone=request.get("tone", "romantic"),
-            groom_name=request.get("groom_name"),
-            bride_name=request.get("bride_name"),
-            groom_father=request.get("groom_father"),
-            groom_mother=request.get("groom_mother"),
-            bride_father=request.get("bride_father"),
-            bride_mother=request.get("bride_mother"),
-            venue=request.get("venue"),
-            wedding_date=request.get("wedding_date"),
-            wedding_time=request.get("wedding_time"),
-            address=request.get("address", "")
+        from gemini_text_api import generate_wedding_texts
+
+        # 이벤트 루프를 막지 않도록 스레드에서 실행 (같은 입력의 동시 요청은 함수 안에서 합쳐짐)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, contextvars.copy_context().run, functools.partial(generate_wedding_texts, **text_kwargs)
         )
-        return {"success": True, "data": result}
+        return {"success": True, "data": result, "usage": summarize_trace(current_trace())}
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return {"success": False, "error": str(e), "usage": summarize_trace(current_trace())}
+
+
+def _sse(event: str, payload: dict) -> str:
+    """SSE 메시지 한 건을 직렬화"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _stream_text_events(text_kwargs: dict):
+    """
+    stream_wedding_texts 이벤트를 SSE 형식으로 변환
+
+    동기 제너레이터이므로 StreamingResponse가 스레드풀에서 순회하여
+    이벤트 루프를 막지 않습니다.
+    """
+    try:
+        from gemini_text_api import stream_wedding_texts
+
+        for item in stream_wedding_texts(**text_kwargs):
+            if item["event"] == "done":
+                yield _sse("done", {"success": True, "data": item["data"], "usage": summarize_trace(current_trace())})
+            else:
+                yield _sse("field", {
+                    "field": item["field"],
+                    "index": item["index"],
+                    "value": item["value"],
+                })
+    except Exception as e:
+        yield _sse("error", {"success": False, "error": str(e)})
 
 
 @app.post("/api/generate-invitation-test")
@@ -160,23 +445,36 @@ async def generate_invitation_test(
     """
     청첩장 이미지 생성 테스트 API (나노바나나 vs Gemini Flash 2.5 vs Gemini 3.0)
     """
-    print(f"DEBUG: model_type={model_type}")
-    
-    try:
-        wedding_image_base64 = None
-        if wedding_image:
-            wedding_image_bytes = await wedding_image.read()
-            wedding_image_base64 = base64.b64encode(wedding_image_bytes).decode('utf-8')
+    logger.info("generate-invitation-test", extra={"fields": {"model_type": model_type, "tone": tone}})
+    loop = asyncio.get_running_loop()
 
-        style_image_base64 = None
-        if style_image:
-            style_image_bytes = await style_image.read()
-            style_image_base64 = base64.b64encode(style_image_bytes).decode('utf-8')
+    try:
+        with span("request.parse", model_type=model_type) as s:
+            # 한도 확인 + 큰 이미지는 축소 (스풀 파일에서 바로, utils/uploads.py)
+            wedding_image_base64 = None
+            wedding_image_bytes = await uploads.read_image(wedding_image)
+            if wedding_image_bytes:
+                wedding_image_base64 = base64.b64encode(wedding_image_bytes).decode('utf-8')
+                s.add("bytes_in", len(wedding_image_bytes))
+                memory.track("wedding_b64", len(wedding_image_base64))
+            del wedding_image_bytes
+
+            style_image_base64 = None
+            style_image_bytes = await uploads.read_image(style_image)
+            if style_image_bytes:
+                style_image_base64 = base64.b64encode(style_image_bytes).decode('utf-8')
+                s.add("bytes_in", len(style_image_bytes))
+                memory.track("style_b64", len(style_image_base64))
+            del style_image_bytes
 
         if model_type == "nanobanana":
             # 나노바나나 대신 Imagen으로 대체 가능성 염두에 둠
             # 나노바나나 (Local Tuning Mode with Gemini)
-            result = generate_invitation_with_nanobanana(
+            from nanobanana_api import generate_invitation_with_nanobanana
+
+            # 동기 파이프라인(모델 호출 수 분)은 스레드에서 실행 (이벤트 루프를 막아 실서비스 레인을 멈추지 않도록)
+            result = await loop.run_in_executor(None, contextvars.copy_context().run, functools.partial(
+                generate_invitation_with_nanobanana,
                 groom_name=groom_name,
                 bride_name=bride_name,
                 groom_father=groom_father,
@@ -196,7 +494,7 @@ async def generate_invitation_test(
                 prompt_override_1=prompt_override_1,
                 prompt_override_2=prompt_override_2,
                 prompt_override_3=prompt_override_3
-            )
+            ))
         elif model_type == "flash2.5" or model_type == "imagen-4.0-generate":
             # Flash 2.5 또는 Imagen 4.0 시도
             # imagen_design_api.py 내부에서 fallback 로직이 작동합니다.
@@ -206,6 +504,8 @@ async def generate_invitation_test(
                 "location": "서울 어딘가",
                 "closing": "감사합니다"
             }
+            from imagen_design_api import generate_invitation_design
+
             result = await generate_invitation_design(
                 style_image_base64=style_image_base64,
                 wedding_image_base64=wedding_image_base64,
@@ -214,7 +514,10 @@ async def generate_invitation_test(
             )
         elif model_type == "gemini3.0" or model_type == "gemini-3-pro-image":
             # Gemini 3.0 (실제로는 gemini-3-pro-image-preview 사용)
-            result = generate_invitation_with_gemini(
+            from gemini_invitation_api import generate_invitation_with_gemini
+
+            result = await loop.run_in_executor(None, contextvars.copy_context().run, functools.partial(
+                generate_invitation_with_gemini,
                 model_name='gemini-3-pro-image-preview',
                 groom_name=groom_name,
                 bride_name=bride_name,
@@ -224,23 +527,34 @@ async def generate_invitation_test(
                 wedding_image_base64=wedding_image_base64,
                 style_image_base64=style_image_base64,
                 tone=tone
-            )
+            ))
         else:
             return {"success": False, "error": f"지원하지 않는 모델 타입입니다: {model_type}"}
 
-        return {"success": True, "data": result}
+        return {"success": True, "data": result, "usage": summarize_trace(current_trace())}
 
+    except uploads.UploadRejected:
+        raise
     except Exception as e:
         import traceback
-        print(f"❌ Error during generation ({model_type}): {e}")
-        return {"success": False, "error": str(e), "traceback": traceback.format_exc()}
+        logger.exception("generation failed", extra={"fields": {"model_type": model_type}})
+        return {
+            "success": False,
+            "error": str(e),
+            "traceback": traceback.format_exc(),
+            "usage": summarize_trace(current_trace()),
+        }
 
 
 @app.post("/api/generate-invitation")
-async def generate_invitation(request: GenerateInvitationRequest):
+async def generate_invitation(request: GenerateInvitationRequest, http_request: Request):
     """
     청첩장 이미지 생성 API (나노바나나 사용)
 
+    같은 본문의 요청이 처리 중이면 새로 생성하지 않고 그 결과를 함께 받습니다 (X-Coalesced: true).
+    Idempotency-Key 헤더를 보내면 성공 응답을 IDEMPOTENCY_TTL 동안 재생합니다
+    (Idempotent-Replayed: true, 같은 키에 다른 본문이면 409). utils/idempotency.py 참고
+
     Request Body:
     {
         "groom": {"name": "홍길동", "fatherName": "홍부", "motherName": "김씨"},
@@ -252,16 +566,68 @@ async def generate_invitation(request: GenerateInvitationRequest):
         "additionalRequest": "잔잔한 분위기",
         "tone": "WARM",
         # "frame": "CLASSIC"
+        "renderMode": "hybrid",   # 선택: 2/3페이지 로컬 조판
+        "texts": {"greeting": "...", "invitation": "...", "location": "..."}   # 선택: 고친 문구로 재렌더링
     }
     """
-    print(f"DEBUG: request={request}")
+    # 요청 전체(이름, URL 등)는 남기지 않고 요약만 기록
+    logger.info("generate-invitation", extra={"fields": {"tone": request.tone, "has_extra_message": bool(request.extraMessage)}})
+
+    tenant = http_request.headers.get("x-tenant-id") or "default"
+    key = http_request.headers.get("idempotency-key")
+    fp = idempotency.fingerprint({"tenant": tenant, "request": jsonable_encoder(request)})
+
+    async def run() -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, contextvars.copy_context().run, _generate_invitation_body, request, tenant
+        )
 
+    try:
+        body, how = await idempotency.execute(_invitation_flight, f"{tenant}:{key}" if key else None, fp, run)
+    except idempotency.IdempotencyConflict:
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": "같은 Idempotency-Key 로 다른 요청 본문이 들어왔습니다"},
+        )
+
+    headers = {}
+    if how == "replayed":
+        headers["Idempotent-Replayed"] = "true"
+    elif how == "coalesced":
+        headers["X-Coalesced"] = "true"
+    if how != "executed":
+        logger.info("generate-invitation deduplicated", extra={"fields": {"how": how}})
+    return JSONResponse(content=body, headers=headers)
+
+
+def _generate_invitation_body(request: GenerateInvitationRequest, tenant: str) -> dict:
+    """청첩장 생성 본체 (스레드에서 실행, 응답 본문 dict 반환)"""
     try:
         # URL에서 이미지 다운로드 후 Base64로 변환
         wedding_image_base64 = download_image_as_base64(request.weddingImageUrl)
         style_image_base64 = download_image_as_base64(request.styleImageUrl)
+        memory.track("wedding_b64", len(wedding_image_base64))
+        memory.track("style_b64", len(style_image_base64))
 
         # 나노바나나로 청첩장 생성 (문구 생성 + 이미지 생성 통합)
+        from nanobanana_api import generate_invitation_with_nanobanana, pipeline_version
+
+        # 전체 결과 캐시 (INVITATION_CACHE_TTL 설정 시, utils/invitation_cache.py)
+        result_key = invitation_cache.cache_key(
+            {
+                "tenant": tenant,
+                **jsonable_encoder(request, exclude={"weddingImageUrl", "styleImageUrl", "forceRegenerate"}),
+            },
+            {"wedding": wedding_image_base64, "style": style_image_base64},
+            pipeline_version(),
+        )
+        if not request.forceRegenerate:
+            cached = invitation_cache.get(result_key)
+            if cached is not None:
+                logger.info("invitation cache hit", extra={"fields": {"pages": len(cached.get("imageUrls", []))}})
+                return {"success": True, "data": cached, "cached": True, "usage": summarize_trace(current_trace())}
+
         result = generate_invitation_with_nanobanana(
             groom_name=request.groom.name,
             bride_name=request.bride.name,
@@ -275,7 +641,9 @@ async def generate_invitation(request: GenerateInvitationRequest):
             wedding_time=request.wedding.time,
             wedding_image_base64=wedding_image_base64,
             tone=request.tone,
-            style_image_base64=style_image_base64
+            style_image_base64=style_image_base64,
+            render_mode=request.renderMode,
+            texts=request.texts,
             # border_design_id=request.frame
         )
 
@@ -283,30 +651,48 @@ async def generate_invitation(request: GenerateInvitationRequest):
         image_urls = [page.get("image_url", "") for page in result.get("pages", [])]
         texts = result.get("texts", {})
 
-        print(f"✅ 생성 완료: {image_urls}")
+        logger.info("생성 완료", extra={"fields": {"pages": len(image_urls)}})
+
+        data = {
+            "imageUrls": image_urls,
+            "texts": texts
+        }
+        # 일부 페이지가 실패했거나 장애 대체 페이지/브라운아웃(낮춘 품질) 결과는 캐시하지 않음
+        is_degraded = bool(result.get("degraded"))
+        brownout_level = admission.brownout().level
+        if len(image_urls) == 3 and all(image_urls) and not is_degraded and not brownout_level:
+            invitation_cache.put(result_key, data)
 
         # 응답: 이미지 URL 리스트 + 텍스트
         return {
             "success": True,
-            "data": {
-                "imageUrls": image_urls,
-                "texts": texts
-            }
+            "data": data,
+            "cached": False,
+            # true 면 일부 페이지/문구가 장애 대체본 (utils/degraded.py), 잠시 후 forceRegenerate 로 다시 받으면 됨
+            "degraded": is_degraded,
+            "degradedPages": [p["page_number"] for p in result.get("pages", []) if p.get("degraded")],
+            # 0 이 아니면 서버 포화로 품질을 낮춰 생성함 (utils/admission.py)
+            "brownoutLevel": brownout_level,
+            # 모델 호출별 토큰/비용 (utils/usage.py 가격표 기준)
+            "usage": summarize_trace(current_trace())
         }
 
     except Exception as e:
         import traceback
-        print(f"❌ Error during generation: {e}")
-        print(traceback.format_exc())
+        logger.exception("generation failed")
         return {
             "success": False,
             "error": str(e),
-            "traceback": traceback.format_exc()
+            "traceback": traceback.format_exc(),
+            "usage": summarize_trace(current_trace())
         }
 
 # --- 유틸리티: URL에서 이미지 다운로드 후 Gemini Part로 변환 ---
-def download_image_as_part(url: str) -> types.Part:
+def download_image_as_part(url: str) -> "types.Part":
     """URL에서 이미지 다운로드 후 Gemini Part로 반환"""
+    import requests
+    from google.genai import types
+
     response = requests.get(url, timeout=30)
     response.raise_for_status()
 
@@ -319,6 +705,42 @@ def download_image_as_part(url: str) -> types.Part:
 
 def download_image_as_base64(url: str) -> str:
     """URL에서 이미지 다운로드 후 base64 문자열로 반환"""
-    response = requests.get(url, timeout=30)
+    with span("image.download", host=urlparse(url).netloc) as s:
+        # 같은 URL 을 동시에 받는 요청은 한 번만 다운로드
+        content, shared = _download_flight.do(url, _fetch_image, url)
+        if shared:
+            s.set(coalesced=True, bytes_out=len(content))
+    return base64.b64encode(content).decode('utf-8')
+
+
+def _fetch_image(url: str) -> bytes:
+    """워커 간 공유 캐시 + 조건부 요청 → 바뀌었을 때만 다시 받음
+
+    같은 S3/CloudFront 키에 사진을 다시 올리면 URL 이 그대로라 URL 만으로는 캐시가 낡습니다.
+    캐시에 ETag/Last-Modified 를 함께 두고 적중 시 If-None-Match/If-Modified-Since 로 확인해
+    304 면 캐시 본문을, 200 이면 새 본문을 씁니다. 검증자가 없는 응답은 캐시하지 않습니다.
+    """
+    import requests
+
+    content = shared_cache.get("image", url)
+    validators = shared_cache.get_json("image", "validators:" + url) if content is not None else None
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=30)
+    if headers and response.status_code == 304:
+        set_attributes(cache="revalidated", http_status=304, bytes_out=len(content))
+        return content
+    set_attributes(cache="miss", http_status=response.status_code, bytes_out=len(response.content))
     response.raise_for_status()
-    return base64.b64encode(response.content).decode('utf-8')
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        shared_cache.set("image", url, response.content)
+        shared_cache.set_json("image", "validators:" + url, {"etag": etag, "last_modified": last_modified})
+    return response.content
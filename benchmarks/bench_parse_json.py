@@ -0,0 +1,159 @@
+"""
+parse_json_response JSON 추출 경로 마이크로 벤치마크
+
+모델이 실제로 내보내는 형태의 깨진 JSON 응답(코드 블록, 앞뒤 설명 문구,
+문자열 안의 중괄호, 여러 객체 연결, 잘린 스트림)을 대상으로
+기존 문자 단위 split_objects 방식과 현재 parse_json_text 를 비교합니다.
+
+실행:
+    python -m benchmarks.bench_parse_json
+    python -m benchmarks.bench_parse_json --repeat 2000 --large-kb 512
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from utils.genai_client import _orjson, parse_json_text
+
+
+# 모델 응답에서 수집한 대표적인 깨진 출력 형태
+SAMPLES: List[Tuple[str, str]] = [
+    (
+        "clean",
+        '{"greetings": ["봄날의 햇살처럼 따뜻한 날, 저희 두 사람이 하나가 됩니다."], '
+        '"invitations": ["귀한 걸음 하시어 축복해 주세요."], "location": "더 클래식 500 2층", '
+        '"closing": ["감사합니다."]}',
+    ),
+    (
+        "code_fence",
+        '```json\n{"greeting": "서로의 \\"{운명}\\"이 된 두 사람", "invitation": "초대합니다", '
+        '"location": "서울 어딘가"}\n```',
+    ),
+    (
+        "prose_wrapped",
+        '요청하신 문구입니다.\n{"greeting": "\'{사랑}\'으로 맺어진 인연", "invitation": "함께해 주세요", '
+        '"location": "강남구 논현동"}\n마음에 드시길 바랍니다 :)',
+    ),
+    (
+        "braces_in_strings",
+        '{"greetings": ["우리의 약속 }{ 영원히", "{첫 만남}부터 지금까지"], '
+        '"invitations": ["}}초대{{"], "location": "1층 }홀{", "closing": ["감사합니다"]}',
+    ),
+    (
+        "concatenated",
+        '{"greeting": "인사말"}\n{"invitation": "초대 문구"}\n{"location": "장소 \\"{안내}\\""}',
+    ),
+    (
+        "prose_and_braces",
+        '다음과 같이 작성했습니다: {"greeting": "마음의 문 }을 열고"}\n'
+        '추가 버전: {"invitation": "\\"{함께}\\" 해 주세요", "location": "3층 }{ 홀"}',
+    ),
+    (
+        "truncated_tail",
+        '{"greeting": "인사말", "invitation": "초대"} {"location": "잘린 응답',
+    ),
+]
+
+
+def _legacy_parse(raw: str) -> Dict[str, Any]:
+    """기존 parse_json_response 의 파싱 경로 (비교용 사본)"""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`\n ")
+        if raw.startswith("json"):
+            raw = raw[4:]
+        raw = raw.strip()
+
+    def split_objects(text: str):
+        objs = []
+        depth = 0
+        buffer = []
+        for ch in text:
+            if ch == '{':
+                depth += 1
+            if depth > 0:
+                buffer.append(ch)
+            if ch == '}':
+                depth -= 1
+                if depth == 0 and buffer:
+                    objs.append(''.join(buffer))
+                    buffer = []
+        return objs
+
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        start = raw.find("{")
+        end = raw.rfind("}") + 1
+        cleaned = raw[start:end] if start != -1 and end != -1 else raw
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError:
+            merged: Dict[str, Any] = {}
+            for obj in split_objects(cleaned):
+                try:
+                    parsed = json.loads(obj)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(parsed, dict):
+                    merged.update(parsed)
+            if not merged:
+                raise
+            return merged
+
+
+def _build_large_sample(size_kb: int) -> str:
+    """스트리밍으로 누적된 대용량 응답 (설명 문구 + 여러 객체 + 문자열 내부 괄호)"""
+    chunk = '참고: {이 줄은 JSON이 아닙니다}\n{"note_%d": "문자열 안의 { 괄호 } 와 \\"인용\\""}\n'
+    parts: List[str] = []
+    total = 0
+    i = 0
+    while total < size_kb * 1024:
+        piece = chunk % i
+        parts.append(piece)
+        total += len(piece.encode("utf-8"))
+        i += 1
+    return "".join(parts)
+
+
+def _time_call(fn: Callable[[str], Any], text: str, repeat: int) -> Tuple[float, str]:
+    """repeat 회 호출 평균 시간(µs)과 결과 요약"""
+    try:
+        result = fn(text)
+        summary = f"{len(result)} keys"
+    except Exception as exc:  # noqa: BLE001
+        return float("nan"), f"error: {type(exc).__name__}"
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat * 1e6, summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="parse_json_response micro-benchmark")
+    parser.add_argument("--repeat", type=int, default=1000, help="샘플당 반복 횟수")
+    parser.add_argument("--large-kb", type=int, default=256, help="대용량 샘플 크기 (KB)")
+    args = parser.parse_args()
+
+    samples = list(SAMPLES)
+    samples.append((f"large_{args.large_kb}kb", _build_large_sample(args.large_kb)))
+
+    print(f"JSON backend: {'orjson' if _orjson else 'json (stdlib)'}")
+    print(f"{'sample':<22}{'legacy µs':>14}{'current µs':>14}  legacy / current")
+    print("-" * 90)
+    for name, text in samples:
+        repeat = args.repeat if len(text) < 10_000 else max(1, args.repeat // 100)
+        legacy_us, legacy_summary = _time_call(_legacy_parse, text, repeat)
+        current_us, current_summary = _time_call(parse_json_text, text, repeat)
+        print(
+            f"{name:<22}{legacy_us:>14.1f}{current_us:>14.1f}  "
+            f"{legacy_summary} / {current_summary}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+청첩장 생성 파이프라인 오프라인 벤치마크
+
+세 가지 생성 경로(nanobanana, generate_invitation_with_gemini, generate_invitation_design)를
+스텁 모델/HTTP/저장소(benchmarks/stubs.py) 위에서 여러 동시성 수준으로 실행하고
+요청당 지연(p50/p99), 단계별 임계 경로 분해, CPU 시간, 최대 RSS, 경계 통과 바이트를 보고합니다.
+네트워크와 API 키 없이 파이프라인 변경의 효과를 비교하기 위한 용도입니다.
+
+실행:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --paths nanobanana --concurrency 1 4 16 --requests 32
+    python -m benchmarks.bench_pipeline --image-error-rate 0.1 --json bench_output.json
+"""
+
+import argparse
+import asyncio
+import base64
+import contextvars
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from benchmarks.stubs import BackendProfile, StubConfig, patched_backends, start_record
+
+# 파이프라인의 구조화 로그(stdout)가 결과 표와 섞이지 않도록 경고 이상만 남김
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_DEBUG_SAMPLE_RATE", "0")
+# 반복 실행 간 공유 캐시 적중으로 스텁 다운로드 지연이 빠지지 않도록 끔
+os.environ.setdefault("SHARED_CACHE_PATH", "off")
+
+STAGES = ["http", "model_text", "model_image", "storage"]
+
+REQUEST = {
+    "groom_name": "김철수",
+    "bride_name": "이영희",
+    "groom_father": "김아버지",
+    "groom_mother": "김어머니",
+    "bride_father": "이아버지",
+    "bride_mother": "이어머니",
+    "venue": "더 클래식 500",
+    "venue_address": "서울특별시 강남구 논현동 123-45",
+    "wedding_date": "2025년 5월 20일 토요일",
+    "wedding_time": "오후 2시",
+    "tone": "romantic",
+}
+
+
+class _ContextThreadPool(ThreadPoolExecutor):
+    """run_in_executor 로 넘어간 작업에도 요청 기록기(contextvars)를 전달"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        return super().submit(ctx.run, fn, *args, **kwargs)
+
+
+def _run_nanobanana(png_b64: str) -> Any:
+    import nanobanana_api
+    from app.main import download_image_as_base64
+
+    # /api/generate-invitation 과 동일하게 두 이미지를 URL에서 받아서 시작
+    wedding_b64 = download_image_as_base64("https://stub/wedding.png")
+    style_b64 = download_image_as_base64("https://stub/style.png")
+    return nanobanana_api.generate_invitation_with_nanobanana(
+        wedding_image_base64=wedding_b64,
+        style_image_base64=style_b64,
+        venue_latitude="37.5",
+        venue_longitude="127.0",
+        **REQUEST,
+    )
+
+
+def _run_gemini(png_b64: str) -> Any:
+    import gemini_invitation_api
+
+    return gemini_invitation_api.generate_invitation_with_gemini(
+        model_name="gemini-3-pro-image-preview",
+        groom_name=REQUEST["groom_name"],
+        bride_name=REQUEST["bride_name"],
+        venue=REQUEST["venue"],
+        wedding_date=REQUEST["wedding_date"],
+        wedding_time=REQUEST["wedding_time"],
+        wedding_image_base64=png_b64,
+        style_image_base64=png_b64,
+        tone=REQUEST["tone"],
+    )
+
+
+def _run_design(png_b64: str) -> Any:
+    import imagen_design_api
+
+    async def run() -> Any:
+        asyncio.get_running_loop().set_default_executor(_ContextThreadPool(max_workers=2))
+        return await imagen_design_api.generate_invitation_design(
+            style_image_base64=png_b64,
+            wedding_image_base64=png_b64,
+            texts={"greeting": "인사말", "invitation": "초대", "location": "장소", "closing": "감사"},
+            venue_info={"name": REQUEST["venue"], "address": REQUEST["venue_address"]},
+        )
+
+    return asyncio.run(run())
+
+
+PATHS: Dict[str, Callable[[str], Any]] = {
+    "nanobanana": _run_nanobanana,
+    "gemini": _run_gemini,
+    "design": _run_design,
+}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _peak_rss_mb() -> float:
+    # Linux ru_maxrss 는 KB 단위 (프로세스 시작 이후 최대값)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _one_request(runner: Callable[[str], Any], png_b64: str, seed: int) -> Dict[str, Any]:
+    record = start_record(seed)
+    start = time.perf_counter()
+    error = None
+    try:
+        runner(png_b64)
+    except Exception as exc:  # noqa: BLE001
+        error = type(exc).__name__
+    wall = time.perf_counter() - start
+    return {
+        "wall": wall,
+        "stages": dict(record.stages),
+        "bytes": dict(record.bytes),
+        "injected_errors": record.injected_errors,
+        "error": error,
+    }
+
+
+def run_level(path: str, concurrency: int, num_requests: int, png_b64: str, seed: int) -> Dict[str, Any]:
+    """동시성 한 단계 실행 결과 요약"""
+    runner = PATHS[path]
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, _one_request, runner, png_b64, seed * 100_000 + i)
+            for i in range(num_requests)
+        ]
+        results = [f.result() for f in futures]
+
+    elapsed = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    walls = [r["wall"] for r in results]
+
+    stage_means = {s: statistics.fmean(r["stages"].get(s, 0.0) for r in results) for s in STAGES}
+    stage_means["local"] = max(0.0, statistics.fmean(walls) - sum(stage_means.values()))
+
+    byte_keys = sorted({k for r in results for k in r["bytes"]})
+    bytes_per_request = {k: statistics.fmean(r["bytes"].get(k, 0) for r in results) for k in byte_keys}
+
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "throughput_rps": num_requests / elapsed if elapsed else float("nan"),
+        "wall_p50": _percentile(walls, 50),
+        "wall_p99": _percentile(walls, 99),
+        "wall_max": max(walls),
+        "critical_path_mean": stage_means,
+        "cpu_seconds_per_request": cpu / num_requests,
+        "peak_rss_mb": _peak_rss_mb(),
+        "bytes_per_request": bytes_per_request,
+        "injected_errors": sum(r["injected_errors"] for r in results),
+        "failed_requests": errors,
+    }
+
+
+def _print_level(result: Dict[str, Any]) -> None:
+    stages = result["critical_path_mean"]
+    moved = sum(result["bytes_per_request"].values()) / 1024 / 1024
+    print(
+        f"{result['path']:<11}{result['concurrency']:>4}"
+        f"{result['throughput_rps']:>8.2f}"
+        f"{result['wall_p50']:>9.3f}{result['wall_p99']:>9.3f}"
+        f"  {' '.join(f'{stages[s]:.3f}' for s in STAGES + ['local'])}"
+        f"{result['cpu_seconds_per_request']:>9.3f}"
+        f"{result['peak_rss_mb']:>9.0f}"
+        f"{moved:>9.1f}"
+        f"  {result['injected_errors']}/{sum(result['failed_requests'].values())}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline invitation pipeline benchmark")
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=16, help="동시성 단계별 요청 수")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=0.02, help="스텁 지연 배율 (1.0 = 실제 지연)")
+    parser.add_argument("--text-latency", type=float, default=1.5)
+    parser.add_argument("--image-latency", type=float, default=8.0)
+    parser.add_argument("--http-latency", type=float, default=0.2)
+    parser.add_argument("--storage-latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.3, help="로그정규 지연 시그마")
+    parser.add_argument("--text-error-rate", type=float, default=0.0)
+    parser.add_argument("--image-error-rate", type=float, default=0.0)
+    parser.add_argument("--http-error-rate", type=float, default=0.0)
+    parser.add_argument("--storage-error-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[768, 1024], metavar=("W", "H"))
+    parser.add_argument("--json", type=str, default=None, help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        text_model=BackendProfile(args.text_latency, args.jitter, args.text_error_rate),
+        image_model=BackendProfile(args.image_latency, args.jitter, args.image_error_rate),
+        http=BackendProfile(args.http_latency, args.jitter, args.http_error_rate),
+        storage=BackendProfile(args.storage_latency, args.jitter, args.storage_error_rate),
+        time_scale=args.time_scale,
+        image_width=args.image_size[0],
+        image_height=args.image_size[1],
+    )
+
+    results = []
+    # 파이프라인에 남은 print 출력은 벤치마크 출력과 섞이지 않도록 stderr로 보냄
+    stdout = sys.stdout
+    with patched_backends(config) as backends:
+        png_b64 = base64.b64encode(backends.png).decode("utf-8")
+        print(f"stub image: {len(backends.png) / 1024:.0f} KB PNG, time scale {args.time_scale}")
+        print(f"{'path':<11}{'conc':>4}{'rps':>8}{'p50 s':>9}{'p99 s':>9}"
+              f"  {'/'.join(STAGES + ['local'])} (mean s){'cpu s':>9}{'rss MB':>9}{'MB moved':>9}  inj/failed")
+        for path in args.paths:
+            for concurrency in args.concurrency:
+                sys.stdout = sys.stderr
+                try:
+                    result = run_level(path, concurrency, args.requests, png_b64, args.seed)
+                finally:
+                    sys.stdout = stdout
+                _print_level(result)
+                results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,553 @@
+"""
+로컬 Gemini 호환 대역(stand-in) 서버
+
+google-genai SDK가 이 프로젝트에서 사용하는 REST API의 일부를 흉내냅니다.
+    POST /{version}/models/{model}:generateContent
+    POST /{version}/models/{model}:streamGenerateContent?alt=sse
+    POST /{version}/models/{model}:predict          (Imagen generate_images)
+    POST /upload/{version}/files, GET/DELETE /{version}/files/{id}          (Files API, STYLE_ASSETS=files)
+    POST /{version}/cachedContents, GET/PATCH/DELETE /{version}/cachedContents/{id}   (CONTEXT_CACHE=on)
+
+Files/캐시 항목은 메모리에만 보관하며 오류 주입과 지연 대상이 아닙니다.
+
+합성 JSON 문구와 PNG 이미지를 반환하며, 지연 시간과 429/500/503 오류율,
+안전 필터 차단 비율을 설정할 수 있습니다. 실행 중에도 POST /__control 로 설정을 바꿀 수 있어
+부하/장애 시나리오를 스크립트로 재현할 수 있습니다.
+
+실행:
+    python -m benchmarks.gemini_standin --port 8787 --rate-429 0.05 --image-latency 3
+
+서버 연결 (utils/genai_client._build_client 가 GEMINI_BASE_URL 을 사용):
+    GEMINI_BASE_URL=http://127.0.0.1:8787 GEMINI_API_KEY=standin uvicorn app.main:app
+
+실행 중 설정 변경:
+    curl -X POST localhost:8787/__control -d '{"rate_503": 0.3, "image_latency": 10}'
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.stubs import SAMPLE_TEXTS, make_png
+
+_PATH_RE = re.compile(r"^/(?P<version>[^/]+)/models/(?P<model>[^:/]+):(?P<method>\w+)")
+_UPLOAD_RE = re.compile(r"^/upload/(?P<version>[^/?]+)/files(?:\?upload_id=(?P<upload_id>\w+))?$")
+_RESOURCE_RE = re.compile(r"^/(?P<version>[^/]+)/(?P<kind>files|cachedContents)(?:/(?P<id>[\w-]+))?(?:\?.*)?$")
+
+# 업로드 파일 보관 기간 (실제 Files API 와 같은 48시간)
+_FILE_LIFETIME = 48 * 3600
+# 입력 이미지 1장(fileData)의 대략적인 토큰 수
+_IMAGE_TOKENS = 258
+
+_ERROR_STATUS = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+@dataclass
+class StandinConfig:
+    """대역 서버 동작 설정 (초 단위 지연, 0~1 확률)"""
+
+    text_latency: float = 1.5
+    image_latency: float = 8.0
+    jitter: float = 0.3
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_503: float = 0.0
+    safety_rate: float = 0.0
+    stream_chunk_chars: int = 32
+    image_width: int = 768
+    image_height: int = 1024
+    seed: int = 0
+
+
+class StandinState:
+    """서버 전역 상태 (설정, 난수, 통계). 요청 스레드 간 공유"""
+
+    def __init__(self, config: StandinConfig):
+        self._lock = threading.Lock()
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.png_b64 = base64.b64encode(make_png(config.image_width, config.image_height)).decode("ascii")
+        self.stats: Dict[str, int] = {}
+        # Files API / 컨텍스트 캐시 항목 (이름 → 리소스 JSON)
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.resources: Dict[str, Dict[str, Any]] = {}
+
+    def update(self, values: Dict[str, Any]) -> StandinConfig:
+        with self._lock:
+            size_changed = False
+            for key, value in values.items():
+                if hasattr(self.config, key):
+                    size_changed |= key in ("image_width", "image_height")
+                    setattr(self.config, key, type(getattr(self.config, key))(value))
+            if size_changed:
+                png = make_png(self.config.image_width, self.config.image_height)
+                self.png_b64 = base64.b64encode(png).decode("ascii")
+            return self.config
+
+    def draw(self) -> Tuple[float, float]:
+        """(지연 배율, 운명 난수) 한 쌍을 뽑음"""
+        with self._lock:
+            jitter = self.rng.lognormvariate(0.0, self.config.jitter) if self.config.jitter else 1.0
+            return jitter, self.rng.random()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def begin_upload(self, meta: Dict[str, Any]) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {"meta": meta, "data": b""}
+        return upload_id
+
+    def write_upload(self, upload_id: str, chunk: bytes, finalize: bool) -> Optional[Dict[str, Any]]:
+        """업로드 조각 추가 (없는 업로드면 None, finalize 면 항목을 꺼내 반환)"""
+        with self._lock:
+            pending = self.uploads.get(upload_id)
+            if pending is None:
+                return None
+            pending["data"] += chunk
+            if finalize:
+                del self.uploads[upload_id]
+            return pending
+
+    def put(self, resource: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.resources[resource["name"]] = resource
+        return resource
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            resource = self.resources.get(name)
+            expires = resource and (resource.get("expirationTime") or resource.get("expireTime"))
+            if resource and _parse_time(expires) < time.time():
+                del self.resources[name]
+                return None
+            return resource
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            return self.resources.pop(name, None) is not None
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _ttl_seconds(body: Dict[str, Any], default: float = 3600.0) -> float:
+    if body.get("expireTime"):
+        return _parse_time(body["expireTime"]) - time.time()
+    ttl = body.get("ttl")
+    return float(str(ttl).rstrip("s")) if ttl else default
+
+
+def _wants_image(body: Dict[str, Any]) -> bool:
+    generation_config = body.get("generationConfig") or {}
+    modalities = generation_config.get("responseModalities") or []
+    return any(str(m).upper() == "IMAGE" for m in modalities)
+
+
+def _wants_json(body: Dict[str, Any]) -> bool:
+    generation_config = body.get("generationConfig") or {}
+    return generation_config.get("responseMimeType") == "application/json"
+
+
+def _prompt_chars(body: Dict[str, Any]) -> int:
+    total = 0
+    contents = list(body.get("contents") or [])
+    if body.get("systemInstruction"):
+        contents.append(body["systemInstruction"])
+    for content in contents:
+        for part in content.get("parts") or []:
+            total += len(part.get("text") or "")
+            total += len((part.get("inlineData") or {}).get("data") or "") * 3 // 4
+            if part.get("fileData"):
+                total += _IMAGE_TOKENS * 4
+    return total
+
+
+def _usage(body: Dict[str, Any], candidate_tokens: int, cached_tokens: int = 0) -> Dict[str, int]:
+    prompt_tokens = max(1, _prompt_chars(body) // 4) + cached_tokens
+    usage = {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": candidate_tokens,
+        "totalTokenCount": prompt_tokens + candidate_tokens,
+    }
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens
+    return usage
+
+
+def _candidate(parts: List[Dict[str, Any]], finish_reason: Optional[str] = "STOP") -> Dict[str, Any]:
+    candidate: Dict[str, Any] = {"content": {"role": "model", "parts": parts}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return candidate
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """요청 하나를 처리하는 핸들러 (ThreadingHTTPServer 가 스레드마다 생성)"""
+
+    server_version = "GeminiStandin/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> StandinState:
+        return self.server.state  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        # 부하 테스트 중 stderr 로그가 병목이 되지 않도록 기본 접근 로그는 끔
+        return
+
+    # --- 응답 헬퍼 ---
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, code: int) -> None:
+        self.state.count(f"error_{code}")
+        self._send_json(code, {
+            "error": {
+                "code": code,
+                "message": f"Stand-in injected {_ERROR_STATUS[code]} error.",
+                "status": _ERROR_STATUS[code],
+            }
+        })
+
+    def _send_not_found(self, message: str) -> None:
+        self._send_json(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+
+    def _read_raw(self) -> bytes:
+        # keep-alive 연결에서 다음 요청이 깨지지 않도록 응답 전에 본문을 항상 끝까지 읽음
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_body(self) -> Dict[str, Any]:
+        return json.loads(self._read_raw() or b"{}")
+
+    # --- 라우팅 ---
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._read_raw()
+        if self.path.startswith("/__control"):
+            self._send_json(200, {"config": asdict(self.state.config), "stats": self.state.stats})
+            return
+        match = _RESOURCE_RE.match(self.path)
+        resource = self.state.get(f"{match.group('kind')}/{match.group('id')}") if match and match.group("id") else None
+        if resource is None:
+            self._send_not_found(self.path)
+            return
+        self._send_json(200, resource)
+
+    def do_PATCH(self) -> None:  # noqa: N802
+        body = self._read_body()
+        match = _RESOURCE_RE.match(self.path)
+        resource = self.state.get(f"cachedContents/{match.group('id')}") \
+            if match and match.group("kind") == "cachedContents" and match.group("id") else None
+        if resource is None:
+            self._send_not_found(self.path)
+            return
+        now = time.time()
+        resource.update(updateTime=_format_time(now), expireTime=_format_time(now + _ttl_seconds(body)))
+        self._send_json(200, resource)
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._read_raw()
+        match = _RESOURCE_RE.match(self.path)
+        if not (match and match.group("id") and self.state.delete(f"{match.group('kind')}/{match.group('id')}")):
+            self._send_not_found(self.path)
+            return
+        self._send_json(200, {})
+
+    def do_POST(self) -> None:  # noqa: N802
+        if self.path.startswith("/__control"):
+            config = self.state.update(self._read_body())
+            self._send_json(200, {"config": asdict(config)})
+            return
+
+        upload = _UPLOAD_RE.match(self.path)
+        if upload:
+            self._handle_upload(upload.group("version"), upload.group("upload_id"))
+            return
+        resource = _RESOURCE_RE.match(self.path)
+        if resource and resource.group("kind") == "cachedContents" and not resource.group("id"):
+            self._handle_cache_create(self._read_body())
+            return
+
+        match = _PATH_RE.match(self.path)
+        if not match:
+            self._read_raw()
+            self._send_not_found(self.path)
+            return
+
+        body = self._read_body()
+        method = match.group("method")
+        model = match.group("model")
+        self.state.count(method)
+
+        # 만료/삭제된 파일·캐시 참조는 실제 API 처럼 403 (호출 측 재업로드/재생성 경로 확인용)
+        missing = self._missing_reference(body)
+        if missing:
+            self._send_json(403, {"error": {"code": 403, "message": f"{missing} does not exist or permission denied",
+                                            "status": "PERMISSION_DENIED"}})
+            return
+
+        is_image = method == "predict" or _wants_image(body)
+        config = self.state.config
+        jitter, fate = self.state.draw()
+        latency = (config.image_latency if is_image else config.text_latency) * jitter
+
+        # 오류는 처리 시간 일부가 지난 뒤 반환 (실제 서비스의 빠른 실패와 유사)
+        threshold = 0.0
+        for code, rate in ((429, config.rate_429), (500, config.rate_500), (503, config.rate_503)):
+            threshold += rate
+            if fate < threshold:
+                time.sleep(latency * 0.1)
+                self._send_error(code)
+                return
+        blocked = fate < threshold + config.safety_rate
+
+        if method == "predict":
+            time.sleep(latency)
+            self._handle_predict(body, blocked)
+        elif method == "streamGenerateContent":
+            self._handle_stream(body, model, is_image, blocked, latency)
+        elif method == "generateContent":
+            time.sleep(latency)
+            self._send_json(200, self._build_response(body, model, is_image, blocked))
+        else:
+            self._send_not_found(method)
+
+    # --- Files API / 컨텍스트 캐시 ---
+
+    def _handle_upload(self, version: str, upload_id: Optional[str]) -> None:
+        """resumable 업로드: start 요청에 업로드 URL 을 주고, upload(, finalize) 요청으로 바이트를 받음"""
+        command = (self.headers.get("X-Goog-Upload-Command") or "").lower()
+        if upload_id is None:
+            upload_id = self.state.begin_upload(self._read_body().get("file") or {})
+            host = self.headers.get("Host") or f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+            data = b"{}"
+            self.send_response(200)
+            self.send_header("X-Goog-Upload-URL", f"http://{host}/upload/{version}/files?upload_id={upload_id}")
+            self.send_header("X-Goog-Upload-Status", "active")
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        pending = self.state.write_upload(upload_id, self._read_raw(), "finalize" in command)
+        if pending is None:
+            self._send_not_found(upload_id)
+            return
+
+        status = "active"
+        payload: Dict[str, Any] = {}
+        if "finalize" in command:
+            self.state.count("file_upload")
+            now = time.time()
+            name = f"files/{uuid.uuid4().hex[:12]}"
+            host = self.headers.get("Host") or "127.0.0.1"
+            meta = pending["meta"]
+            payload = {"file": self.state.put({
+                "name": name,
+                "displayName": meta.get("displayName", ""),
+                "mimeType": meta.get("mimeType") or "application/octet-stream",
+                "sizeBytes": str(len(pending["data"])),
+                "createTime": _format_time(now),
+                "updateTime": _format_time(now),
+                "expirationTime": _format_time(now + _FILE_LIFETIME),
+                "sha256Hash": base64.b64encode(hashlib.sha256(pending["data"]).digest()).decode("ascii"),
+                "uri": f"http://{host}/{version}/{name}",
+                "state": "ACTIVE",
+                "source": "UPLOADED",
+            })}
+            status = "final"
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("X-Goog-Upload-Status", status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle_cache_create(self, body: Dict[str, Any]) -> None:
+        self.state.count("cache_create")
+        now = time.time()
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        self._send_json(200, self.state.put({
+            "name": name,
+            "model": body.get("model", ""),
+            "displayName": body.get("displayName", ""),
+            "createTime": _format_time(now),
+            "updateTime": _format_time(now),
+            "expireTime": _format_time(now + _ttl_seconds(body)),
+            "usageMetadata": {"totalTokenCount": max(1, _prompt_chars(body) // 4)},
+        }))
+
+    def _missing_reference(self, body: Dict[str, Any]) -> Optional[str]:
+        if body.get("cachedContent") and self.state.get(body["cachedContent"]) is None:
+            return f"CachedContent {body['cachedContent']}"
+        for content in body.get("contents") or []:
+            for part in content.get("parts") or []:
+                uri = (part.get("fileData") or {}).get("fileUri") or ""
+                name = uri[uri.find("files/"):] if "files/" in uri else ""
+                if name and self.state.get(name) is None:
+                    return f"File {name}"
+        return None
+
+    def _cached_tokens(self, body: Dict[str, Any]) -> int:
+        cache = self.state.get(body["cachedContent"]) if body.get("cachedContent") else None
+        return int(cache["usageMetadata"]["totalTokenCount"]) if cache else 0
+
+    # --- 응답 생성 ---
+
+    def _build_response(self, body: Dict[str, Any], model: str, is_image: bool, blocked: bool) -> Dict[str, Any]:
+        cached = self._cached_tokens(body)
+        if blocked:
+            self.state.count("safety_block")
+            if is_image:
+                return {
+                    "candidates": [_candidate([], "IMAGE_SAFETY")],
+                    "usageMetadata": _usage(body, 0, cached),
+                    "modelVersion": model,
+                }
+            return {"promptFeedback": {"blockReason": "SAFETY"}, "usageMetadata": _usage(body, 0, cached), "modelVersion": model}
+
+        if is_image:
+            parts = [
+                {"text": "Here is the generated invitation."},
+                {"inlineData": {"mimeType": "image/png", "data": self.state.png_b64}},
+            ]
+            return {"candidates": [_candidate(parts)], "usageMetadata": _usage(body, 1290, cached), "modelVersion": model}
+
+        text = json.dumps(SAMPLE_TEXTS, ensure_ascii=False) if _wants_json(body) else "청첩장 문구 예시입니다."
+        return {
+            "candidates": [_candidate([{"text": text}])],
+            "usageMetadata": _usage(body, len(text) // 2, cached),
+            "modelVersion": model,
+        }
+
+    def _handle_stream(self, body: Dict[str, Any], model: str, is_image: bool, blocked: bool,
+                       latency: float) -> None:
+        response = self._build_response(body, model, is_image, blocked)
+        events: List[Dict[str, Any]] = []
+
+        candidates = response.get("candidates") or []
+        parts = candidates[0]["content"]["parts"] if candidates else []
+        if not is_image and parts:
+            # 텍스트는 작은 조각으로 나눠서 스트리밍
+            text = parts[0]["text"]
+            step = max(1, self.state.config.stream_chunk_chars)
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            for index, piece in enumerate(pieces):
+                last = index == len(pieces) - 1
+                event: Dict[str, Any] = {"candidates": [_candidate([{"text": piece}], "STOP" if last else None)],
+                                         "modelVersion": model}
+                if last:
+                    event["usageMetadata"] = response["usageMetadata"]
+                events.append(event)
+        elif parts:
+            # 이미지: 텍스트 파트 먼저, 이미지 파트는 마지막에
+            events.append({"candidates": [_candidate(parts[:1], None)], "modelVersion": model})
+            events.append({"candidates": [_candidate(parts[1:])], "usageMetadata": response["usageMetadata"],
+                           "modelVersion": model})
+        else:
+            events.append(response)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        first_delay = latency * (0.8 if is_image else 0.2)
+        rest_delay = (latency - first_delay) / max(1, len(events) - 1)
+        for index, event in enumerate(events):
+            time.sleep(first_delay if index == 0 else rest_delay)
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _handle_predict(self, body: Dict[str, Any], blocked: bool) -> None:
+        parameters = body.get("parameters") or {}
+        count = int(parameters.get("sampleCount") or 1)
+        if blocked:
+            self.state.count("safety_block")
+            predictions = [{"raiFilteredReason": "Stand-in injected safety filter."}]
+        else:
+            predictions = [{"bytesBase64Encoded": self.state.png_b64, "mimeType": "image/png"} for _ in range(count)]
+        self._send_json(200, {"predictions": predictions})
+
+
+def serve(config: StandinConfig, host: str = "127.0.0.1", port: int = 8787) -> ThreadingHTTPServer:
+    """서버 객체를 생성합니다 (serve_forever 는 호출 측에서 실행)"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(config)  # type: ignore[attr-defined]
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Gemini-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--text-latency", type=float, default=1.5)
+    parser.add_argument("--image-latency", type=float, default=8.0)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--rate-503", type=float, default=0.0)
+    parser.add_argument("--safety-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[768, 1024], metavar=("W", "H"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        text_latency=args.text_latency,
+        image_latency=args.image_latency,
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        rate_503=args.rate_503,
+        safety_rate=args.safety_rate,
+        image_width=args.image_size[0],
+        image_height=args.image_size[1],
+        seed=args.seed,
+    )
+    server = serve(config, args.host, args.port)
+    print(f"🧪 Gemini stand-in listening on http://{args.host}:{args.port}")
+    print(f"   GEMINI_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
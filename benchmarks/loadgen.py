@@ -0,0 +1,366 @@
+"""
+Model API 부하 생성기
+
+/api/generate-text, /api/generate-invitation, /api/generate-invitation-test 에 부하를 걸고
+엔드포인트별 처리량, p50/p95/p99/max 지연, 오류 분류, 첫 페이지(첫 바이트/첫 SSE 이벤트)까지의
+시간을 보고합니다. 결과는 --json 으로 저장해 실행 간 비교할 수 있습니다.
+
+도착 모델:
+    open   : 목표 도착률(req/s)에 따라 포아송 도착. 서버가 느려져도 요청을 계속 보냄
+    closed : 가상 사용자 N명이 응답을 받은 뒤 think time 후 다음 요청
+
+부하 단계(--stages):
+    "1:30,5:60,10:60" → 1(req/s 또는 사용자 수)로 30초, 5로 60초, 10으로 60초
+
+기록된 요청(--payloads, JSONL 한 줄에 한 요청):
+    {"endpoint": "/api/generate-text", "json": {...}}
+    {"endpoint": "/api/generate-invitation", "json": {...}}
+    {"endpoint": "/api/generate-invitation-test", "form": {...}, "files": {"wedding_image": "path.png"}}
+
+실행:
+    python -m benchmarks.loadgen --base-url http://localhost:8102 --mode open --stages 0.5:60,2:120
+    python -m benchmarks.loadgen --mode closed --stages 4:60 --endpoints /api/generate-text --json load.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+DEFAULT_ENDPOINTS = ["/api/generate-text", "/api/generate-invitation", "/api/generate-invitation-test"]
+
+_TEXT_REQUEST = {
+    "tone": "romantic",
+    "groom_name": "김철수",
+    "bride_name": "이영희",
+    "groom_father": "김아버지",
+    "groom_mother": "김어머니",
+    "bride_father": "이아버지",
+    "bride_mother": "이어머니",
+    "venue": "더 클래식 500",
+    "wedding_date": "2025년 5월 20일 토요일",
+    "wedding_time": "오후 2시",
+    "address": "서울특별시 강남구 논현동 123-45",
+}
+
+_INVITATION_REQUEST = {
+    "groom": {"name": "김철수", "fatherName": "김아버지", "motherName": "김어머니"},
+    "bride": {"name": "이영희", "fatherName": "이아버지", "motherName": "이어머니"},
+    "wedding": {"hallName": "더 클래식 500", "address": "서울특별시 강남구", "date": "2026-03-21", "time": "14:00"},
+    "weddingImageUrl": "https://example.com/wedding.png",
+    "styleImageUrl": "https://example.com/style.png",
+    "tone": "WARM",
+}
+
+# 1x1 PNG (기록된 파일이 없을 때 multipart 업로드용)
+_TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+@dataclass
+class Payload:
+    """엔드포인트 요청 1건의 본문"""
+
+    endpoint: str
+    json: Optional[Dict[str, Any]] = None
+    form: Optional[Dict[str, Any]] = None
+    files: Dict[str, Tuple[str, bytes, str]] = field(default_factory=dict)
+
+
+@dataclass
+class Sample:
+    """요청 1건의 측정 결과"""
+
+    endpoint: str
+    started: float
+    latency: float
+    first_page: Optional[float]
+    outcome: str            # "ok" 또는 오류 분류 (http_503, app_error, ConnectionError ...)
+
+
+def default_payloads(endpoints: List[str]) -> List[Payload]:
+    payloads = []
+    for endpoint in endpoints:
+        if endpoint == "/api/generate-text":
+            payloads.append(Payload(endpoint, json=dict(_TEXT_REQUEST)))
+            payloads.append(Payload(endpoint, json=dict(_TEXT_REQUEST, stream=True)))
+        elif endpoint == "/api/generate-invitation":
+            payloads.append(Payload(endpoint, json=_INVITATION_REQUEST))
+        elif endpoint == "/api/generate-invitation-test":
+            form = {k: v for k, v in _TEXT_REQUEST.items() if k in (
+                "tone", "groom_name", "bride_name", "venue", "wedding_date", "wedding_time", "address")}
+            form["model_type"] = "nanobanana"
+            files = {
+                "wedding_image": ("wedding.png", _TINY_PNG, "image/png"),
+                "style_image": ("style.png", _TINY_PNG, "image/png"),
+            }
+            payloads.append(Payload(endpoint, form=form, files=files))
+    return payloads
+
+
+def load_payloads(path: str, endpoints: List[str]) -> List[Payload]:
+    """기록된 요청 JSONL 을 읽어 대상 엔드포인트만 남깁니다."""
+    payloads = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record["endpoint"] not in endpoints:
+                continue
+            files = {}
+            for name, file_path in (record.get("files") or {}).items():
+                with open(file_path, "rb") as fh:
+                    files[name] = (file_path.rsplit("/", 1)[-1], fh.read(), "image/png")
+            payloads.append(Payload(record["endpoint"], json=record.get("json"),
+                                    form=record.get("form"), files=files))
+    if not payloads:
+        raise ValueError(f"{path}에 대상 엔드포인트 요청이 없습니다: {endpoints}")
+    return payloads
+
+
+def parse_stages(spec: str) -> List[Tuple[float, float]]:
+    """'1:30,5:60' → [(1.0, 30.0), (5.0, 60.0)]"""
+    stages = []
+    for item in spec.split(","):
+        level, duration = item.split(":")
+        stages.append((float(level), float(duration)))
+    return stages
+
+
+class LoadGenerator:
+    """열린/닫힌 루프 부하 생성기"""
+
+    def __init__(self, base_url: str, payloads: List[Payload], timeout: float,
+                 seed: int, max_in_flight: int):
+        self.base_url = base_url.rstrip("/")
+        self.payloads = payloads
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.max_in_flight = max_in_flight
+        self.samples: List[Sample] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dropped = 0
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _pick(self) -> Payload:
+        with self._lock:
+            return self.rng.choice(self.payloads)
+
+    def send(self, payload: Payload) -> Sample:
+        """요청 1건 전송. 응답을 스트리밍으로 읽어 첫 페이지 시간을 잽니다."""
+        url = self.base_url + payload.endpoint
+        started = time.time()
+        start = time.perf_counter()
+        first_page = None
+        outcome = "ok"
+        try:
+            with self._session().post(
+                url,
+                json=payload.json,
+                data=payload.form,
+                files=payload.files or None,
+                timeout=self.timeout,
+                stream=True,
+            ) as response:
+                is_sse = response.headers.get("Content-Type", "").startswith("text/event-stream")
+                chunks = []
+                for chunk in response.iter_content(chunk_size=None):
+                    if first_page is None and (not is_sse or b"event:" in chunk):
+                        first_page = time.perf_counter() - start
+                    chunks.append(chunk)
+                body = b"".join(chunks)
+
+                if response.status_code >= 400:
+                    outcome = f"http_{response.status_code}"
+                elif is_sse:
+                    if b"event: error" in body or b"event: done" not in body:
+                        outcome = "app_error"
+                else:
+                    try:
+                        if not json.loads(body).get("success", True):
+                            outcome = "app_error"
+                    except ValueError:
+                        outcome = "invalid_json"
+        except requests.RequestException as exc:
+            outcome = type(exc).__name__
+
+        sample = Sample(payload.endpoint, started, time.perf_counter() - start, first_page, outcome)
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def run_open(self, stages: List[Tuple[float, float]]) -> None:
+        """포아송 도착 (단계별 목표 req/s)"""
+        in_flight = threading.Semaphore(self.max_in_flight)
+
+        def fire(payload: Payload) -> None:
+            try:
+                self.send(payload)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for rate, duration in stages:
+                print(f"▶ open loop: {rate} req/s for {duration:.0f}s", file=sys.stderr)
+                stage_end = time.perf_counter() + duration
+                next_at = time.perf_counter()
+                while rate > 0:
+                    with self._lock:
+                        next_at += self.rng.expovariate(rate)
+                    if next_at >= stage_end:
+                        break
+                    time.sleep(max(0.0, next_at - time.perf_counter()))
+                    if not in_flight.acquire(blocking=False):
+                        # 동시 요청 상한 초과: 열린 루프를 유지하기 위해 기다리지 않고 드롭으로 기록
+                        with self._lock:
+                            self._dropped += 1
+                        continue
+                    pool.submit(fire, self._pick())
+                time.sleep(max(0.0, stage_end - time.perf_counter()))
+
+    def run_closed(self, stages: List[Tuple[float, float]], think_time: float) -> None:
+        """가상 사용자 N명 (단계별 사용자 수)"""
+        for users, duration in stages:
+            users = int(users)
+            print(f"▶ closed loop: {users} users for {duration:.0f}s", file=sys.stderr)
+            stage_end = time.perf_counter() + duration
+
+            def user_loop() -> None:
+                while time.perf_counter() < stage_end:
+                    self.send(self._pick())
+                    if think_time:
+                        time.sleep(think_time)
+
+            threads = [threading.Thread(target=user_loop, daemon=True) for _ in range(users)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    """엔드포인트별 지표 요약"""
+    by_endpoint: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    summary = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = [s.latency for s in items]
+        ok_latencies = [s.latency for s in items if s.outcome == "ok"]
+        first_pages = [s.first_page for s in items if s.outcome == "ok" and s.first_page is not None]
+        errors: Dict[str, int] = defaultdict(int)
+        for s in items:
+            if s.outcome != "ok":
+                errors[s.outcome] += 1
+        summary[endpoint] = {
+            "requests": len(items),
+            "ok": len(ok_latencies),
+            "throughput_rps": len(items) / elapsed if elapsed else None,
+            "goodput_rps": len(ok_latencies) / elapsed if elapsed else None,
+            "latency": {
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+                "max": max(latencies) if latencies else None,
+                "mean": statistics.fmean(latencies) if latencies else None,
+            },
+            "time_to_first_page": {
+                "p50": _percentile(first_pages, 50),
+                "p95": _percentile(first_pages, 95),
+                "p99": _percentile(first_pages, 99),
+            },
+            "errors": dict(errors),
+        }
+    return summary
+
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Model API load generator")
+    parser.add_argument("--base-url", default="http://localhost:8102")
+    parser.add_argument("--endpoints", nargs="+", default=DEFAULT_ENDPOINTS)
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--stages", default="0.5:60", help="단계 목록 'level:seconds,...' (open=req/s, closed=users)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="closed 모드 요청 간 대기 (초)")
+    parser.add_argument("--payloads", default=None, help="기록된 요청 JSONL 경로")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open 모드 동시 요청 상한")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads, args.endpoints) if args.payloads else default_payloads(args.endpoints)
+    stages = parse_stages(args.stages)
+    generator = LoadGenerator(args.base_url, payloads, args.timeout, args.seed, args.max_in_flight)
+
+    start = time.perf_counter()
+    if args.mode == "open":
+        generator.run_open(stages)
+    else:
+        generator.run_closed(stages, args.think_time)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(generator.samples, elapsed)
+    print(f"\n{'endpoint':<32}{'req':>6}{'ok':>6}{'rps':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'ttfp50':>8}  errors")
+    for endpoint, stats in summary.items():
+        latency = stats["latency"]
+        print(
+            f"{endpoint:<32}{stats['requests']:>6}{stats['ok']:>6}{_fmt(stats['throughput_rps']):>7}"
+            f"{_fmt(latency['p50']):>8}{_fmt(latency['p95']):>8}{_fmt(latency['p99']):>8}{_fmt(latency['max']):>8}"
+            f"{_fmt(stats['time_to_first_page']['p50']):>8}  {stats['errors'] or ''}"
+        )
+    if generator.dropped:
+        print(f"⚠️ dropped (max in-flight reached): {generator.dropped}")
+
+    if args.json:
+        report = {
+            "config": vars(args),
+            "elapsed_s": elapsed,
+            "dropped": generator.dropped,
+            "endpoints": summary,
+            "samples": [sample.__dict__ for sample in generator.samples],
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+오프라인 벤치마크용 결정적(deterministic) 스텁 백엔드
+
+Gemini 모델, HTTP(지도/이미지 다운로드), 저장소(S3/로컬)를 네트워크 없이 흉내냅니다.
+각 백엔드는 지연 시간 분포와 오류율을 설정할 수 있고, 요청 단위 기록기(RequestRecord)에
+단계별 소요 시간과 경계를 오간 바이트 수를 누적합니다.
+
+같은 seed 와 요청 번호에는 항상 같은 지연/오류 시퀀스가 나옵니다.
+"""
+
+import contextvars
+import io
+import json
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+
+# ---------------------------------------------------------------------------
+# 요청 단위 기록기
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RequestRecord:
+    """요청 1건의 단계별 시간(초)과 바이트 수"""
+
+    rng: random.Random
+    stages: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    bytes: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    injected_errors: int = 0
+
+
+_current_record: contextvars.ContextVar[Optional[RequestRecord]] = contextvars.ContextVar(
+    "bench_current_record", default=None
+)
+
+
+def current_record() -> Optional[RequestRecord]:
+    return _current_record.get()
+
+
+def start_record(seed: int) -> RequestRecord:
+    """현재 컨텍스트에 새 기록기를 설정 (contextvars.copy_context().run 안에서 호출)"""
+    record = RequestRecord(rng=random.Random(seed))
+    _current_record.set(record)
+    return record
+
+
+# ---------------------------------------------------------------------------
+# 지연/오류 설정
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BackendProfile:
+    """
+    백엔드 하나의 지연 분포와 오류율
+
+    Args:
+        latency: 평균 지연 (초, time_scale 적용 전)
+        jitter: 로그정규 분포 시그마 (0이면 고정 지연)
+        error_rate: 호출당 오류 확률
+        error_codes: 오류 시 무작위로 고를 HTTP 상태 코드
+    """
+
+    latency: float
+    jitter: float = 0.3
+    error_rate: float = 0.0
+    error_codes: List[int] = field(default_factory=lambda: [500, 503])
+
+
+@dataclass
+class StubConfig:
+    """스텁 백엔드 전체 설정"""
+
+    text_model: BackendProfile = field(default_factory=lambda: BackendProfile(latency=1.5))
+    image_model: BackendProfile = field(default_factory=lambda: BackendProfile(latency=8.0))
+    http: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.2))
+    storage: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.3))
+    files: BackendProfile = field(default_factory=lambda: BackendProfile(latency=0.5))
+    time_scale: float = 0.02
+    image_width: int = 768
+    image_height: int = 1024
+
+
+class StubAPIError(RuntimeError):
+    """google-genai 오류 메시지 형식("500 INTERNAL. ...")을 흉내낸 예외"""
+
+    STATUS = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+    def __init__(self, code: int):
+        self.code = code
+        super().__init__(f"{code} {self.STATUS.get(code, 'ERROR')}. (stub injected error)")
+
+
+_ERROR_RECORD_RNG = random.Random(0)
+
+
+def _simulate(stage: str, profile: BackendProfile, time_scale: float,
+              bytes_in: int = 0, bytes_out: int = 0) -> None:
+    """지연을 흉내내고 기록기에 누적. 오류 확률에 걸리면 StubAPIError 발생"""
+    record = current_record()
+    rng = record.rng if record else _ERROR_RECORD_RNG
+
+    delay = profile.latency
+    if profile.jitter:
+        delay *= rng.lognormvariate(0.0, profile.jitter)
+    delay *= time_scale
+    failed = rng.random() < profile.error_rate
+    code = rng.choice(profile.error_codes) if failed else None
+
+    start = time.perf_counter()
+    time.sleep(delay)
+    if record:
+        record.stages[stage] += time.perf_counter() - start
+        record.bytes[f"{stage}_in"] += bytes_in
+        if not failed:
+            record.bytes[f"{stage}_out"] += bytes_out
+        if failed:
+            record.injected_errors += 1
+    if failed:
+        raise StubAPIError(code)
+
+
+# ---------------------------------------------------------------------------
+# 페이로드
+# ---------------------------------------------------------------------------
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """압축이 잘 안 되는 노이즈 PNG (실제 생성 이미지 크기와 비슷하게)"""
+    from PIL import Image
+
+    raw = random.Random(seed).randbytes(width * height * 3)
+    img = Image.frombytes("RGB", (width, height), raw)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+SAMPLE_TEXTS = {
+    "greeting": "서로 다른 길을 걸어온 두 사람이 이제 같은 길을 함께 걸어가려 합니다.",
+    "invitation": "귀한 걸음 하시어 저희의 새로운 시작을 축복해 주시면 감사하겠습니다.",
+    "location": "예식장 2층 그랜드홀에서 진행됩니다. 주차는 지하 1~3층을 이용해 주세요.",
+    "closing": "함께해 주시는 모든 분들께 진심으로 감사드립니다.",
+    "greetings": [
+        "봄날의 햇살처럼 따뜻한 날, 저희 두 사람이 하나가 됩니다.",
+        "평생을 함께할 사람을 만나 백년가약을 맺게 되었습니다.",
+        "서로의 \"{운명}\"이 된 두 사람의 시작을 지켜봐 주세요.",
+    ],
+    "invitations": [
+        "귀한 걸음 하시어 축복해 주세요.",
+        "두 사람이 하나 되는 소중한 자리에 함께해 주세요.",
+        "저희의 새로운 시작을 함께 축하해 주시면 감사하겠습니다.",
+    ],
+}
+
+
+def payload_size(value: Any) -> int:
+    """모델 요청 contents 의 대략적인 바이트 수 (복사 없이 계산)"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    if hasattr(value, "getbands") and hasattr(value, "size"):   # PIL Image
+        width, height = value.size
+        return width * height * len(value.getbands())
+    parts = getattr(value, "parts", None)
+    if parts is not None:
+        return payload_size(parts)
+    inline = getattr(value, "inline_data", None)
+    if inline is not None:
+        return payload_size(inline.data)
+    file_data = getattr(value, "file_data", None)
+    if file_data is not None:
+        return len(str(getattr(file_data, "file_uri", "")))
+    text = getattr(value, "text", None)
+    if isinstance(text, str):
+        return payload_size(text)
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# 모델 스텁
+# ---------------------------------------------------------------------------
+
+def _wants_image(config: Any) -> bool:
+    modalities = getattr(config, "response_modalities", None) or []
+    return any(str(m).upper().endswith("IMAGE") for m in modalities)
+
+
+def _usage(prompt_tokens: int, candidate_tokens: int, cached_tokens: int = 0) -> SimpleNamespace:
+    # 컨텍스트 캐시에서 읽은 토큰도 prompt_token_count 에 포함됨 (실제 API 와 동일)
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens + cached_tokens,
+        candidates_token_count=candidate_tokens,
+        total_token_count=prompt_tokens + cached_tokens + candidate_tokens,
+        cached_content_token_count=cached_tokens,
+        thoughts_token_count=0,
+    )
+
+
+def _image_part(png: bytes) -> SimpleNamespace:
+    return SimpleNamespace(
+        text=None,
+        thought=False,
+        inline_data=SimpleNamespace(data=png, mime_type="image/png"),
+    )
+
+
+def _text_part(text: str) -> SimpleNamespace:
+    return SimpleNamespace(text=text, thought=False, inline_data=None)
+
+
+def _candidate(parts: List[Any], finish_reason: Optional[str] = "STOP") -> SimpleNamespace:
+    return SimpleNamespace(
+        content=SimpleNamespace(parts=parts, role="model"),
+        finish_reason=finish_reason,
+        safety_ratings=None,
+    )
+
+
+class StubModels:
+    """client.models 스텁 (generate_content / generate_content_stream / generate_images)"""
+
+    def __init__(self, config: StubConfig, png: bytes, caches: Any = None):
+        self._config = config
+        self._png = png
+        self._text = json.dumps(SAMPLE_TEXTS, ensure_ascii=False)
+        self._caches = caches
+
+    def _cached_tokens(self, config: Any) -> int:
+        name = getattr(config, "cached_content", None)
+        return self._caches.tokens(name) if name and self._caches is not None else 0
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        bytes_in = payload_size(contents)
+        cached = self._cached_tokens(config)
+        if _wants_image(config):
+            _simulate("model_image", self._config.image_model, self._config.time_scale,
+                      bytes_in, len(self._png))
+            candidate = _candidate([_text_part("Here is your invitation."), _image_part(self._png)])
+            return SimpleNamespace(text=None, candidates=[candidate],
+                                   usage_metadata=_usage(bytes_in // 4, 1290, cached))
+
+        _simulate("model_text", self._config.text_model, self._config.time_scale,
+                  bytes_in, len(self._text.encode("utf-8")))
+        return SimpleNamespace(text=self._text, candidates=[_candidate([_text_part(self._text)])],
+                               usage_metadata=_usage(bytes_in // 4, len(self._text) // 2, cached))
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> Iterator[SimpleNamespace]:
+        bytes_in = payload_size(contents)
+        cached = self._cached_tokens(config)
+        if _wants_image(config):
+            # 첫 청크(텍스트)까지의 지연과 이미지 청크까지의 지연을 나눠서 흉내
+            _simulate("model_image", self._config.image_model, self._config.time_scale * 0.1, bytes_in)
+            yield SimpleNamespace(text="Generating...", candidates=[_candidate([_text_part("Generating...")], None)],
+                                  usage_metadata=None)
+            tail = BackendProfile(self._config.image_model.latency, self._config.image_model.jitter, 0.0)
+            _simulate("model_image", tail, self._config.time_scale * 0.9, 0, len(self._png))
+            yield SimpleNamespace(text=None, candidates=[_candidate([_image_part(self._png)])],
+                                  usage_metadata=_usage(bytes_in // 4, 1290, cached))
+            return
+
+        text = self._text
+        step = 32
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        _simulate("model_text", self._config.text_model, self._config.time_scale * 0.2, bytes_in)
+        per_piece = BackendProfile(self._config.text_model.latency * 0.8 / max(len(pieces), 1), 0.0, 0.0)
+        for index, piece in enumerate(pieces):
+            _simulate("model_text", per_piece, self._config.time_scale, 0, len(piece.encode("utf-8")))
+            usage = _usage(bytes_in // 4, len(text) // 2, cached) if index == len(pieces) - 1 else None
+            yield SimpleNamespace(text=piece, candidates=[_candidate([_text_part(piece)], None)],
+                                  usage_metadata=usage)
+
+    def generate_images(self, model: str, prompt: str, config: Any = None) -> SimpleNamespace:
+        from PIL import Image
+
+        _simulate("model_image", self._config.image_model, self._config.time_scale,
+                  payload_size(prompt), len(self._png))
+        image = Image.open(io.BytesIO(self._png))
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=image)])
+
+
+class StubGenaiClient:
+    """google.genai.Client 스텁 (files/caches 는 utils 의 오프라인 대역)"""
+
+    def __init__(self, config: StubConfig, png: bytes):
+        from utils.context_cache import OfflineCaches
+        from utils.style_assets import OfflineFiles
+
+        self.caches = OfflineCaches(
+            on_create=lambda tokens: _simulate("cache_create", config.files, config.time_scale, tokens * 4)
+        )
+        self.models = StubModels(config, png, self.caches)
+        self.files = OfflineFiles(
+            on_upload=lambda size: _simulate("files_upload", config.files, config.time_scale, size)
+        )
+
+
+# ---------------------------------------------------------------------------
+# HTTP / 저장소 스텁
+# ---------------------------------------------------------------------------
+
+class StubHTTP:
+    """requests.get 스텁 (이미지 URL, 지도 URL 모두 PNG 반환)"""
+
+    def __init__(self, config: StubConfig, png: bytes):
+        self._config = config
+        self._png = png
+
+    def get(self, url: str, *args: Any, **kwargs: Any) -> SimpleNamespace:
+        _simulate("http", self._config.http, self._config.time_scale, 0, len(self._png))
+
+        def raise_for_status() -> None:
+            return None
+
+        return SimpleNamespace(
+            status_code=200,
+            content=self._png,
+            headers={"Content-Type": "image/png"},
+            raise_for_status=raise_for_status,
+        )
+
+
+class StubS3Client:
+    """boto3 S3 클라이언트 스텁 (업로드 바이트만 기록하고 버림)"""
+
+    def __init__(self, config: StubConfig):
+        self._config = config
+
+    def upload_fileobj(self, fileobj: Any, bucket: str, key: str, ExtraArgs: Optional[dict] = None) -> None:
+        size = len(fileobj.getbuffer()) if hasattr(fileobj, "getbuffer") else len(fileobj.read())
+        _simulate("storage", self._config.storage, self._config.time_scale, size)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, ContentType: str = "") -> dict:
+        _simulate("storage", self._config.storage, self._config.time_scale, len(Body))
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# 패치
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def patched_backends(config: StubConfig) -> Iterator[SimpleNamespace]:
+    """
+    파이프라인 모듈들의 모델/HTTP/저장소 백엔드를 스텁으로 교체합니다.
+
+    Yields:
+        SimpleNamespace(client=..., http=..., s3=..., png=...)
+    """
+    import gemini_invitation_api
+    import gemini_text_api
+    import imagen_design_api
+    import nanobanana_api
+    import requests
+    from utils import context_cache, style_assets
+
+    png = make_png(config.image_width, config.image_height)
+    client = StubGenaiClient(config, png)
+    http = StubHTTP(config, png)
+    s3 = StubS3Client(config)
+
+    def save_locally(image_bytes: bytes, file_type: str = "invitation-gemini") -> str:
+        _simulate("storage", config.storage, config.time_scale, len(image_bytes))
+        return f"http://stub/static/{file_type}.png"
+
+    with ExitStack() as stack:
+        for module in (nanobanana_api, gemini_invitation_api, imagen_design_api, gemini_text_api):
+            stack.enter_context(mock.patch.object(module, "get_genai_client", lambda: client))
+        stack.enter_context(mock.patch.object(nanobanana_api, "s3_client", s3))
+        stack.enter_context(mock.patch.object(imagen_design_api, "s3_client", s3))
+        stack.enter_context(mock.patch.object(gemini_invitation_api, "s3_client", s3))
+        stack.enter_context(mock.patch.object(gemini_invitation_api, "save_locally", save_locally))
+        stack.enter_context(mock.patch.object(requests, "get", http.get))
+        # 스타일 이미지/컨텍스트 캐시 핸들은 스텁 저장소에만 유효하므로 워커 간 공유 캐시에 남기지 않음
+        registry = style_assets.StyleAssetRegistry(files=lambda: client.files, shared=False,
+                                                   enabled=style_assets.registry.enabled)
+        stack.enter_context(mock.patch.object(style_assets, "registry", registry))
+        manager = context_cache.ContextCacheManager(caches=lambda: client.caches, shared=False,
+                                                    enabled=context_cache.manager.enabled)
+        stack.enter_context(mock.patch.object(context_cache, "manager", manager))
+        stack.enter_context(mock.patch.dict("os.environ", {"GOOGLE_MAPS_API_KEY": "stub"}))
+        yield SimpleNamespace(client=client, http=http, s3=s3, png=png)
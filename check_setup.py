@@ -7,6 +7,7 @@ uv venv로 설치한 패키지들이 정상적으로 작동하는지 확인합
 
 import sys
 import os
+import subprocess
 
 
 def check_python_version():
@@ -137,6 +138,48 @@ def check_env_file():
         return False
 
 
+def check_import_time(limit_seconds: float = 1.0):
+    """서버 모듈(app.main) 콜드 import 시간 측정 (python -X importtime)"""
+    print("\n⏱️  import 시간 확인:")
+
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app.main"],
+            cwd=base_path,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+    except Exception as e:
+        print(f"   ❌ 측정 실패: {e}")
+        return False
+
+    # 형식: "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(parts[1]), depth, name.strip()))
+
+    if proc.returncode != 0:
+        print(f"   ❌ app.main import 실패: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+        return False
+
+    total = sum(cumulative for cumulative, depth, _ in modules if depth == 0) / 1e6
+    print(f"   {'✅' if total <= limit_seconds else '⚠️ '} 합계 {total:.2f}s (기준 {limit_seconds:.1f}s)")
+    print("   누적 시간 상위 모듈:")
+    for cumulative, _, name in sorted(modules, reverse=True)[:10]:
+        print(f"      {cumulative / 1000:8.1f} ms  {name}")
+
+    return total <= limit_seconds
+
+
 def main():
     """메인 체크 함수"""
     print("=" * 60)
@@ -150,6 +193,7 @@ def main():
     results.append(("프롬프트 파일", check_prompt_files()))
     results.append(("프롬프트 로더", check_prompt_loader()))
     results.append(("환경 변수", check_env_file()))
+    results.append(("import 시간", check_import_time()))
 
     print("\n" + "=" * 60)
     print("📊 결과 요약")
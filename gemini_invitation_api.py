@@ -1,22 +1,35 @@
 """
 Gemini 모델을 사용한 청첩장 생성 (Nanobanana 대체 테스트용)
+이미지가 나오지 않으면 utils/degraded.py 의 대체 커버("degraded": true)를 돌려줍니다.
 """
 
 import os
 import base64
 from typing import Dict, List, Any
-import boto3
 import uuid
-from google.genai import types
+from utils import degraded
+from utils.aws import get_s3_client
 from utils.genai_client import get_genai_client, parse_json_response
+from utils.log import get_logger
+from utils.tracing import record_response, span
+
+logger = get_logger(__name__)
+
+# AWS S3 설정 (boto3 클라이언트는 첫 업로드 때 생성)
+s3_client = None
+
+
+def _get_s3_client():
+    """S3 클라이언트 (첫 업로드 시 생성, 테스트/벤치마크에서는 s3_client 를 바꿔 끼움)"""
+    global s3_client
+    if s3_client is None:
+        s3_client = get_s3_client(
+            'ap-northeast-2',
+            os.environ.get('AWS_ACCESS_KEY_ID'),
+            os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        )
+    return s3_client
 
-# AWS S3 설정
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-    region_name='ap-northeast-2'
-)
 
 BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', 'wedding-invitation-images')
 
@@ -31,18 +44,20 @@ def save_locally(image_bytes: bytes, file_type: str = "invitation-gemini") -> st
         os.makedirs(GENERATED_DIR, exist_ok=True)
     filename = f"{file_type}_{uuid.uuid4()}.png"
     filepath = os.path.join(GENERATED_DIR, filename)
-    with open(filepath, "wb") as f:
-        f.write(image_bytes)
+    with span("storage.upload", backend="local", key=filename, bytes_in=len(image_bytes)):
+        with open(filepath, "wb") as f:
+            f.write(image_bytes)
     return f"{MODEL_SERVER_URL}/static/generated_images/{filename}"
 
 def upload_to_s3(image_bytes: bytes, file_type: str = "invitation-gemini") -> str:
     file_key = f"{file_type}/{uuid.uuid4()}.png"
-    s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=file_key,
-        Body=image_bytes,
-        ContentType='image/png'
-    )
+    with span("storage.upload", backend="s3", key=file_key, bytes_in=len(image_bytes)):
+        _get_s3_client().put_object(
+            Bucket=BUCKET_NAME,
+            Key=file_key,
+            Body=image_bytes,
+            ContentType='image/png'
+        )
     return f"https://{BUCKET_NAME}.s3.ap-northeast-2.amazonaws.com/{file_key}"
 
 def generate_invitation_with_gemini(
@@ -60,6 +75,8 @@ def generate_invitation_with_gemini(
     """
     Gemini 모델을 사용하여 청첩장 이미지 및 문구 생성
     """
+    from google.genai import types
+
     client = get_genai_client()
     
     # 1. 문구 생성 (항상 2.0 Flash 사용 권장)
@@ -72,12 +89,14 @@ def generate_invitation_with_gemini(
     Return JSON with: greeting, invitation, location.
     """
     
-    text_response = client.models.generate_content(
-        model='gemini-2.0-flash-exp',
-        contents=[prompt_text],
-        config=types.GenerateContentConfig(response_mime_type="application/json")
-    )
-    texts = parse_json_response(text_response)
+    with span("text.generate", model='gemini-2.0-flash-exp', bytes_in=len(prompt_text)):
+        text_response = client.models.generate_content(
+            model='gemini-2.0-flash-exp',
+            contents=[prompt_text],
+            config=types.GenerateContentConfig(response_mime_type="application/json")
+        )
+        record_response(text_response)
+        texts = parse_json_response(text_response)
     
     # 2. 이미지 생성 (요청된 모델 사용)
     # Gemini 3 Pro Image Preview는 스트리밍 방식으로 이미지 생성 가능
@@ -94,6 +113,7 @@ def generate_invitation_with_gemini(
     """
     
     images = []
+    reason = "no_image"
     
     try:
         # Gemini 3 Pro Image Preview 모델을 사용하여 이미지 생성 시도
@@ -105,7 +125,7 @@ def generate_invitation_with_gemini(
         if style_image_base64:
             contents.append(types.Part.from_bytes(data=base64.b64decode(style_image_base64), mime_type="image/png"))
 
-        print(f"Generating image with {model_name}...")
+        logger.info("generating image", extra={"fields": {"model": model_name}})
         
         # 이미지 생성 설정
         config = types.GenerateContentConfig(
@@ -113,11 +133,13 @@ def generate_invitation_with_gemini(
             image_config=types.ImageConfig(image_size="1K") if "image-preview" in model_name else None,
         )
 
-        response = client.models.generate_content(
-            model=model_name,
-            contents=[types.Content(role="user", parts=contents)],
-            config=config,
-        )
+        with span("page.model_call", model=model_name):
+            response = client.models.generate_content(
+                model=model_name,
+                contents=[types.Content(role="user", parts=contents)],
+                config=config,
+            )
+            record_response(response)
         
         # 응답에서 이미지 추출
         for part in response.candidates[0].content.parts:
@@ -126,25 +148,44 @@ def generate_invitation_with_gemini(
                 images.append(image_url)
                 
     except Exception as e:
-        print(f"Error generating image with {model_name}: {e}")
+        logger.warning("image generation failed", extra={"fields": {"model": model_name, "error": str(e)}})
         # 이미지 생성이 실패하더라도 텍스트는 반환
-        pass
+        reason = "model_error"
 
-    # 만약 이미지가 생성되지 않았다면 샘플 이미지 URL이라도 반환 (테스트용)
+    is_degraded = False
     if not images:
-        images = ["https://via.placeholder.com/600x800.png?text=Gemini+Image+Generation+Placeholder"]
+        if degraded.ENABLED:
+            # 스타일 색과 이름으로 로컬에서 그린 대체 커버
+            image_bytes = degraded.render_page(
+                "cover",
+                style_image=base64.b64decode(style_image_base64) if style_image_base64 else None,
+                tone=tone,
+                photo=base64.b64decode(wedding_image_base64) if wedding_image_base64 else None,
+                groom_name=groom_name,
+                bride_name=bride_name,
+            )
+            degraded.mark("gemini", reason)
+            images = [save_locally(image_bytes, "invitation-degraded")]
+            is_degraded = True
+        else:
+            # 샘플 이미지 URL이라도 반환 (테스트용)
+            images = ["https://via.placeholder.com/600x800.png?text=Gemini+Image+Generation+Placeholder"]
 
     pages = []
     for i, url in enumerate(images):
-        pages.append({
+        page = {
             "page_number": i + 1,
             "image_url": url,
             "type": "cover" if i == 0 else "content"
-        })
+        }
+        if is_degraded:
+            page["degraded"] = True
+        pages.append(page)
 
     return {
         "pages": pages,
         "texts": texts,
-        "model_used": model_name
+        "model_used": model_name,
+        "degraded": is_degraded,
     }
 
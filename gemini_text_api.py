@@ -6,26 +6,32 @@ STEP 2-3: 톤에 맞는 청첩장 문구 생성 (인사말x3, 초대문구x3, 
 """
 
 import os
+import itertools
 import json
-from typing import Dict
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from google.genai import types
 
 # 프롬프트 로더 및 GenAI 클라이언트
 import sys
 sys.path.append(os.path.dirname(__file__))
-from utils.genai_client import get_genai_client, parse_json_response
-from utils.prompt_loader import GeminiPromptBuilder
+from utils import context_cache
+from utils.genai_client import get_genai_client, parse_json_response, parse_json_text, use_client
+from utils.json_stream import IncrementalJSONParser
+from utils.prompt_loader import GeminiPromptBuilder, estimate_tokens
+from utils.shared_cache import shared_cache
+from utils.singleflight import SingleFlight
+from utils.tracing import record_response, record_span, span
+
+if TYPE_CHECKING:
+    from google.genai import types
 
 # .env 파일 로드
 load_dotenv()
 
-Schema = types.Schema
-Type = types.Type
-
 
-def _convert_schema_to_gemini(json_schema: Dict) -> Schema:
+def _convert_schema_to_gemini(json_schema: Dict) -> "types.Schema":
     """
     JSON Schema를 Gemini API용 Schema 객체로 변환
 
@@ -35,6 +41,9 @@ def _convert_schema_to_gemini(json_schema: Dict) -> Schema:
     Returns:
         content_types.Schema 객체
     """
+    from google.genai import types
+
+    Type = types.Type
     type_map = {
         "object": Type.OBJECT,
         "array": Type.ARRAY,
@@ -63,12 +72,77 @@ def _convert_schema_to_gemini(json_schema: Dict) -> Schema:
     if "required" in json_schema:
         kwargs["required"] = json_schema["required"]
 
-    return Schema(**kwargs)
+    return types.Schema(**kwargs)
 
 
 # 프롬프트 빌더 초기화
 prompt_builder = GeminiPromptBuilder()
 
+# 같은 입력의 문구 생성이 동시에 들어오면 한 번만 호출
+_text_flight = SingleFlight("text_generate")
+
+
+def _build_text_request(
+    tone: str,
+    groom_name: str,
+    bride_name: str,
+    groom_father: str,
+    groom_mother: str,
+    bride_father: str,
+    bride_mother: str,
+    venue: str,
+    wedding_date: str,
+    wedding_time: str,
+    address: str = ""
+) -> Tuple[str, List[str], "types.GenerateContentConfig", context_cache.Prefix]:
+    """
+    문구 생성 요청(model, contents, config)과 컨텍스트 캐시 prefix 를 구성합니다.
+
+    일반 호출과 스트리밍 호출이 같은 프롬프트/스키마를 쓰도록 공통화합니다.
+    시스템 프롬프트는 모든 요청에서 같으므로 재사용이 충분하면 캐시로 보내고
+    태스크 프롬프트만 전송합니다 (utils/context_cache.py).
+    """
+    # 프롬프트 빌더로 프롬프트 + 스키마 로드
+    prompt_data = prompt_builder.build_text_generation_prompt(
+        tone=tone,
+        groom_name=groom_name,
+        bride_name=bride_name,
+        groom_father=groom_father,
+        groom_mother=groom_mother,
+        bride_father=bride_father,
+        bride_mother=bride_mother,
+        venue=venue,
+        wedding_date=wedding_date,
+        wedding_time=wedding_time,
+        address=address
+    )
+
+    from google.genai import types
+
+    # JSON Schema → Gemini Schema 변환
+    gemini_schema = _convert_schema_to_gemini(prompt_data["schema"])
+
+    # 모델 선택 (사용자 요청 모델이 있으면 사용, 기본은 2.0-flash-exp)
+    text_model = 'gemini-2.0-flash-exp'
+    config_kwargs = {
+        "response_mime_type": "application/json",
+        "response_schema": gemini_schema,
+    }
+    
+    # gemini-3-pro-preview 모델일 경우 ThinkingConfig 적용 (사용자 요청 반영)
+    # 현재 SDK의 모델명 매칭은 환경에 따라 다를 수 있으나 사용자 스니펫 기준 적용
+    model_to_use = text_model
+    # if "pro-preview" in model_to_use:
+    #     config_kwargs["thinking_config"] = types.ThinkingConfig(thinking_level="HIGH")
+
+    prefix = context_cache.Prefix(
+        key=context_cache.prefix_key("text-system", prompt_data["system"]),
+        system_instruction=prompt_data["system"],
+        rest=[prompt_data["task"]],
+        estimated_tokens=estimate_tokens(prompt_data["system"]),
+    )
+    return model_to_use, [prompt_data["prompt"]], types.GenerateContentConfig(**config_kwargs), prefix
+
 
 def generate_wedding_texts(
     tone: str,
@@ -108,8 +182,7 @@ def generate_wedding_texts(
         }
     """
 
-    # 프롬프트 빌더로 프롬프트 + 스키마 로드
-    prompt_data = prompt_builder.build_text_generation_prompt(
+    model, contents, config, prefix = _build_text_request(
         tone=tone,
         groom_name=groom_name,
         bride_name=bride_name,
@@ -123,31 +196,147 @@ def generate_wedding_texts(
         address=address
     )
 
-    # JSON Schema → Gemini Schema 변환
-    gemini_schema = _convert_schema_to_gemini(prompt_data["schema"])
+    # 공유 캐시 (TEXT_CACHE_TTL 설정 시에만 저장됨)
+    cache_key = "\n".join([model, *contents])
+    cached = shared_cache.get_json("text", cache_key)
+    if cached is not None:
+        return cached
+
+    result, _ = _text_flight.do(cache_key, _generate_and_cache, model, contents, config, prefix, cache_key)
+    return result
+
 
+def _generate_and_cache(
+    model: str,
+    contents: List[str],
+    config: "types.GenerateContentConfig",
+    prefix: context_cache.Prefix,
+    cache_key: str,
+) -> Dict:
     client = get_genai_client()
-    
-    # 모델 선택 (사용자 요청 모델이 있으면 사용, 기본은 2.0-flash-exp)
-    text_model = 'gemini-2.0-flash-exp'
-    config_kwargs = {
-        "response_mime_type": "application/json",
-        "response_schema": gemini_schema,
-    }
-    
-    # gemini-3-pro-preview 모델일 경우 ThinkingConfig 적용 (사용자 요청 반영)
-    # 현재 SDK의 모델명 매칭은 환경에 따라 다를 수 있으나 사용자 스니펫 기준 적용
-    model_to_use = text_model
-    # if "pro-preview" in model_to_use:
-    #     config_kwargs["thinking_config"] = types.ThinkingConfig(thinking_level="HIGH")
+    with span("text.generate", model=model) as s, use_client(client):
+        call_contents, call_config, cached_content = context_cache.manager.request(model, prefix, contents, config)
+        s.set(cached_content=cached_content)
+        try:
+            response = client.models.generate_content(model=model, contents=call_contents, config=call_config)
+        except Exception as e:
+            if cached_content is None or not context_cache.is_missing_cache_error(e):
+                raise
+            # 캐시가 만료/삭제됨: 시스템 프롬프트를 포함해 다시 호출
+            context_cache.manager.invalidate(model, prefix)
+            response = client.models.generate_content(model=model, contents=contents, config=config)
+        record_response(response)
+        s.set(bytes_out=len(getattr(response, "text", None) or ""))
+
+        result = parse_json_response(response)
+    shared_cache.set_json("text", cache_key, result)
+    return result
+
+
+def stream_wedding_texts(
+    tone: str,
+    groom_name: str,
+    bride_name: str,
+    groom_father: str,
+    groom_mother: str,
+    bride_father: str,
+    bride_mother: str,
+    venue: str,
+    wedding_date: str,
+    wedding_time: str,
+    address: str = ""
+) -> Iterator[Dict[str, any]]:
+    """
+    generate_wedding_texts의 스트리밍 버전
+
+    generate_content_stream 으로 받은 조각을 증분 파싱하여, 문구 하나가 완성될 때마다
+    바로 이벤트를 내보냅니다. 마지막에는 전체 결과를 담은 done 이벤트를 보냅니다.
 
-    response = client.models.generate_content(
-        model=model_to_use,
-        contents=[prompt_data["prompt"]],
-        config=types.GenerateContentConfig(**config_kwargs),
+    Args:
+        generate_wedding_texts와 동일
+
+    Yields:
+        Dict: {"event": "field", "field": "greetings", "index": 0, "value": "인사말1"}
+              ... (location처럼 배열이 아닌 필드는 index가 None)
+              {"event": "done", "data": {전체 결과 (generate_wedding_texts와 동일 형식)}}
+    """
+    model, contents, config, prefix = _build_text_request(
+        tone=tone,
+        groom_name=groom_name,
+        bride_name=bride_name,
+        groom_father=groom_father,
+        groom_mother=groom_mother,
+        bride_father=bride_father,
+        bride_mother=bride_mother,
+        venue=venue,
+        wedding_date=wedding_date,
+        wedding_time=wedding_time,
+        address=address
     )
 
-    return parse_json_response(response)
+    client = get_genai_client()
+    parser = IncrementalJSONParser(max_depth=2)
+    chunks = []
+
+    # 제너레이터는 yield 사이에 컨텍스트가 바뀔 수 있어 span() 대신 구간만 기록
+    started_ns = time.time_ns()
+    first_field_ms = None
+    usage = None
+
+    stream, cached_content = _open_text_stream(client, model, contents, config, prefix)
+    for chunk in stream:
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        text = getattr(chunk, "text", None)
+        if not text:
+            continue
+        chunks.append(text)
+        for path, value in parser.feed(text):
+            if first_field_ms is None:
+                first_field_ms = round((time.time_ns() - started_ns) / 1e6, 1)
+            yield {
+                "event": "field",
+                "field": path[0],
+                "index": path[1] if len(path) > 1 else None,
+                "value": value,
+            }
+
+    # 스트림이 정상 JSON으로 끝나지 않은 경우 기존 관대한 파서로 복구
+    result = parser.result if isinstance(parser.result, dict) else parse_json_text("".join(chunks))
+    record_span(
+        "text.generate",
+        started_ns,
+        model=model,
+        stream=True,
+        first_field_ms=first_field_ms,
+        bytes_out=sum(len(c) for c in chunks),
+        input_tokens=getattr(usage, "prompt_token_count", None),
+        cached_tokens=getattr(usage, "cached_content_token_count", None),
+        output_tokens=getattr(usage, "candidates_token_count", None),
+        cached_content=cached_content,
+    )
+    yield {"event": "done", "data": result}
+
+
+def _open_text_stream(
+    client: Any,
+    model: str,
+    contents: List[str],
+    config: "types.GenerateContentConfig",
+    prefix: context_cache.Prefix,
+) -> Tuple[Iterator[Any], Optional[str]]:
+    """컨텍스트 캐시를 적용한 스트림 (첫 청크 전에 캐시를 찾지 못하면 캐시 없이 다시 연결)"""
+    # cachedContents 는 키(프로젝트)별이므로 캐시 조회/무효화도 이 클라이언트의 키 기준
+    with use_client(client):
+        call_contents, call_config, cached_content = context_cache.manager.request(model, prefix, contents, config)
+        stream = iter(client.models.generate_content_stream(model=model, contents=call_contents, config=call_config))
+        try:
+            first = next(stream, None)
+        except Exception as e:
+            if cached_content is None or not context_cache.is_missing_cache_error(e):
+                raise
+            context_cache.manager.invalidate(model, prefix)
+            return iter(client.models.generate_content_stream(model=model, contents=contents, config=config)), None
+    return itertools.chain([] if first is None else [first], stream), cached_content
 
 
 def regenerate_wedding_texts(
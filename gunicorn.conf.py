@@ -0,0 +1,52 @@
+"""
+멀티 워커 실행 설정 (gunicorn + uvicorn 워커)
+
+    WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py app.main:app
+
+- preload_app: 마스터가 app 과 파이프라인 모듈/프롬프트/Pillow 코덱을 한 번 로드한 뒤 fork 하므로
+  워커들이 copy-on-write 로 메모리를 공유합니다. Gemini/S3 클라이언트와 연결은 fork 후
+  워커별 startup 워밍업에서 만듭니다 (utils/warmup.py).
+- 캐시: 다운로드 이미지/지도/문구는 워커가 공유하는 SQLite WAL 파일에 저장합니다 (utils/shared_cache.py).
+- 메트릭: PROMETHEUS_MULTIPROC_DIR 를 마스터에서 비우고 지정하므로 /metrics 는 모든 워커 합산입니다.
+- 워커 수 기본값은 1 입니다. os.cpu_count() 는 컨테이너 CPU 제한이 아니라 노드 코어 수이고, 아래 제어는
+  프로세스 메모리에 있어 워커마다 따로 적용되므로 워커를 늘릴 때는 값을 워커 수로 나눠 설정하세요.
+    - TENANT_DAILY_BUDGET_USD / TENANT_BUDGETS (utils/usage.py): 워커별 집계, 실제 한도는 워커 수 배
+    - MEMORY_BUDGET_MB (utils/memory.py): 워커당 예산
+    - ADMISSION_LIMITS (utils/admission.py): 워커당 레인 상한
+
+환경 변수:
+    WEB_CONCURRENCY        : 워커 수 (기본 1, 위 워커별 제어 참고)
+    BIND                   : 기본 0.0.0.0:8000
+    WORKER_TIMEOUT         : 요청 처리 제한 초 (기본 300, 3페이지 이미지 생성이 수십 초 걸림)
+    PROMETHEUS_MULTIPROC_DIR : 기본 <tempdir>/wedding-prometheus
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+# prometheus_client 는 import 시점에 이 값을 읽으므로 app 을 preload 하기 전에 설정
+_prom_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "wedding-prometheus"))
+shutil.rmtree(_prom_dir, ignore_errors=True)
+os.makedirs(_prom_dir, exist_ok=True)
+
+
+def on_starting(server):
+    # fork 전에 무거운 모듈/프롬프트/코덱 로드 (워커가 공유)
+    from utils import warmup
+
+    warmup.preload()
+
+
+def child_exit(server, worker):
+    from utils import metrics
+
+    metrics.mark_process_dead(worker.pid)
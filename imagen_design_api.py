@@ -1,20 +1,26 @@
 """
 Google Imagen 및 Gemini API를 사용한 청첩장 디자인 생성
 안정성과 속도를 위해 순차적 생성 및 최적화된 설정을 사용합니다.
+페이지 생성이 실패하면 utils/degraded.py 의 대체 페이지("degraded": true)를 넣습니다.
 """
 
 import os
 import json
 import base64
 import asyncio
+import contextvars
 from typing import Dict, List, Optional, Any
-import boto3
 import uuid
 from dotenv import load_dotenv
-from google.genai import types
 
 # 프로젝트 내부 유틸리티 사용
+from utils import degraded
+from utils.aws import get_s3_client
 from utils.genai_client import get_genai_client
+from utils.log import get_logger
+from utils.tracing import record_response, span
+
+logger = get_logger(__name__)
 
 # .env 파일 로드
 load_dotenv()
@@ -24,7 +30,16 @@ S3_BUCKET = os.environ.get('S3_BUCKET')
 S3_REGION = os.environ.get('S3_REGION', 'ap-northeast-2')
 CLOUD_FRONT_DOMAIN = os.environ.get('CLOUD_FRONT_DOMAIN')
 
-s3_client = boto3.client('s3', region_name=S3_REGION)
+# boto3 클라이언트는 import 시점이 아니라 첫 업로드 때 생성
+s3_client = None
+
+
+def _get_s3_client():
+    """S3 클라이언트 (첫 업로드 시 생성, 테스트/벤치마크에서는 s3_client 를 바꿔 끼움)"""
+    global s3_client
+    if s3_client is None:
+        s3_client = get_s3_client(S3_REGION)
+    return s3_client
 
 
 def save_to_s3(image_bytes: bytes, file_type: str = "design") -> str:
@@ -36,12 +51,13 @@ def save_to_s3(image_bytes: bytes, file_type: str = "design") -> str:
     filename = f"invitations/{file_type}_{timestamp}_{uuid.uuid4().hex[:8]}.png"
 
     buffer = io.BytesIO(image_bytes)
-    s3_client.upload_fileobj(
-        buffer,
-        S3_BUCKET,
-        filename,
-        ExtraArgs={"ContentType": "image/png"}
-    )
+    with span("storage.upload", backend="s3", key=filename, bytes_in=len(image_bytes)):
+        _get_s3_client().upload_fileobj(
+            buffer,
+            S3_BUCKET,
+            filename,
+            ExtraArgs={"ContentType": "image/png"}
+        )
 
     return f"{CLOUD_FRONT_DOMAIN}/{filename}"
 
@@ -97,51 +113,103 @@ async def generate_invitation_design(
     ]
     
     pages = []
-    
+    # 모델 호출 오류가 한 번 나면 남은 페이지는 바로 대체 페이지로 (장애 중 부하를 키우지 않도록)
+    model_down = False
+
     # 5개를 동시에 보내면 Google API 부하로 503 에러 발생 가능성이 높음
     # 따라서 순차적으로 혹은 2개씩 나누어 실행
     for i, data in enumerate(tasks_data):
-        print(f"⏳ [Page {i+1}/5] Generating {data['description']}...")
+        logger.info("page generation start", extra={"fields": {"page": i + 1, "total": len(tasks_data), "description": data['description']}})
         
         # 각 페이지 생성 시도
-        try:
-            url = await _generate_single_page_task(
-                data['prompt'], 
-                data['content_img'], 
-                style_image_base64, 
-                model_name
-            )
-            
-            pages.append({
-                "page_number": data['page_number'],
-                "image_url": url,
-                "type": data['type'],
-                "description": data['description']
-            })
-            
-            # API 과부하 방지를 위한 짧은 휴식 (필요 시)
-            # await asyncio.sleep(0.5)
-            
-        except Exception as e:
-            print(f"❌ Error on Page {data['page_number']}: {e}")
-            pages.append({
-                "page_number": data['page_number'],
-                "image_url": "https://via.placeholder.com/600x800.png?text=Generation+Error",
-                "type": data['type'],
-                "description": data['description']
-            })
+        url = None
+        reason = "model_error"
+        if not (model_down and degraded.ENABLED):
+            try:
+                with span("page.generate", page=data['page_number'], page_type=data['type']):
+                    url = await _generate_single_page_task(
+                        data['prompt'], 
+                        data['content_img'], 
+                        style_image_base64, 
+                        model_name
+                    )
+                reason = "no_image"
+            except Exception as e:
+                logger.error("page generation error", extra={"fields": {"page": data['page_number'], "error": str(e)}})
+                model_down = True
+
+        page = {
+            "page_number": data['page_number'],
+            "image_url": url,
+            "type": data['type'],
+            "description": data['description']
+        }
+        if url is None:
+            if degraded.ENABLED:
+                # Pillow 렌더링과 S3 업로드는 블로킹이므로 스레드에서 (업로드까지 실패하면 placeholder)
+                loop = asyncio.get_running_loop()
+                page["image_url"] = await loop.run_in_executor(
+                    None, contextvars.copy_context().run, _degraded_page_url,
+                    data, reason, style_image_base64, wedding_image_base64, texts, venue_info,
+                ) or _placeholder_url(reason)
+                page["degraded"] = True
+            else:
+                page["image_url"] = _placeholder_url(reason)
+        pages.append(page)
+
+        # API 과부하 방지를 위한 짧은 휴식 (필요 시)
+        # await asyncio.sleep(0.5)
 
     return {
         "pages": sorted(pages, key=lambda x: x["page_number"]),
-        "model_used": model_name
+        "model_used": model_name,
+        "degraded": any(p.get("degraded") for p in pages),
     }
 
+
+def _placeholder_url(reason: str) -> str:
+    label = "Generation+Error" if reason == "model_error" else "Generation+Failed"
+    return f"https://via.placeholder.com/600x800.png?text={label}"
+
+
+def _degraded_page_url(data: Dict[str, Any], reason: str, style_image_base64: Optional[str],
+                       wedding_image_base64: Optional[str], texts: Dict[str, str],
+                       venue_info: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    모델 대신 로컬에서 그린 대체 페이지를 올리고 URL 반환 (utils/degraded.py, 스레드에서 실행)
+
+    저장소도 장애면 요청 전체를 실패시키지 않도록 None (호출 측이 placeholder 사용).
+    """
+    venue_info = venue_info or {}
+    kind = data['type']
+    image_bytes = degraded.render_page(
+        kind,
+        style_image=base64.b64decode(style_image_base64) if style_image_base64 else None,
+        texts=texts,
+        photo=base64.b64decode(wedding_image_base64) if kind == "cover" and wedding_image_base64 else None,
+        page=data['page_number'],
+        venue=venue_info.get("name", ""),
+        address=venue_info.get("address", ""),
+    )
+    degraded.mark("design", reason)
+    try:
+        return save_to_s3(image_bytes, "design-degraded")
+    except Exception as e:
+        logger.warning("degraded page upload failed, using placeholder", extra={"fields": {
+            "page": data['page_number'], "error": str(e),
+        }})
+        return None
+
 async def _generate_single_page_task(prompt, content_img, style_img, model_name):
     """단일 페이지 생성 실행"""
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _generate_single_page_sync, prompt, content_img, style_img, model_name)
+    # run_in_executor는 contextvars를 넘기지 않으므로 현재 컨텍스트(트레이스 span)를 복사해 실행
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, ctx.run, _generate_single_page_sync, prompt, content_img, style_img, model_name)
+
+def _generate_single_page_sync(prompt: str, content_image_base64: Optional[str], style_image_base64: str, model_name: str) -> Optional[str]:
+    from google.genai import types
 
-def _generate_single_page_sync(prompt: str, content_image_base64: Optional[str], style_image_base64: str, model_name: str) -> str:
     client = get_genai_client()
     
     # 모델명 정규화
@@ -157,15 +225,19 @@ def _generate_single_page_sync(prompt: str, content_image_base64: Optional[str],
                 aspect_ratio="3:4",
                 image_size="1K",
             )
-            result = client.models.generate_images(
-                model=full_model_name,
-                prompt=f"{prompt}. Follow the provided reference style. Professional wedding invitation.",
-                config=config
-            )
+            with span("page.model_call", model=full_model_name) as s:
+                result = client.models.generate_images(
+                    model=full_model_name,
+                    prompt=f"{prompt}. Follow the provided reference style. Professional wedding invitation.",
+                    config=config
+                )
+                s.set(images=len(result.generated_images or []))
             if result.generated_images:
                 from io import BytesIO
-                img_buffer = BytesIO()
-                result.generated_images[0].image.save(img_buffer, format='PNG')
+                with span("image.encode", format="PNG") as s:
+                    img_buffer = BytesIO()
+                    result.generated_images[0].image.save(img_buffer, format='PNG')
+                    s.set(bytes_out=img_buffer.tell())
                 return save_to_s3(img_buffer.getvalue(), "design-imagen")
                 
         else:
@@ -182,11 +254,13 @@ def _generate_single_page_sync(prompt: str, content_image_base64: Optional[str],
                 image_config=types.ImageConfig(image_size="1K"),
             )
 
-            response = client.models.generate_content(
-                model=full_model_name,
-                contents=[types.Content(role="user", parts=parts)],
-                config=generate_content_config
-            )
+            with span("page.model_call", model=full_model_name):
+                response = client.models.generate_content(
+                    model=full_model_name,
+                    contents=[types.Content(role="user", parts=parts)],
+                    config=generate_content_config
+                )
+                record_response(response)
             
             if response.candidates and response.candidates[0].content.parts:
                 for part in response.candidates[0].content.parts:
@@ -194,9 +268,11 @@ def _generate_single_page_sync(prompt: str, content_image_base64: Optional[str],
                         return save_to_s3(part.inline_data.data, "design-gemini")
             
     except Exception as e:
-        print(f"❌ [Page] Failed with {full_model_name}: {e}")
+        logger.warning("page model call failed", extra={"fields": {"model": full_model_name, "error": str(e)}})
         # Imagen 실패 시 Gemini로 최후의 시도
         if "imagen" in full_model_name.lower():
             return _generate_single_page_sync(prompt, content_image_base64, style_image_base64, "models/gemini-3-pro-image-preview")
+        raise
 
-    return "https://via.placeholder.com/600x800.png?text=Generation+Failed"
+    # 이미지 없이 끝난 경우 (호출 측에서 대체 페이지로 채움)
+    return None
@@ -2,24 +2,56 @@
 나노바나나(Nanobanana) API를 사용한 청첩장 생성 (Local Tuning Mode)
 Gemini 3.0 Pro Image Preview 모델을 사용하여 로컬에서 프롬프트 튜닝을 진행합니다.
 이미지는 S3에 저장됩니다.
+
+페이지 프롬프트는 기본으로 prompts/nanobanana_page{1,2,3}.md 를 쓰고, 요청에 border_design_id 가 있으면
+prompts/nanobanana/ 구조화 템플릿을 PromptLoader 로 조립합니다 (선택한 테두리 사양/톤 팔레트 조각만 포함).
+
+렌더링 방식 (RENDER_MODE, 요청별로 render_mode 로 바꿀 수 있음):
+    model  : 3페이지 모두 이미지 모델이 글자까지 그림 (기본, 모델 호출 3회)
+    hybrid : 1페이지(커버)만 모델이 그리고, 2/3페이지는 모델이 만든 글자 없는 배경 위에
+             utils/typesetting.py 가 문구/날짜/지도를 직접 조판 (모델 호출 2회, 배경 캐시 적중 시 1회).
+             커버와 배경은 공유 캐시("render")에 남아 문구만 고친 재렌더링은 모델 호출 없이 끝납니다.
+             한글 글꼴이 없으면 model 로 돌아갑니다.
+
+페이지 생성이 실패하면(모델 오류, 이미지 없음) 빠뜨리지 않고 utils/degraded.py 의 대체 페이지를 넣고
+결과에 "degraded": true 를 표시합니다. 한 번 모델 호출 오류가 나면 같은 요청의 남은 페이지는 모델을
+다시 부르지 않고 바로 대체합니다 (장애 중 부하를 키우지 않도록). 문구 생성이 실패하면 기본 문구를 씁니다.
+
+서버가 붐비면 utils/admission.py 의 브라운아웃 단계에 따라 이미지 해상도를 1K 로 낮추고(1단계),
+지도를 생략하고(2단계), hybrid 로 렌더링합니다(3단계).
+
+스타일 이미지는 utils/style_features.py 로 스타일별 한 번만 분석(대표 색 팔레트, 밝기/대비/채도/질감)해
+페이지 프롬프트 끝에 짧은 설명문으로 붙입니다. STYLE_IMAGE_PAGES=first 면 설명문이 있을 때
+2/3페이지 호출에는 스타일 이미지를 보내지 않습니다 (이전 페이지 결과가 이미 스타일을 담고 있음).
+
+환경 변수:
+    RENDER_MODE        : model (기본) 또는 hybrid
+    HYBRID_BACKGROUND  : model (기본, 스타일 이미지로 배경 생성) 또는 style (스타일 이미지를 그대로 배경으로, 모델 호출 1회)
+    STYLE_DESCRIPTOR   : on (기본) 또는 off - 스타일 분석 설명문을 프롬프트에 붙임
+    STYLE_IMAGE_PAGES  : all (기본, 모든 페이지에 스타일 이미지) 또는 first (1페이지에만)
 """
 
 import os
 import json
 import base64
+import hashlib
 import time
-from typing import Dict, List
-import requests
+from typing import Callable, Dict, List, Optional
 import uuid
-import ssl
 import certifi
-import boto3
 from dotenv import load_dotenv
-from google.genai import types, Client
-from PIL import Image
 import io
 
-from utils.genai_client import get_genai_client, parse_json_response
+from utils import admission, context_cache, degraded, memory, style_assets, style_features, typesetting
+from utils.aws import get_s3_client
+from utils.genai_client import get_genai_client, iter_inline_images, parse_json_response, use_client
+from utils.log import get_logger
+from utils.prompt_loader import NanobananaPromptBuilder, read_text_cached
+from utils.shared_cache import shared_cache
+from utils.singleflight import SingleFlight
+from utils.tracing import record_response, span
+
+logger = get_logger(__name__)
 
 # .env 파일 로드
 load_dotenv()
@@ -37,7 +69,56 @@ S3_BUCKET = os.environ.get('S3_BUCKET')
 S3_REGION = os.environ.get('S3_REGION', 'ap-northeast-2')
 CLOUD_FRONT_DOMAIN = os.environ.get('CLOUD_FRONT_DOMAIN')
 
-s3_client = boto3.client('s3', region_name=S3_REGION)
+# boto3 클라이언트는 import 시점이 아니라 첫 업로드 때 생성
+s3_client = None
+
+# 모델 / 프롬프트 (pipeline_version() 으로 결과 캐시 키에 반영)
+TEXT_MODEL = 'gemini-2.0-flash-exp'
+IMAGE_MODEL = 'gemini-3-pro-image-preview'
+PAGE_PROMPT_FILES = ["nanobanana_page1.md", "nanobanana_page2.md", "nanobanana_page3.md"]
+BACKGROUND_PROMPT_FILE = "nanobanana_background.md"
+RENDER_MODE = os.environ.get("RENDER_MODE", "model").lower()
+HYBRID_BACKGROUND = os.environ.get("HYBRID_BACKGROUND", "model").lower()
+STYLE_DESCRIPTOR = os.environ.get("STYLE_DESCRIPTOR", "on").lower() not in ("off", "0", "false")
+STYLE_IMAGE_PAGES = os.environ.get("STYLE_IMAGE_PAGES", "all").lower()
+TEXT_PROMPT_TEMPLATE = """
+    당신은 한국의 전문 청첩장 작가입니다.
+
+    다음 정보로 청첩장 문구를 생성해주세요:
+    - 톤: {tone}
+    - 신랑: {groom_name}
+    - 신부: {bride_name}
+    - 예식장: {venue}
+    - 날짜: {wedding_date} {wedding_time}
+
+    다음 3가지 문구를 생성하고, JSON 형식으로만 답변하세요:
+    1. greeting: 인사말 (2-3문장, 100-150자)
+    2. invitation: 초대 문구 (2문장, 80-120자)
+    3. location: 장소 안내 (1-2문장, 50-80자)
+
+    JSON 형식:
+    {{
+      "greeting": "인사말 내용",
+      "invitation": "초대 문구 내용",
+      "location": "장소 안내 내용"
+    }}
+    """
+
+# 같은 문구/지도 요청이 동시에 들어오면 한 번만 호출
+_text_flight = SingleFlight("text_generate")
+_map_flight = SingleFlight("map_fetch")
+_background_flight = SingleFlight("background_generate")
+
+# 테두리를 지정한 요청의 구조화 페이지 프롬프트 (prompts/nanobanana/)
+_prompt_builder = NanobananaPromptBuilder()
+
+
+def _get_s3_client():
+    """S3 클라이언트 (첫 업로드 시 생성, 테스트/벤치마크에서는 s3_client 를 바꿔 끼움)"""
+    global s3_client
+    if s3_client is None:
+        s3_client = get_s3_client(S3_REGION)
+    return s3_client
 
 
 def save_to_s3(image_bytes: bytes, file_type: str = "invitation") -> str:
@@ -55,12 +136,13 @@ def save_to_s3(image_bytes: bytes, file_type: str = "invitation") -> str:
     filename = f"invitations/{file_type}_{timestamp}_{uuid.uuid4().hex[:8]}.png"
 
     buffer = io.BytesIO(image_bytes)
-    s3_client.upload_fileobj(
-        buffer,
-        S3_BUCKET,
-        filename,
-        ExtraArgs={"ContentType": "image/png"}
-    )
+    with span("storage.upload", backend="s3", key=filename, bytes_in=len(image_bytes)):
+        _get_s3_client().upload_fileobj(
+            buffer,
+            S3_BUCKET,
+            filename,
+            ExtraArgs={"ContentType": "image/png"}
+        )
 
     return f"{CLOUD_FRONT_DOMAIN}/{filename}"
 
@@ -79,41 +161,44 @@ def generate_wedding_texts_with_gemini(
     """
 
     # 프롬프트 생성
-    prompt = f"""
-    당신은 한국의 전문 청첩장 작가입니다.
+    prompt = TEXT_PROMPT_TEMPLATE.format(
+        tone=tone,
+        groom_name=groom_name,
+        bride_name=bride_name,
+        venue=venue,
+        wedding_date=wedding_date,
+        wedding_time=wedding_time,
+    )
 
-    다음 정보로 청첩장 문구를 생성해주세요:
-    - 톤: {tone}
-    - 신랑: {groom_name}
-    - 신부: {bride_name}
-    - 예식장: {venue}
-    - 날짜: {wedding_date} {wedding_time}
+    # 공유 캐시 (TEXT_CACHE_TTL 설정 시에만 저장됨)
+    cache_key = f"{TEXT_MODEL}\n{prompt}"
+    cached = shared_cache.get_json("text", cache_key)
+    if cached is not None:
+        return cached
 
-    다음 3가지 문구를 생성하고, JSON 형식으로만 답변하세요:
-    1. greeting: 인사말 (2-3문장, 100-150자)
-    2. invitation: 초대 문구 (2문장, 80-120자)
-    3. location: 장소 안내 (1-2문장, 50-80자)
+    texts, _ = _text_flight.do(cache_key, _generate_texts, prompt, cache_key)
+    return texts
 
-    JSON 형식:
-    {{
-      "greeting": "인사말 내용",
-      "invitation": "초대 문구 내용",
-      "location": "장소 안내 내용"
-    }}
-    """
 
+def _generate_texts(prompt: str, cache_key: str) -> Dict:
     # Gemini API 호출
+    from google.genai import types
+
     client = get_genai_client()
-    response = client.models.generate_content(
-        model='gemini-2.0-flash-exp',
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json"
-        ),
-    )
+    with span("text.generate", model=TEXT_MODEL, bytes_in=len(prompt)):
+        response = client.models.generate_content(
+            model=TEXT_MODEL,
+            contents=[prompt],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json"
+            ),
+        )
+        record_response(response)
 
-    # JSON 파싱
-    return parse_json_response(response)
+        # JSON 파싱
+        texts = parse_json_response(response)
+    shared_cache.set_json("text", cache_key, texts)
+    return texts
 
 
 def generate_invitation_with_nanobanana(
@@ -140,70 +225,133 @@ def generate_invitation_with_nanobanana(
     prompt_override_1: str = None,
     prompt_override_2: str = None,
     prompt_override_3: str = None,
+    render_mode: str = None,
+    texts: Dict[str, str] = None,
+    border_design_id: str = None,
 ) -> Dict[str, any]:
     """
     Gemini 3 Pro Image Preview 사용하여 3장의 청첩장 이미지 생성 및 로컬 저장
     (각 페이지별 프롬프트 적용)
+
+    render_mode 가 hybrid 면 2/3페이지는 로컬에서 조판합니다 (모듈 docstring 참고).
+    texts 를 주면 문구 생성을 건너뛰고 그 문구를 씁니다 (사용자가 고친 문구로 재렌더링).
+    border_design_id 를 주면 페이지 프롬프트를 prompts/nanobanana/ 구조화 템플릿으로 조립합니다
+    (프롬프트 override 가 있는 페이지는 override 우선).
     """
 
-    print("=" * 80)
-    print("청첩장 생성 (Local Tuning Mode) 시작...")
-    print("=" * 80)
+    logger.info("청첩장 생성 (Local Tuning Mode) 시작")
+
+    load = admission.brownout()
+    hybrid = (render_mode or RENDER_MODE).lower() == "hybrid" or load.hybrid
+    if load.level:
+        logger.info("brownout", extra={"fields": {"level": load.level, "image_size": load.image_size}})
+    if hybrid and not typesetting.available():
+        logger.warning("no Hangul font for hybrid rendering, falling back to model rendering")
+        hybrid = False
+
+    style_descriptor = _style_descriptor(style_image_base64)
+
+    degraded_pages = 0
+    info = {
+        "groom_name": groom_name,
+        "bride_name": bride_name,
+        "groom_father": groom_father,
+        "groom_mother": groom_mother,
+        "bride_father": bride_father,
+        "bride_mother": bride_mother,
+        "venue": venue,
+        "address": venue_address,
+        "wedding_date": wedding_date,
+        "wedding_time": wedding_time,
+    }
 
     # 1. Gemini로 문구 생성
-    print("\n[1/4] Gemini로 문구 생성 중...")
-    texts = generate_wedding_texts_with_gemini(
-        tone=tone,
-        groom_name=groom_name,
-        bride_name=bride_name,
-        venue=venue,
-        wedding_date=wedding_date,
-        wedding_time=wedding_time
-    )
-    print(f"✓ 문구 생성 완료")
+    text_failed = False
+    if texts:
+        logger.info("[1/4] 전달받은 문구 사용")
+    else:
+        logger.info("[1/4] Gemini로 문구 생성 중")
+        try:
+            texts = generate_wedding_texts_with_gemini(
+                tone=tone,
+                groom_name=groom_name,
+                bride_name=bride_name,
+                venue=venue,
+                wedding_date=wedding_date,
+                wedding_time=wedding_time
+            )
+        except Exception as e:
+            if not degraded.ENABLED:
+                raise
+            logger.warning("text generation failed, using fallback texts", extra={"fields": {"error": str(e)}})
+            texts = degraded.fallback_texts(groom_name, bride_name, venue)
+            text_failed = True
+        logger.info("[1/4] 문구 생성 완료")
 
     # 2. 지도 이미지 생성 (Google Maps Static API)
     map_image_base64 = None
-    if venue_latitude and venue_longitude:
-        print("\n[2/4] 지도 이미지 생성 중...")
+    if load.skip_map:
+        logger.info("[2/4] 브라운아웃 - 지도 생략")
+    elif venue_latitude and venue_longitude:
+        logger.info("[2/4] 지도 이미지 생성 중")
         map_image_base64 = _generate_map_image(venue_latitude, venue_longitude, venue)
-        print(f"✓ 지도 생성 완료")
+        memory.track("map_b64", len(map_image_base64 or ""))
+        logger.info("[2/4] 지도 생성 완료", extra={"fields": {"map": map_image_base64 is not None}})
     else:
-        print("\n[2/4] 지도 정보 없음 - 스킵")
+        logger.info("[2/4] 지도 정보 없음 - 스킵")
 
     # 3. Gemini 3 Pro로 이미지 생성 (3회 반복)
-    print("\n[3/4] Gemini 3 Pro (Nanobanana Sim)로 청첩장 이미지 생성 중...")
+    logger.info("[3/4] Gemini 3 Pro (Nanobanana Sim)로 청첩장 이미지 생성 중")
     
     pages = []
     page_types = ["cover", "content", "location"]
     
     # 각 페이지별 프롬프트 및 Override 처리
-    prompt_files = ["nanobanana_page1.md", "nanobanana_page2.md", "nanobanana_page3.md"]
+    prompt_files = PAGE_PROMPT_FILES
     prompt_overrides = [prompt_override_1, prompt_override_2, prompt_override_3]
     
     previous_generated_image_bytes = None
-    
-    for i in range(3):
-        print(f"\n  --- Page {i+1} Generation ---")
+    # 모델 호출 오류가 한 번 나면 남은 페이지는 바로 대체 페이지로
+    model_down = False
+
+    # hybrid 에서는 커버만 모델로 생성
+    for i in range(1 if hybrid else 3):
+        logger.debug("page generation start", extra={"fields": {"page": i + 1}})
         
         # 프롬프트 로드
-        if prompt_overrides[i]:
-            print(f"  Using Overridden Prompt for Page {i+1}")
-            prompt_template = prompt_overrides[i]
+        if border_design_id and not prompt_overrides[i]:
+            # 테두리 지정 시 구조화 템플릿 (선택한 테두리 사양/톤 팔레트만 남겨 조립, utils/prompt_loader.py)
+            formatted_prompt = _structured_page_prompt(i + 1, border_design_id, tone, texts, info)
         else:
-            prompt_template = _load_prompt_file(prompt_files[i])
-            
-        # 프롬프트 포맷팅
-        formatted_prompt = prompt_template.format(
-            groom_name=groom_name,
-            bride_name=bride_name,
-            texts=texts,
-            venue=venue,
-            venue_address=venue_address,
-            wedding_date=wedding_date,
-            wedding_time=wedding_time,
-            tone=tone
-        )
+            if prompt_overrides[i]:
+                logger.info("using overridden prompt", extra={"fields": {"page": i + 1}})
+                prompt_template = prompt_overrides[i]
+            else:
+                prompt_template = _load_prompt_file(prompt_files[i])
+
+            # 프롬프트 포맷팅
+            formatted_prompt = prompt_template.format(
+                groom_name=groom_name,
+                bride_name=bride_name,
+                texts=texts,
+                venue=venue,
+                venue_address=venue_address,
+                wedding_date=wedding_date,
+                wedding_time=wedding_time,
+                tone=tone
+            )
+        if style_descriptor:
+            formatted_prompt += "\n" + style_descriptor
+
+        # hybrid: 같은 사진/스타일/프롬프트로 만든 커버가 있으면 재사용 (문구만 고친 재렌더링)
+        cover_key = None
+        if hybrid:
+            cover_key = _render_key("cover", formatted_prompt, wedding_image_base64, style_image_base64, load.image_size)
+            cached_cover = shared_cache.get_json("render", cover_key)
+            if cached_cover is not None:
+                pages.append({"page_number": 1, "image_url": cached_cover["image_url"], "type": page_types[0]})
+                logger.info("cover reused", extra={"fields": {"url": cached_cover["image_url"]}})
+                continue
 
         # 이미지 입력 로직 (Sequential Editing)
         # Page 1: Wedding Photo + Style Image
@@ -218,56 +366,327 @@ def generate_invitation_with_nanobanana(
         else:
             # 이후 페이지: 이전 단계 결과물 사용 (bytes -> base64)
             if previous_generated_image_bytes:
-                input_image_arg = base64.b64encode(previous_generated_image_bytes).decode('utf-8')
+                with span("image.encode", page=i + 1, bytes_in=len(previous_generated_image_bytes)):
+                    input_image_arg = base64.b64encode(previous_generated_image_bytes).decode('utf-8')
             else:
                 # 이전 단계 실패 시...? 웨딩 사진으로 폴백하거나 중단?
                 # 사용자 요청: "첫번째 이미지 생성때 사용한 Wedding Photo는 두번째, 세번째에는 입력하지 않을꺼야"
                 # 따라서 이전 단계 없으면 입력 이미지 없이 진행
                 input_image_arg = None
+        memory.track("input_b64", len(input_image_arg or "") if i > 0 else 0)
+
+        # 2/3페이지: 설명문이 있고 이전 페이지가 있으면 스타일 이미지 생략 가능 (STYLE_IMAGE_PAGES=first)
+        page_style_image = style_image_base64
+        if i > 0 and STYLE_IMAGE_PAGES == "first" and style_descriptor and input_image_arg:
+            page_style_image = None
 
         # Gemini 3 Pro Image Preview는 num_images=1로 호출
-        generated_images = _call_gemini_image_api(
-            prompt=formatted_prompt,
-            wedding_image_base64=input_image_arg, # 여기가 핵심 변경 (웨딩사진 or 이전결과물)
-            style_image_base64=style_image_base64, # 스타일 이미지는 항상 사용
-            map_image_base64=map_image_base64 if i == 2 else None, # 3페이지 지도 사용
-            num_images=1
-        )
+        # 이미지가 스트림으로 도착하는 즉시 S3 업로드
+        uploaded_urls = []
+        generated_images = []
+        if not model_down:
+            try:
+                with span("page.generate", page=i + 1, page_type=page_types[i]):
+                    generated_images = _call_gemini_image_api(
+                        prompt=formatted_prompt,
+                        wedding_image_base64=input_image_arg, # 여기가 핵심 변경 (웨딩사진 or 이전결과물)
+                        style_image_base64=page_style_image, # 스타일 이미지 (STYLE_IMAGE_PAGES=first 면 1페이지만)
+                        map_image_base64=map_image_base64 if i == 2 else None, # 3페이지 지도 사용
+                        num_images=1,
+                        image_size=load.image_size,
+                        # 업로드 실패는 모델 장애가 아니므로 여기서 삼키고 URL 자리에 None
+                        on_image=lambda data, page=i + 1: uploaded_urls.append(
+                            _upload_page(data, f"nanobanana-page{page}", page)
+                        )
+                    )
+            except Exception as e:
+                if not degraded.ENABLED:
+                    raise
+                logger.warning("page model call failed", extra={"fields": {"page": i + 1, "error": str(e)}})
+                model_down = True
+            finally:
+                # 호출 안에서 디코딩한 입력 이미지는 여기서 해제됨
+                memory.track("decode", 0)
         
         if generated_images:
             image_bytes = generated_images[0]
-            image_url = save_to_s3(image_bytes, f"nanobanana-page{i+1}")
+            image_url = uploaded_urls[0] if uploaded_urls else None
+            storage_failed = image_url is None
+            if storage_failed:
+                # 생성은 성공했으니 한 번 더 올려 보고, 그래도 실패하면 placeholder (다음 페이지 체인은 유지)
+                image_url = _upload_page(image_bytes, f"nanobanana-page{i + 1}", i + 1)
+                if image_url is None:
+                    degraded.mark("nanobanana", "storage_error")
+                    image_url = _placeholder_url("storage_error")
+                    degraded_pages += 1
+                else:
+                    storage_failed = False
             
             # 다음 단계를 위해 저장
             previous_generated_image_bytes = image_bytes
+            memory.track("previous_page", len(image_bytes))
             
             pages.append({
                 "page_number": i + 1,
                 "image_url": image_url,
-                "type": page_types[i]
+                "type": page_types[i],
+                **({"degraded": True} if storage_failed else {}),
             })
-            print(f"  ✓ Page {i+1} Saved: {image_url}")
+            logger.info("page saved", extra={"fields": {"page": i + 1, "url": image_url, "bytes": len(image_bytes)}})
+            if cover_key and not storage_failed:
+                shared_cache.set_json("render", cover_key, {"image_url": image_url})
         else:
-            print(f"  ❌ Page {i+1} Generation Failed")
+            logger.warning("page generation failed", extra={"fields": {"page": i + 1}})
             previous_generated_image_bytes = None # 실패 시 체인 끊김 (다음 단계는 입력 이미지 없이 진행)
+            memory.track("previous_page", 0)
+            if degraded.ENABLED:
+                pages.append(_degraded_page(
+                    i + 1, page_types[i], "model_error" if model_down else "no_image",
+                    style_image_base64, tone, texts, info,
+                    photo_base64=wedding_image_base64 if i == 0 else None,
+                    map_image_base64=map_image_base64 if i == 2 else None,
+                ))
+                degraded_pages += 1
+
+    if hybrid:
+        logger.info("[4/4] 2/3페이지 로컬 조판 중")
+        background = _hybrid_background(style_image_base64, tone, use_model=not model_down,
+                                         style_descriptor=style_descriptor)
+        composed = _compose_pages(
+            background,
+            texts,
+            groom_name=groom_name,
+            bride_name=bride_name,
+            groom_father=groom_father,
+            groom_mother=groom_mother,
+            bride_father=bride_father,
+            bride_mother=bride_mother,
+            venue=venue,
+            venue_address=venue_address,
+            wedding_date=wedding_date,
+            wedding_time=wedding_time,
+            map_image_base64=map_image_base64,
+        )
+        pages.extend(composed)
+        degraded_pages += sum(1 for page in composed if page.get("degraded"))
 
-    print("\n" + "=" * 80)
-    print("청첩장 생성 완료!")
-    print("=" * 80)
+    logger.info("청첩장 생성 완료", extra={"fields": {"pages": len(pages), "degraded_pages": degraded_pages}})
 
     return {
         "pages": pages,
-        "texts": texts
-    }  
+        "texts": texts,
+        "degraded": bool(degraded_pages) or text_failed,
+    }
+
+
+def _degraded_page(page: int, page_type: str, reason: str, style_image_base64: Optional[str], tone: str,
+                   texts: Dict, info: Dict, photo_base64: Optional[str] = None,
+                   map_image_base64: Optional[str] = None) -> Dict:
+    """모델 대신 로컬에서 그린 대체 페이지 (utils/degraded.py)"""
+    def decode(value: Optional[str]) -> Optional[bytes]:
+        return base64.b64decode(value) if value else None
+
+    image_bytes = degraded.render_page(
+        page_type,
+        style_image=decode(style_image_base64),
+        tone=tone,
+        texts=texts,
+        photo=decode(photo_base64),
+        map_image=decode(map_image_base64),
+        page=page,
+        **info,
+    )
+    degraded.mark("nanobanana", reason)
+    # 저장소도 장애면 요청 전체를 실패시키지 않도록 placeholder
+    image_url = _upload_page(image_bytes, f"nanobanana-page{page}-degraded", page) or _placeholder_url(reason)
+    return {"page_number": page, "image_url": image_url, "type": page_type, "degraded": True}
+
+
+def _upload_page(image_bytes: bytes, file_type: str, page: int) -> Optional[str]:
+    """페이지 이미지 S3 업로드, 실패하면 경고만 남기고 None"""
+    try:
+        return save_to_s3(image_bytes, file_type)
+    except Exception as e:
+        logger.warning("page upload failed", extra={"fields": {"page": page, "error": str(e)}})
+        return None
+
+
+def _placeholder_url(reason: str) -> str:
+    label = "Generation+Error" if reason == "model_error" else "Generation+Failed"
+    return f"https://via.placeholder.com/600x800.png?text={label}"
+
+def pipeline_version() -> Dict[str, object]:
+    """
+    생성 결과에 영향을 주는 모델 id 와 프롬프트 템플릿 버전(내용 해시)
+
+    프롬프트 파일이나 모델이 바뀌면 값이 달라지므로 전체 결과 캐시가 자동으로 무효화됩니다.
+    """
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    return {
+        "text_model": TEXT_MODEL,
+        "image_model": IMAGE_MODEL,
+        "text_prompt": digest(TEXT_PROMPT_TEMPLATE),
+        "page_prompts": [digest(_load_prompt_file(name)) for name in PAGE_PROMPT_FILES],
+        "render_mode": RENDER_MODE,
+        "background": [HYBRID_BACKGROUND, digest(_load_prompt_file(BACKGROUND_PROMPT_FILE))],
+        "typesetting": typesetting.VERSION,
+        "style_features": [style_features.VERSION if STYLE_DESCRIPTOR and style_features.ENABLED else None,
+                           STYLE_IMAGE_PAGES],
+    }
+
+
+def _style_descriptor(style_image_base64: Optional[str]) -> Optional[str]:
+    """스타일 이미지 분석 설명문 (스타일 해시별 캐시, 끄거나 분석 불가면 None)"""
+    if not STYLE_DESCRIPTOR or not style_features.ENABLED or not style_image_base64:
+        return None
+    try:
+        features = style_features.features_for(base64.b64decode(style_image_base64))
+    except Exception as e:
+        logger.warning("style analysis failed", extra={"fields": {"error": str(e)}})
+        return None
+    return features.prompt_descriptor() if features else None
+
+
+def _structured_page_prompt(page: int, border_design_id: str, tone: str, texts: Dict, info: Dict) -> str:
+    """prompts/nanobanana/ 구조화 템플릿 (선택한 테두리 사양/톤 팔레트 조각만 포함)"""
+    if page == 1:
+        return _prompt_builder.build_page1_prompt(
+            groom_name=info["groom_name"],
+            bride_name=info["bride_name"],
+            border_design_id=border_design_id,
+        )
+    if page == 2:
+        return _prompt_builder.build_page2_prompt(
+            greeting_text=texts.get("greeting", ""),
+            invitation_text=texts.get("invitation", ""),
+            groom_name=info["groom_name"],
+            bride_name=info["bride_name"],
+            groom_father=info["groom_father"],
+            groom_mother=info["groom_mother"],
+            bride_father=info["bride_father"],
+            bride_mother=info["bride_mother"],
+            border_design_id=border_design_id,
+            tone=tone,
+        )
+    return _prompt_builder.build_page3_prompt(
+        wedding_date=info["wedding_date"],
+        wedding_time=info["wedding_time"],
+        venue=info["venue"],
+        address=info["address"],
+        floor_hall="",
+        border_design_id=border_design_id,
+    )
+
+
+def _render_key(kind: str, *parts: str) -> str:
+    """hybrid 커버/배경 공유 캐시 키 (모델 + 프롬프트 + 입력 이미지)"""
+    digest = hashlib.sha256()
+    for part in (IMAGE_MODEL, *parts):
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return f"{kind}:{digest.hexdigest()}"
+
+
+def _hybrid_background(style_image_base64: str, tone: str, use_model: bool = True,
+                       style_descriptor: Optional[str] = None) -> Optional[bytes]:
+    """
+    2/3페이지 공통 배경 (글자 없는 스타일 배경)
+
+    스타일/톤/프롬프트가 같으면 공유 캐시의 배경을 재사용하고, 동시 요청은 한 번만 생성합니다.
+    생성에 실패하면(또는 use_model=False 인데 캐시에 없으면) 스타일 이미지를 그대로 배경으로 씁니다.
+    """
+    style_bytes = base64.b64decode(style_image_base64) if style_image_base64 else None
+    if HYBRID_BACKGROUND == "style" or style_bytes is None:
+        return style_bytes
+
+    prompt = _load_prompt_file(BACKGROUND_PROMPT_FILE).format(tone=tone)
+    if style_descriptor:
+        prompt += "\n" + style_descriptor
+    key = _render_key("background", prompt, hashlib.sha256(style_bytes).hexdigest())
+    cached = shared_cache.get("render", key)
+    if cached is not None:
+        return cached
+    if not use_model:
+        return style_bytes
+
+    background, _ = _background_flight.do(key, _generate_background, key, prompt, style_image_base64)
+    return background or style_bytes
+
+
+def _generate_background(key: str, prompt: str, style_image_base64: str) -> Optional[bytes]:
+    try:
+        with span("page.generate", page=0, page_type="background"):
+            images = _call_gemini_image_api(
+                prompt=prompt,
+                wedding_image_base64=None,
+                style_image_base64=style_image_base64,
+                map_image_base64=None,
+                num_images=1,
+            )
+    except Exception as e:
+        logger.warning("background generation failed, using style image", extra={"fields": {"error": str(e)}})
+        return None
+    if not images:
+        return None
+    shared_cache.set("render", key, images[0])
+    return images[0]
+
+
+def _compose_pages(background: Optional[bytes], texts: Dict, map_image_base64: Optional[str], **info: str) -> List[Dict]:
+    """hybrid: 배경 위에 2/3페이지를 조판해 저장"""
+    renders = [
+        (2, "content", lambda: typesetting.render_content_page(
+            background,
+            greeting=texts.get("greeting", ""),
+            invitation=texts.get("invitation", ""),
+            groom_name=info["groom_name"],
+            bride_name=info["bride_name"],
+            groom_father=info["groom_father"] or "",
+            groom_mother=info["groom_mother"] or "",
+            bride_father=info["bride_father"] or "",
+            bride_mother=info["bride_mother"] or "",
+        )),
+        (3, "location", lambda: typesetting.render_location_page(
+            background,
+            wedding_date=info["wedding_date"],
+            wedding_time=info["wedding_time"],
+            venue=info["venue"],
+            address=info["venue_address"],
+            location_text=texts.get("location", ""),
+            map_image=base64.b64decode(map_image_base64) if map_image_base64 else None,
+        )),
+    ]
+
+    # 조판 캔버스 (배경 맞춤 + 작업본, RGB)
+    memory.track("compose", typesetting.PAGE_SIZE[0] * typesetting.PAGE_SIZE[1] * 3 * 2)
+    pages = []
+    for page, page_type, render in renders:
+        try:
+            image_bytes = render()
+        except Exception as e:
+            logger.warning("page compose failed", extra={"fields": {"page": page, "error": str(e)}})
+            continue
+        image_url = _upload_page(image_bytes, f"nanobanana-page{page}", page)
+        if image_url is None:
+            degraded.mark("nanobanana", "storage_error")
+            pages.append({"page_number": page, "image_url": _placeholder_url("storage_error"),
+                          "type": page_type, "degraded": True})
+            continue
+        pages.append({"page_number": page, "image_url": image_url, "type": page_type})
+        logger.info("page saved", extra={"fields": {"page": page, "url": image_url, "bytes": len(image_bytes), "composed": True}})
+    memory.track("compose", 0)
+    return pages
+
 
 def _load_prompt_file(filename: str) -> str:
     """prompts 폴더에서 특정 파일 로드"""
     prompt_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", filename)
     try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return read_text_cached(prompt_path)
     except FileNotFoundError:
-        print(f"⚠️ Prompt file not found: {prompt_path}")
+        logger.warning("prompt file not found", extra={"fields": {"path": prompt_path}})
         return ""
 
 
@@ -280,7 +699,7 @@ def _load_prompt_template() -> str:
         with open(prompt_path, "r", encoding="utf-8") as f:
             return f.read()
     except FileNotFoundError:
-        print(f"⚠️ 프롬프트 파일을 찾을 수 없습니다: {prompt_path}")
+        logger.warning("프롬프트 파일을 찾을 수 없습니다", extra={"fields": {"path": prompt_path}})
         return "" # 기본값 또는 에러 처리
 
 
@@ -289,109 +708,137 @@ def _call_gemini_image_api(
     wedding_image_base64: str,
     style_image_base64: str,
     map_image_base64: str,
-    num_images: int = 3
+    num_images: int = 3,
+    on_image: Optional[Callable[[bytes], None]] = None,
+    image_size: str = "2K",
 ) -> List[bytes]:
     """
     Gemini 3 Pro Image Preview API를 사용하여 이미지 생성
+
+    generate_content_stream 으로 응답을 받아 이미지 파트가 도착하는 즉시
+    on_image(저장소 writer)에 넘기고, 텍스트 파트는 바로 버립니다.
+    전체 응답 객체를 메모리에 들고 있지 않으며 num_images장을 받으면 스트림을 닫습니다.
+
+    Args:
+        prompt: 페이지 프롬프트
+        wedding_image_base64: 입력 이미지 (웨딩 사진 또는 이전 페이지 결과물)
+        style_image_base64: 스타일 참조 이미지 (Files API 에 한 번 올려 file URI 로 참조, utils/style_assets.py)
+        map_image_base64: 지도 이미지 (3페이지)
+        num_images: 받을 최대 이미지 수
+        on_image: 이미지가 도착할 때마다 호출할 콜백 (예: S3 업로드)
+        image_size: 출력 해상도 ("2K", 브라운아웃 시 "1K")
+
+    Returns:
+        List[bytes]: 생성된 이미지 바이트 목록
     """
     
-    client = get_genai_client()
-    
-    # Base64 문자열을 PIL Image 호환 객체로 변환 (Gemini Client가 처리 가능할 수도 있지만, 안전하게)
-    def decode_base64_to_image(b64_str):
-        if not b64_str: return None
-        return Image.open(io.BytesIO(base64.b64decode(b64_str)))
-
-    wedding_img = decode_base64_to_image(wedding_image_base64)
-    style_img = decode_base64_to_image(style_image_base64)
-    map_img = decode_base64_to_image(map_image_base64)
-    
-    # contents 구성
-    contents = [prompt]
-    if wedding_img: contents.append(wedding_img)
-    if style_img: contents.append(style_img)
-    if map_img: contents.append(map_img)
+    from google.genai import types
+    from PIL import Image
 
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp', # gemini-3-pro-image-preview가 아직 정식 SDK에 없을 수 있음, 우선 사용자 요청대로 config 설정 시도하거나 flash 사용
-            # 사용자 요청은 'gemini-3-pro-image-preview' 사용임.
-            # SDK 버전 호환성 고려하여 model string 그대로 사용
-            # 만약 에러 발생하면 gemini-2.0-flash-exp 등으로 fallback 고려
-            contents=contents,
-            config=types.GenerateContentConfig(
-                response_modalities=['IMAGE'], # 텍스트 제외하고 이미지만 요청
-                image_config=types.ImageConfig(
-                    aspect_ratio="3:4",
-                    image_size="2K"
-                ),
-                candidate_count=num_images # 한 번에 여러 장 생성 요청 (지원 모델의 경우)
+    client = get_genai_client()
+    # 업로드 파일/컨텍스트 캐시는 키(프로젝트)별이므로 이 호출 동안 같은 키 사용 (utils/genai_client.py)
+    with use_client(client):
+        # Base64 문자열을 PIL Image 호환 객체로 변환 (Gemini Client가 처리 가능할 수도 있지만, 안전하게)
+        def decode_base64_to_image(b64_str):
+            if not b64_str: return None
+            return Image.open(io.BytesIO(base64.b64decode(b64_str)))
+
+        with span("image.decode", bytes_in=sum(len(b) for b in (wedding_image_base64, map_image_base64) if b)):
+            wedding_img = decode_base64_to_image(wedding_image_base64)
+            map_img = decode_base64_to_image(map_image_base64)
+        # SDK 가 요청을 만들 때 픽셀을 펼침 (호출 측에서 해제 기록)
+        memory.track("decode", memory.image_bytes(wedding_img) + memory.image_bytes(map_img))
+
+        # 스타일 이미지는 페이지마다 같으므로 업로드해 둔 파일을 참조 (실패 시 인라인)
+        style_bytes = base64.b64decode(style_image_base64) if style_image_base64 else None
+        style_part = style_assets.registry.part_for_bytes(style_bytes) if style_bytes else None
+
+        # contents 구성
+        contents = [prompt]
+        if wedding_img: contents.append(wedding_img)
+        if style_part: contents.append(style_part)
+        if map_img: contents.append(map_img)
+
+        config = types.GenerateContentConfig(
+            response_modalities=['TEXT', 'IMAGE'],
+            image_config=types.ImageConfig(
+                aspect_ratio="3:4",
+                image_size=image_size
             )
         )
-        
-        # 모델명을 명시적으로 변경 (사용자 요청 사항 준수)
-        # 위 호출에서 model 파라미터를 수정해야 함.
-        # 아래 재호출 로직으로 대체
-        pass
-    except Exception:
-        pass
 
-    try:
-        print(f"Generating images with gemini-3-pro-image-preview...")
-        
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview', 
-            contents=contents,
-            config=types.GenerateContentConfig(
-                response_modalities=['TEXT', 'IMAGE'],
-                image_config=types.ImageConfig(
-                    aspect_ratio="3:4",
-                    image_size="2K"
-                )
-            )
-        )
-        
-    except Exception as e:
-        print(f"Gemini API 호출 중 오류 발생: {e}")
-        # Retry logic for 500 errors
-        if "500" in str(e) or "INTERNAL" in str(e):
-             print("Retrying Gemini API call due to 500 Error...")
-             import time
-             time.sleep(2)
-             response = client.models.generate_content(
-                model='gemini-3-pro-image-preview', 
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    response_modalities=['TEXT', 'IMAGE'],
-                    image_config=types.ImageConfig(
-                        aspect_ratio="3:4",
-                        image_size="2K"
-                    )
-                )
+        # 같은 스타일이 여러 페이지/요청에서 충분히 재사용되면 컨텍스트 캐시로 보냄 (utils/context_cache.py)
+        def style_prefix() -> Optional[context_cache.Prefix]:
+            if style_part is None:
+                return None
+            return context_cache.Prefix(
+                key=context_cache.prefix_key("style", hashlib.sha256(style_bytes).hexdigest()),
+                contents=[style_part],
+                rest=[c for c in contents if c is not style_part],
+                estimated_tokens=context_cache.IMAGE_TOKENS,
             )
-        else:
-             raise e
 
-    images = []
-    if response.candidates:
-        for i, candidate in enumerate(response.candidates):
-            print(f"Candidate {i} safety ratings: {candidate.safety_ratings}")
-            print(f"Candidate {i} finish reason: {candidate.finish_reason}")
-            
-            for j, part in enumerate(candidate.content.parts):
-                print(f"  Part {j} text: {part.text[:50] if part.text else 'None'}")
-                print(f"  Part {j} inline_data: {part.inline_data.mime_type if part.inline_data else 'None'}, len: {len(part.inline_data.data) if part.inline_data else 0}")
-                
-                if part.inline_data:
-                    # part.inline_data.data is already bytes in the SDK
-                    images.append(part.inline_data.data)
-    
-    # 만약 이미지가 부족하면 추가 생성 (Loop) - 현재는 단순화를 위해 생략하거나 복사
-    # Gemini 2.0 Flash는 한 번에 1장 생성일 수 있음.
-    # 사용자가 무한 루프 튜닝을 원하므로, 3장이 안 되면 반복 호출 로직이 필요할 수 있으나
-    # 우선 1-3장 나오는 대로 반환
-    
-    return images
+        # 500 에러는 1회 재시도 (이미 이미지를 받은 뒤의 오류는 받은 것까지 반환)
+        with span("page.model_call", model=IMAGE_MODEL, retries=0) as call_span:
+            for attempt in range(2):
+                images = []
+                stream = None
+                cached_content = None
+                try:
+                    logger.debug("generate_content_stream start", extra={"fields": {"model": IMAGE_MODEL, "attempt": attempt}})
+                    prefix = style_prefix()
+                    call_contents, call_config, cached_content = context_cache.manager.request(IMAGE_MODEL, prefix, contents, config)
+                    call_span.set(cached_content=cached_content)
+                    stream = client.models.generate_content_stream(
+                        model=IMAGE_MODEL,
+                        contents=call_contents,
+                        config=call_config
+                    )
+                    for data, mime_type in iter_inline_images(stream):
+                        logger.debug("image part received", extra={"fields": {"mime_type": mime_type, "bytes": len(data)}})
+                        call_span.add("bytes_out", len(data))
+                        if on_image:
+                            on_image(data)
+                        images.append(data)
+                        if len(images) >= num_images:
+                            break
+                    call_span.set(images=len(images))
+                    return images
+
+                except Exception as e:
+                    logger.warning("Gemini API 호출 중 오류 발생", extra={"fields": {"error": str(e), "attempt": attempt, "images": len(images)}})
+                    if images:
+                        call_span.set(images=len(images))
+                        return images
+                    if attempt == 0 and cached_content is not None and context_cache.is_missing_cache_error(e):
+                        # 컨텍스트 캐시가 만료/삭제됨: 항목을 버리고 재시도
+                        logger.info("context cache missing, retrying")
+                        context_cache.manager.invalidate(IMAGE_MODEL, prefix)
+                        call_span.add("retries")
+                        continue
+                    if attempt == 0 and style_part is not None and style_part.file_data is not None \
+                            and style_assets.is_missing_file_error(e):
+                        # 업로드 파일이 만료/삭제됨: 핸들을 버리고 인라인으로 재시도
+                        logger.info("style asset missing, retrying inline")
+                        style_assets.registry.invalidate(style_bytes)
+                        index = contents.index(style_part)
+                        style_part = style_assets.registry.part_for_bytes(style_bytes, inline=True)
+                        contents[index] = style_part
+                        call_span.add("retries")
+                        continue
+                    if attempt == 0 and ("500" in str(e) or "INTERNAL" in str(e)):
+                        logger.info("retrying Gemini API call after 500 error")
+                        call_span.add("retries")
+                        time.sleep(2)
+                        continue
+                    raise
+
+                finally:
+                    close = getattr(stream, "close", None)
+                    if close:
+                        close()
+
+        return []
 
 
 def _generate_map_image(latitude: str, longitude: str, venue_name: str) -> str:
@@ -401,18 +848,35 @@ def _generate_map_image(latitude: str, longitude: str, venue_name: str) -> str:
 
     google_maps_api_key = os.environ.get('GOOGLE_MAPS_API_KEY')
     if not google_maps_api_key:
-         print("Warning: GOOGLE_MAPS_API_KEY not found.")
+         logger.warning("GOOGLE_MAPS_API_KEY not found")
          return None
 
     # Google Maps Static API
     map_url = f"https://maps.googleapis.com/maps/api/staticmap?center={latitude},{longitude}&zoom=16&size=600x400&markers=color:red%7Clabel:{venue_name[0]}%7C{latitude},{longitude}&key={google_maps_api_key}"
 
+    # 공유 캐시 키에는 API 키가 들어가지 않도록 좌표/예식장명만 사용
+    cache_key = f"{latitude},{longitude},{venue_name}"
+    cached = shared_cache.get("map", cache_key)
+    if cached is not None:
+        return base64.b64encode(cached).decode('utf-8')
+
+    content, _ = _map_flight.do(cache_key, _fetch_map, map_url, cache_key)
+    if content is None:
+        return None
+    return base64.b64encode(content).decode('utf-8')
+
+
+def _fetch_map(map_url: str, cache_key: str) -> Optional[bytes]:
     try:
-        response = requests.get(map_url)
+        import requests
+
+        with span("map.fetch") as s:
+            response = requests.get(map_url)
+            s.set(http_status=response.status_code, bytes_out=len(response.content))
         if response.status_code == 200:
-            map_image_base64 = base64.b64encode(response.content).decode('utf-8')
-            return map_image_base64
+            shared_cache.set("map", cache_key, response.content)
+            return response.content
     except Exception as e:
-        print(f"지도 생성 실패: {e}")
-    
+        logger.warning("지도 생성 실패", extra={"fields": {"error": str(e)}})
+
     return None
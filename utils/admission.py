@@ -0,0 +1,285 @@
+"""
+우선순위 레인 / 부하 차단(load shedding) / 브라운아웃
+
+실서비스 요청(/api/generate-invitation, /api/generate-text)과 프롬프트 튜닝 요청
+(/api/generate-invitation-test)이 같은 워커와 모델 쿼터를 나눠 쓰므로, 경로별 레인마다 동시 실행
+상한을 두고 넘치는 요청은 레인 대기열에서 기다리게 합니다.
+
+- 예상 대기 시간(대기 순번 / 상한 × 최근 처리 시간 EWMA)이 레인의 SLO 를 넘으면 기다리지 않고
+  바로 429 + Retry-After 로 돌려보냅니다. 대기 중 SLO 를 넘겨도 429 입니다.
+- 우선순위가 높은 레인(숫자가 작을수록 높음)에 대기 요청이 있으면 낮은 레인은 바로 429 입니다.
+  튜닝 요청이 실서비스 요청의 자리를 차지하지 않도록.
+- 브라운아웃: 실서비스 레인 포화도((실행 + 대기) / 상한)에 따라 단계를 정하고, 그 요청 동안
+  brownout() 으로 파이프라인에 알려 비용이 큰 작업을 줄입니다 (nanobanana_api.py).
+    1단계: 이미지 해상도 2K → 1K
+    2단계: + 지도 생략
+    3단계: + 2/3페이지 로컬 조판 (hybrid, 모델 호출 3회 → 1~2회)
+
+    ticket = await admission.controller.acquire("/api/generate-invitation")   # 넘치면 Overloaded
+    try:
+        ...  # 이 안에서 admission.brownout().image_size 등 사용
+    finally:
+        ticket.release()
+
+상태는 프로세스 메모리에 있으므로 멀티 워커에서는 워커별로 적용됩니다 (상한도 워커당 값).
+
+환경 변수:
+    ADMISSION          : on (기본) 또는 off
+    ADMISSION_LIMITS   : 레인별 동시 실행 상한 JSON (기본 {"invitation": 16, "text": 32, "test": 4})
+    ADMISSION_SLO      : 레인별 최대 대기 시간(초) JSON (기본 {"invitation": 30, "text": 10, "test": 5})
+    BROWNOUT_LEVELS    : 1/2/3단계 포화도 경계 (기본 "0.75,1.0,1.5", 비우면 브라운아웃 끔)
+                         예: 상한 16 이면 실행 12개부터 1단계, 꽉 차면 2단계, 대기 8개부터 3단계
+"""
+
+import asyncio
+import contextvars
+import json
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+ENABLED = os.environ.get("ADMISSION", "on").lower() not in ("off", "0", "false")
+
+# 경로 → 레인
+LANE_PATHS: Dict[str, str] = {
+    "/api/generate-invitation": "invitation",
+    "/api/generate-text": "text",
+    "/api/generate-invitation-test": "test",
+}
+
+# 레인 기본값: 우선순위, 동시 실행 상한, 최대 대기(초), 처리 시간 초기 추정(초)
+_LANE_DEFAULTS: Dict[str, Tuple[int, int, float, float]] = {
+    "invitation": (0, 16, 30.0, 40.0),
+    "text": (0, 32, 10.0, 3.0),
+    "test": (1, 4, 5.0, 60.0),
+}
+
+# Retry-After 상한 (초)
+_MAX_RETRY_AFTER = 120
+
+
+class Overloaded(Exception):
+    """레인이 넘쳐 요청을 받지 않음 (429 + Retry-After)"""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"lane {lane} overloaded ({reason}), retry after {retry_after}s")
+
+
+@dataclass(frozen=True)
+class Brownout:
+    """요청 하나에 적용할 브라운아웃 단계"""
+
+    level: int = 0
+
+    @property
+    def image_size(self) -> str:
+        return "1K" if self.level >= 1 else "2K"
+
+    @property
+    def skip_map(self) -> bool:
+        return self.level >= 2
+
+    @property
+    def hybrid(self) -> bool:
+        return self.level >= 3
+
+
+_NO_BROWNOUT = Brownout()
+_current_brownout: contextvars.ContextVar[Brownout] = contextvars.ContextVar("brownout", default=_NO_BROWNOUT)
+
+
+def brownout() -> Brownout:
+    """현재 요청의 브라운아웃 단계 (레인 밖이면 0단계)"""
+    return _current_brownout.get()
+
+
+@dataclass
+class Lane:
+    """레인 하나의 상한과 실행/대기 상태 (이벤트 루프 안에서만 사용)"""
+
+    name: str
+    priority: int
+    limit: int
+    slo: float
+    service_time: float
+    running: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+
+    def saturation(self) -> float:
+        return (self.running + len(self.waiters)) / self.limit
+
+    def estimated_wait(self) -> float:
+        """지금 들어오면 자리가 날 때까지 예상 대기 시간"""
+        if self.running < self.limit and not self.waiters:
+            return 0.0
+        return (len(self.waiters) + 1) / self.limit * self.service_time
+
+    def observe(self, seconds: float) -> None:
+        # 처리 시간 EWMA (대기 시간 제외)
+        self.service_time += 0.2 * (seconds - self.service_time)
+
+
+class Ticket:
+    """레인 자리 (본문 전송까지 끝나면 release)"""
+
+    def __init__(self, controller: "AdmissionController", lane: Optional[Lane], level: int):
+        self._controller = controller
+        self.lane = lane
+        self.level = level
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self.lane is not None:
+            self._controller._release(self.lane, time.monotonic() - self._start)
+
+
+def _parse_json_env(name: str) -> Dict[str, float]:
+    raw = os.environ.get(name)
+    if not raw:
+        return {}
+    try:
+        return {str(k): float(v) for k, v in json.loads(raw).items()}
+    except (ValueError, AttributeError) as e:
+        logger.warning("invalid admission config", extra={"fields": {"env": name, "error": str(e)}})
+        return {}
+
+
+def _parse_levels(raw: str) -> Tuple[float, ...]:
+    try:
+        return tuple(sorted(float(v) for v in raw.split(",") if v.strip()))
+    except ValueError:
+        logger.warning("invalid BROWNOUT_LEVELS", extra={"fields": {"value": raw}})
+        return ()
+
+
+class AdmissionController:
+    """경로별 레인 입장 관리"""
+
+    def __init__(self):
+        limits = _parse_json_env("ADMISSION_LIMITS")
+        slos = _parse_json_env("ADMISSION_SLO")
+        self.lanes: Dict[str, Lane] = {}
+        for name, (priority, limit, slo, service_time) in _LANE_DEFAULTS.items():
+            self.lanes[name] = Lane(
+                name=name,
+                priority=priority,
+                limit=max(1, int(limits.get(name, limit))),
+                slo=slos.get(name, slo),
+                service_time=service_time,
+            )
+        self.levels = _parse_levels(os.environ.get("BROWNOUT_LEVELS", "0.75,1.0,1.5"))
+
+    def lane_for(self, path: str) -> Optional[Lane]:
+        name = LANE_PATHS.get(path)
+        return self.lanes.get(name) if name else None
+
+    def brownout_level(self) -> int:
+        """최우선 레인들 중 가장 포화된 레인 기준 브라운아웃 단계"""
+        top = min(lane.priority for lane in self.lanes.values())
+        saturation = max(lane.saturation() for lane in self.lanes.values() if lane.priority == top)
+        return sum(1 for threshold in self.levels if saturation >= threshold)
+
+    def _shed(self, lane: Lane, reason: str, wait: float) -> Overloaded:
+        retry_after = min(_MAX_RETRY_AFTER, max(1, math.ceil(wait)))
+        metrics.ADMISSION_REJECTIONS.labels(lane.name, reason).inc()
+        logger.warning("request shed", extra={"fields": {
+            "lane": lane.name, "reason": reason, "running": lane.running,
+            "waiting": len(lane.waiters), "retry_after": retry_after,
+        }})
+        return Overloaded(lane.name, reason, retry_after)
+
+    async def acquire(self, path: str) -> Ticket:
+        """
+        레인 자리를 얻을 때까지 대기 (레인 없는 경로는 바로 통과)
+
+        Raises:
+            Overloaded: 예상/실제 대기가 SLO 를 넘거나 더 높은 우선순위 레인이 밀려 있음
+        """
+        lane = self.lane_for(path) if ENABLED else None
+        if lane is None:
+            return Ticket(self, None, 0)
+
+        if lane.priority > 0 and any(
+            other.waiters for other in self.lanes.values() if other.priority < lane.priority
+        ):
+            raise self._shed(lane, "priority", lane.service_time)
+
+        wait = lane.estimated_wait()
+        if wait > lane.slo:
+            raise self._shed(lane, "slo", wait)
+
+        if lane.running >= lane.limit or lane.waiters:
+            waiter = asyncio.get_running_loop().create_future()
+            lane.waiters.append(waiter)
+            metrics.ADMISSION_QUEUE.labels(lane.name).inc()
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=lane.slo)
+            except asyncio.TimeoutError:
+                if waiter.done() and not waiter.cancelled():
+                    # 시간 초과와 동시에 자리를 넘겨받은 경우: 그대로 진행
+                    pass
+                else:
+                    waiter.cancel()
+                    raise self._shed(lane, "timeout", lane.service_time)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # 넘겨받은 자리를 다음 대기자에게
+                    self._release(lane, None)
+                waiter.cancel()
+                raise
+            finally:
+                if waiter in lane.waiters:
+                    lane.waiters.remove(waiter)
+                metrics.ADMISSION_QUEUE.labels(lane.name).dec()
+                metrics.ADMISSION_WAIT.labels(lane.name).observe(time.monotonic() - start)
+        else:
+            lane.running += 1
+
+        # 브라운아웃 단계는 자리를 얻은 시점의 포화도(자신 포함)로 정함, 튜닝 레인은 적용 안 함
+        level = self.brownout_level() if lane.priority == 0 else 0
+        metrics.BROWNOUT_REQUESTS.labels(lane.name, str(level)).inc()
+        if level:
+            # 미들웨어 컨텍스트에 설정 → 엔드포인트/스레드풀(copy_context)까지 전달
+            _current_brownout.set(Brownout(level))
+        return Ticket(self, lane, level)
+
+    def _release(self, lane: Lane, seconds: Optional[float]) -> None:
+        if seconds is not None:
+            lane.observe(seconds)
+        # 자리를 다음 대기자에게 그대로 넘김 (running 유지)
+        while lane.waiters:
+            waiter = lane.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        lane.running -= 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "running": lane.running,
+                "waiting": len(lane.waiters),
+                "limit": lane.limit,
+                "service_time": round(lane.service_time, 3),
+            }
+            for name, lane in self.lanes.items()
+        }
+
+
+controller = AdmissionController()
@@ -0,0 +1,26 @@
+"""
+AWS 클라이언트 유틸리티
+
+boto3 는 import 와 클라이언트 생성에 수백 ms 가 걸리므로 모듈 import 시점이 아니라
+첫 업로드 시점에 만들고, 같은 설정의 클라이언트는 프로세스 안에서 재사용합니다.
+"""
+
+from functools import lru_cache
+from typing import Any, Optional
+
+
+@lru_cache(maxsize=None)
+def get_s3_client(
+    region_name: str,
+    aws_access_key_id: Optional[str] = None,
+    aws_secret_access_key: Optional[str] = None,
+) -> Any:
+    """설정별로 캐시된 boto3 S3 클라이언트 (boto3 는 여기서 처음 import)"""
+    import boto3
+
+    return boto3.client(
+        "s3",
+        region_name=region_name,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+    )
@@ -0,0 +1,389 @@
+"""
+Gemini 명시적 컨텍스트 캐시(cached content) 관리 유틸리티
+
+요청마다 바뀌지 않는 앞부분(prefix)을 cachedContents 로 만들어 두고, 모델 호출에는
+cached_content 이름과 나머지 contents 만 보냅니다. 캐시에서 읽은 입력 토큰은 cached_input
+단가로 과금되고(utils/usage.py), 모델이 prefix 를 다시 처리하지 않아 첫 토큰까지의 시간이 줄어듭니다.
+
+    prefix = Prefix(
+        key=prefix_key("text-system", system_prompt),
+        system_instruction=system_prompt,
+        rest=[task_prompt],
+        estimated_tokens=estimate_tokens(system_prompt),
+    )
+    contents, config, name = manager.request(model, prefix, contents, config)
+
+대상 prefix:
+- 문구 생성: prompts/invitation/system.md (system_instruction)
+- 나노바나나 페이지 생성: 스타일 이미지 (한 청첩장의 3페이지와 같은 스타일의 다른 요청이 공유)
+
+캐시 생성 여부는 관측된 재사용으로 결정합니다. prefix 별로 최근 CONTEXT_CACHE_TTL 초 동안의 사용
+횟수를 세어, CONTEXT_CACHE_MIN_USES 번 이상 쓰였고 같은 빈도로 쓰일 때 아낄 입력 비용이
+TTL 동안의 보관 비용보다 클 때만 만듭니다. 모델별 최소 토큰 수(CONTEXT_CACHE_MIN_TOKENS)보다
+작은 prefix 는 만들지 않으며, API 가 거절하면(모델 미지원, 토큰 부족) CONTEXT_CACHE_RETRY 초 동안
+다시 시도하지 않습니다.
+
+- 항목별 만료 시각, 토큰 수, 누적 보관 비용을 추적합니다 (stats()). 생성/연장 비용은
+  context_cache.create / context_cache.extend span 의 cost_usd 로 요청 usage 와 메트릭에 합산됩니다.
+- 계속 쓰이는 항목은 남은 TTL 이 절반 이하가 되면 TTL 을 연장합니다.
+- 항목은 공유 캐시(utils/shared_cache.py, "context-cache")로 워커 간에 나눕니다.
+  재사용 관측은 워커별입니다.
+- 모델 호출이 캐시를 찾지 못하면(만료/삭제) invalidate() 후 prefix 를 포함해 다시 보내면 됩니다.
+
+오프라인 테스트/벤치마크에서는 OfflineCaches 를 caches 백엔드로 넣은 매니저를 쓰세요
+(benchmarks/stubs.py 가 patched_backends 안에서 교체합니다).
+
+환경 변수:
+    CONTEXT_CACHE              : on (기본) 또는 off
+    CONTEXT_CACHE_TTL          : 캐시 TTL 초 (기본 600)
+    CONTEXT_CACHE_MIN_USES     : 캐시를 만들기 위한 최근 TTL 내 최소 사용 횟수 (기본 2)
+    CONTEXT_CACHE_MIN_TOKENS   : 이보다 작은 prefix 는 캐시하지 않음 (기본 1024, API 최소값)
+    CONTEXT_CACHE_RETRY        : 생성 거절 후 재시도까지 초 (기본 3600)
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils import metrics
+from utils.genai_client import get_genai_client, key_owner
+from utils.log import get_logger
+from utils.prompt_loader import estimate_tokens
+from utils.shared_cache import shared_cache
+from utils.singleflight import SingleFlight
+from utils.tracing import span
+from utils.usage import cache_storage_cost, call_cost
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = get_logger(__name__)
+
+CONTEXT_CACHE = os.environ.get("CONTEXT_CACHE", "on").lower() not in ("off", "0", "false")
+CACHE_TTL = float(os.environ.get("CONTEXT_CACHE_TTL", "600"))
+MIN_USES = int(os.environ.get("CONTEXT_CACHE_MIN_USES", "2"))
+MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+RETRY_AFTER = float(os.environ.get("CONTEXT_CACHE_RETRY", "3600"))
+
+# 입력 이미지 1장의 대략적인 토큰 수 (실제 값은 캐시 생성 응답의 usage_metadata 로 갱신)
+IMAGE_TOKENS = 1120
+# 만료 직전 항목은 쓰지 않음 (호출 도중 만료 방지)
+_EXPIRY_GUARD = 30.0
+
+NAMESPACE = "context-cache"
+
+
+def prefix_key(*parts: Any) -> str:
+    """prefix 내용(문자열/바이트)의 해시"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class Prefix:
+    """
+    캐시할 앞부분과 캐시를 쓸 때 보낼 나머지
+
+    Args:
+        key: prefix 내용 해시 (prefix_key)
+        system_instruction: 캐시에 넣을 시스템 지시
+        contents: 캐시에 넣을 contents (이미지 Part 등)
+        rest: 캐시를 쓸 때 요청에 보낼 나머지 contents
+        estimated_tokens: prefix 토큰 수 추정치 (생성 여부 판단용)
+    """
+
+    key: str
+    system_instruction: Optional[str] = None
+    contents: List[Any] = field(default_factory=list)
+    rest: List[Any] = field(default_factory=list)
+    estimated_tokens: int = 0
+
+
+@dataclass
+class CacheEntry:
+    """생성된 cachedContents 항목"""
+
+    name: str
+    model: str
+    tokens: int
+    created_at: float
+    expires_at: float
+    storage_cost_usd: float = 0.0
+    hits: int = 0
+
+    def usable(self, now: float) -> bool:
+        return self.expires_at - now > _EXPIRY_GUARD
+
+
+def is_missing_cache_error(error: BaseException) -> bool:
+    """모델 호출 오류가 만료/삭제된 캐시 참조 때문인지"""
+    message = str(error)
+    return ("403" in message or "404" in message or "PERMISSION_DENIED" in message or "NOT_FOUND" in message) \
+        and "cache" in message.lower()
+
+
+def _ttl(seconds: float) -> str:
+    return f"{int(seconds)}s"
+
+
+def _model_path(model: str) -> str:
+    return model if model.startswith("models/") else f"models/{model}"
+
+
+class ContextCacheManager:
+    """prefix 별 재사용 관측과 cachedContents 생성/연장 (스레드 안전)"""
+
+    def __init__(self, caches: Optional[Callable[[], Any]] = None, shared: bool = True, enabled: bool = True):
+        # caches: client.caches 와 같은 객체를 돌려주는 함수 (기본은 Gemini 클라이언트의 caches)
+        self._caches = caches or (lambda: get_genai_client().caches)
+        self._shared = shared
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CacheEntry] = {}
+        self._uses: Dict[str, Deque[float]] = {}
+        self._rejected_until: Dict[str, float] = {}
+        self._creates = SingleFlight("context_cache_create")
+
+    @staticmethod
+    def _key(model: str, prefix: Prefix) -> str:
+        # cachedContents 는 모델과 API 키(프로젝트)에 묶임
+        owner = key_owner()
+        return f"{owner}:{model}:{prefix.key}"
+
+    def _observe(self, key: str, now: float) -> int:
+        """사용 1회 기록 후 최근 TTL 내 사용 횟수"""
+        uses = self._uses.setdefault(key, deque())
+        uses.append(now)
+        while uses and uses[0] < now - CACHE_TTL:
+            uses.popleft()
+        return len(uses)
+
+    @staticmethod
+    def worth_caching(model: str, tokens: int, uses: int) -> bool:
+        """최근 사용 빈도가 유지될 때 아낄 입력 비용이 TTL 동안의 보관 비용보다 큰지"""
+        if uses < MIN_USES or tokens < MIN_TOKENS:
+            return False
+        full = call_cost(model, {"input_tokens": tokens})
+        cached = call_cost(model, {"input_tokens": tokens, "cached_tokens": tokens})
+        storage = cache_storage_cost(model, tokens, CACHE_TTL)
+        if full is None or cached is None or storage is None:
+            # 가격표에 없으면 비용 비교 없이 사용 횟수만으로 판단
+            return True
+        return uses * (full - cached) > storage
+
+    def lookup(self, model: str, prefix: Prefix) -> Optional[CacheEntry]:
+        """사용을 기록하고, 쓸 수 있는 캐시 항목 (없으면 조건이 맞을 때 생성, 아니면 None)"""
+        if not self.enabled:
+            return None
+        key = self._key(model, prefix)
+        now = time.time()
+
+        with self._lock:
+            uses = self._observe(key, now)
+            entry = self._entries.get(key)
+            if entry is not None and not entry.usable(now):
+                del self._entries[key]
+                entry = None
+            rejected = self._rejected_until.get(key, 0) > now
+
+        if entry is None and self._shared:
+            stored = shared_cache.get_json(NAMESPACE, key)
+            if stored is not None and CacheEntry(**stored).usable(now):
+                entry = CacheEntry(**stored)
+                with self._lock:
+                    self._entries[key] = entry
+
+        if entry is not None:
+            metrics.record_cache("context", True)
+            with self._lock:
+                entry.hits += 1
+            if entry.expires_at - now < CACHE_TTL / 2:
+                self._extend(key, entry)
+            return entry
+
+        metrics.record_cache("context", False)
+        if rejected or not self.worth_caching(model, prefix.estimated_tokens, uses):
+            return None
+
+        try:
+            entry, _ = self._creates.do(key, self._create, key, model, prefix)
+        except Exception as e:
+            logger.info("context cache not created", extra={"fields": {"model": model, "error": str(e)}})
+            with self._lock:
+                self._rejected_until[key] = time.time() + RETRY_AFTER
+            return None
+        return entry
+
+    def _create(self, key: str, model: str, prefix: Prefix) -> CacheEntry:
+        config: Dict[str, Any] = {"ttl": _ttl(CACHE_TTL), "display_name": f"prefix-{prefix.key[:16]}"}
+        if prefix.system_instruction:
+            config["system_instruction"] = prefix.system_instruction
+        if prefix.contents:
+            config["contents"] = prefix.contents
+
+        with span("context_cache.create", model=model, ttl_s=CACHE_TTL) as s:
+            cached = self._caches().create(model=_model_path(model), config=config)
+            usage = getattr(cached, "usage_metadata", None)
+            tokens = getattr(usage, "total_token_count", None) or prefix.estimated_tokens
+            expire_time = getattr(cached, "expire_time", None)
+            now = time.time()
+            entry = CacheEntry(
+                name=cached.name,
+                model=model,
+                tokens=tokens,
+                created_at=now,
+                expires_at=expire_time.timestamp() if expire_time else now + CACHE_TTL,
+                storage_cost_usd=cache_storage_cost(model, tokens, CACHE_TTL) or 0.0,
+            )
+            s.set(tokens=tokens, cost_usd=entry.storage_cost_usd)
+
+        logger.info("context cache created", extra={"fields": {"name": entry.name, "model": model, "tokens": tokens}})
+        self._save(key, entry)
+        return entry
+
+    def _extend(self, key: str, entry: CacheEntry) -> None:
+        """계속 쓰이는 항목의 TTL 연장 (실패하면 만료까지 그대로 사용)"""
+        try:
+            with span("context_cache.extend", model=entry.model, ttl_s=CACHE_TTL) as s:
+                updated = self._caches().update(name=entry.name, config={"ttl": _ttl(CACHE_TTL)})
+                expire_time = getattr(updated, "expire_time", None)
+                now = time.time()
+                expires_at = expire_time.timestamp() if expire_time else now + CACHE_TTL
+                # 기존 만료 시각 이후로 늘어난 구간만 추가 보관 비용
+                cost = cache_storage_cost(entry.model, entry.tokens, max(0.0, expires_at - entry.expires_at)) or 0.0
+                s.set(tokens=entry.tokens, cost_usd=cost)
+        except Exception as e:
+            logger.warning("context cache extend failed", extra={"fields": {"name": entry.name, "error": str(e)}})
+            return
+        with self._lock:
+            entry.expires_at = expires_at
+            entry.storage_cost_usd += cost
+        self._save(key, entry)
+
+    def _save(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._rejected_until.pop(key, None)
+        if self._shared:
+            shared_cache.set_json(NAMESPACE, key, asdict(entry), ttl=entry.expires_at - _EXPIRY_GUARD - time.time())
+
+    def invalidate(self, model: str, prefix: Prefix) -> None:
+        """캐시가 만료/삭제된 것으로 확인되면 항목을 버림"""
+        key = self._key(model, prefix)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._shared:
+            shared_cache.delete(NAMESPACE, key)
+
+    def request(
+        self,
+        model: str,
+        prefix: Optional[Prefix],
+        contents: List[Any],
+        config: "types.GenerateContentConfig",
+    ) -> Tuple[List[Any], "types.GenerateContentConfig", Optional[str]]:
+        """
+        모델 호출 인자
+
+        Returns:
+            캐시가 있으면 (prefix.rest, cached_content 를 지정한 config, 캐시 이름),
+            없으면 (contents, config, None)
+        """
+        entry = self.lookup(model, prefix) if prefix is not None else None
+        if entry is None:
+            return contents, config, None
+        return prefix.rest, config.model_copy(update={"cached_content": entry.name}), entry.name
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": [
+                    {
+                        "name": e.name,
+                        "model": e.model,
+                        "tokens": e.tokens,
+                        "hits": e.hits,
+                        "expires_in_s": round(e.expires_at - now),
+                        "storage_cost_usd": round(e.storage_cost_usd, 6),
+                    }
+                    for e in self._entries.values()
+                ],
+                "rejected": sum(1 for until in self._rejected_until.values() if until > now),
+            }
+
+
+class OfflineCaches:
+    """
+    client.caches 의 오프라인 대역 (create / get / update / delete)
+
+    네트워크 없이 항목을 메모리에 기록하고 CachedContent 와 같은 모양의 객체를 돌려줍니다.
+    min_tokens 를 주면 API 처럼 작은 prefix 를 거절합니다.
+    """
+
+    def __init__(self, min_tokens: int = 0, on_create: Optional[Callable[[int], None]] = None):
+        self.min_tokens = min_tokens
+        self.on_create = on_create
+        self.creates = 0
+        self.items: Dict[str, Any] = {}
+
+    @staticmethod
+    def _tokens(config: Dict[str, Any]) -> int:
+        tokens = estimate_tokens(config.get("system_instruction") or "")
+        for part in config.get("contents") or []:
+            text = part if isinstance(part, str) else getattr(part, "text", None)
+            tokens += estimate_tokens(text) if text else IMAGE_TOKENS
+        return tokens
+
+    def _expire_time(self, ttl: str) -> Any:
+        from datetime import datetime, timezone
+
+        return datetime.fromtimestamp(time.time() + float(ttl.rstrip("s")), tz=timezone.utc)
+
+    def create(self, *, model: str, config: Any = None) -> Any:
+        config = dict(config or {})
+        tokens = self._tokens(config)
+        if tokens < self.min_tokens:
+            raise RuntimeError(f"400 INVALID_ARGUMENT. Cached content is too small. total_token_count={tokens}, min_total_token_count={self.min_tokens}")
+        if self.on_create:
+            self.on_create(tokens)
+        self.creates += 1
+        name = f"cachedContents/offline-{uuid.uuid4().hex[:12]}"
+        self.items[name] = SimpleNamespace(
+            name=name,
+            model=model,
+            expire_time=self._expire_time(config.get("ttl", _ttl(CACHE_TTL))),
+            usage_metadata=SimpleNamespace(total_token_count=tokens),
+        )
+        return self.items[name]
+
+    def get(self, *, name: str) -> Any:
+        item = self.items.get(name)
+        if item is None or item.expire_time.timestamp() < time.time():
+            raise RuntimeError(f"403 PERMISSION_DENIED. CachedContent not found (or permission denied): {name}")
+        return item
+
+    def update(self, *, name: str, config: Any = None) -> Any:
+        item = self.get(name=name)
+        item.expire_time = self._expire_time(dict(config or {}).get("ttl", _ttl(CACHE_TTL)))
+        return item
+
+    def delete(self, *, name: str) -> None:
+        self.items.pop(name, None)
+
+    def tokens(self, name: str) -> int:
+        """캐시 항목의 토큰 수 (스텁 모델이 cached_content_token_count 로 보고)"""
+        return self.get(name=name).usage_metadata.total_token_count
+
+
+manager = ContextCacheManager(enabled=CONTEXT_CACHE)
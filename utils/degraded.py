@@ -0,0 +1,212 @@
+"""
+장애 대체(degraded) 페이지 렌더러
+
+이미지 모델 호출이 실패하거나(과부하, 제공자 장애) 이미지를 돌려주지 않을 때 placeholder URL 이나
+빠진 페이지 대신, 스타일 이미지의 대표 색, 테두리 템플릿, 생성된 문구로 쓸 만한 페이지를 로컬에서 바로
+만듭니다. 사용자가 깨진 청첩장을 받고 재시도해 부하를 더 키우는 대신, 장애 중에도 응답을 계속 돌려줍니다.
+
+    from utils import degraded
+    if degraded.ENABLED:
+        png = degraded.render_page("content", style_image=style_bytes, texts=texts, tone=tone, **info)
+        page = {"page_number": 2, "image_url": save(png), "type": "content", "degraded": True}
+
+- 대표 색: 스타일 이미지를 축소해 Pillow median-cut 으로 뽑은 상위 색 (스타일 내용 해시별 캐시)
+- 테두리: 톤에 따라 classic(이중선) / minimal(얇은 선) / corner(모서리 장식)
+- 문구/이름/날짜는 utils/typesetting.py 로 조판 (한글 글꼴이 없으면 Pillow 기본 글꼴)
+- DEGRADED_PAGE_SIZE 로 작게 그려 페이지당 수십 ms 안에 끝냅니다.
+
+대체 페이지는 응답에 "degraded": true 로 표시하고, 결과 캐시/멱등성 저장에서 제외해 복구 후 재요청 시
+정상 결과를 받게 합니다. model_api_degraded_pages_total{pipeline, reason} 메트릭으로 셉니다.
+
+문구 생성까지 실패하면 fallback_texts() 의 기본 문구를 씁니다.
+
+환경 변수:
+    DEGRADED_MODE       : on (기본) 또는 off (off 면 기존처럼 실패 페이지를 빼거나 오류 반환)
+    DEGRADED_PAGE_SIZE  : 대체 페이지 크기 "가로x세로" (기본 768x1024)
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from utils import metrics, typesetting
+from utils.log import get_logger
+from utils.tracing import current_span
+
+logger = get_logger(__name__)
+
+ENABLED = os.environ.get("DEGRADED_MODE", "on").lower() not in ("off", "0", "false")
+PAGE_SIZE: Tuple[int, int] = tuple(int(v) for v in os.environ.get("DEGRADED_PAGE_SIZE", "768x1024").lower().split("x"))
+
+RGB = Tuple[int, int, int]
+
+_DEFAULT_PALETTE: List[RGB] = [(247, 241, 232), (201, 174, 125), (120, 98, 80), (60, 60, 60)]
+_PALETTE_CACHE_SIZE = 128
+_palettes: "OrderedDict[str, List[RGB]]" = OrderedDict()
+_palettes_lock = threading.Lock()
+
+
+def palette(style_image: Optional[bytes], colors: int = 5) -> List[RGB]:
+    """스타일 이미지의 대표 색 (많이 쓰인 순, 스타일 내용 해시별 캐시)"""
+    if not style_image:
+        return list(_DEFAULT_PALETTE)
+    digest = hashlib.sha256(style_image).hexdigest()
+    with _palettes_lock:
+        if digest in _palettes:
+            _palettes.move_to_end(digest)
+            return list(_palettes[digest])
+
+    try:
+        image = Image.open(io.BytesIO(style_image)).convert("RGB")
+        image.thumbnail((64, 64))
+        quantized = image.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+        raw = quantized.getpalette()
+        counts = sorted(quantized.getcolors(), reverse=True)
+        result = [tuple(raw[index * 3:index * 3 + 3]) for _, index in counts]
+    except Exception as e:
+        logger.warning("style palette extraction failed", extra={"fields": {"error": str(e)}})
+        result = list(_DEFAULT_PALETTE)
+
+    with _palettes_lock:
+        _palettes[digest] = result
+        while len(_palettes) > _PALETTE_CACHE_SIZE:
+            _palettes.popitem(last=False)
+    return list(result)
+
+
+def _luminance(color: RGB) -> float:
+    r, g, b = color
+    return 0.299 * r + 0.587 * g + 0.114 * b
+
+
+def _mix(color: RGB, other: RGB, amount: float) -> RGB:
+    return tuple(int(c + (o - c) * amount) for c, o in zip(color, other))
+
+
+def _frame_style(tone: Optional[str]) -> str:
+    tone = (tone or "").lower()
+    if tone in ("formal", "classic"):
+        return "classic"
+    if tone in ("modern", "minimal"):
+        return "minimal"
+    return "corner"
+
+
+def background(style_image: Optional[bytes], tone: Optional[str] = None, size: Tuple[int, int] = PAGE_SIZE) -> Image.Image:
+    """대표 색으로 칠한 종이와 테두리 (글자 없음)"""
+    colors = palette(style_image)
+    light = max(colors, key=_luminance)
+    dark = min(colors, key=_luminance)
+    # 종이는 가장 밝은 색을 흰색 쪽으로, 테두리는 가장 어두운 색을 종이 쪽으로 조금 섞음
+    paper = _mix(light, (255, 255, 255), 0.7)
+    accent = _mix(dark, paper, 0.25)
+
+    image = Image.new("RGB", size, paper)
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    unit = max(1, width // 256)
+    style = _frame_style(tone)
+    if style == "classic":
+        outer = int(width * 0.04)
+        inner = outer + 4 * unit
+        draw.rectangle((outer, outer, width - outer, height - outer), outline=accent, width=2 * unit)
+        draw.rectangle((inner, inner, width - inner, height - inner), outline=accent, width=unit)
+    elif style == "minimal":
+        inset = int(width * 0.06)
+        draw.rectangle((inset, inset, width - inset, height - inset), outline=accent, width=unit)
+    else:
+        inset = int(width * 0.05)
+        arm = int(width * 0.12)
+        for x, y, dx, dy in ((inset, inset, 1, 1), (width - inset, inset, -1, 1),
+                             (inset, height - inset, 1, -1), (width - inset, height - inset, -1, -1)):
+            draw.line((x, y, x + dx * arm, y), fill=accent, width=2 * unit)
+            draw.line((x, y, x, y + dy * arm), fill=accent, width=2 * unit)
+            r = 3 * unit
+            cx, cy = x + dx * 6 * unit, y + dy * 6 * unit
+            draw.polygon(((cx, cy - r), (cx + r, cy), (cx, cy + r), (cx - r, cy)), fill=accent)
+    return image
+
+
+def fallback_texts(groom_name: str, bride_name: str, venue: str = "") -> Dict[str, str]:
+    """문구 생성이 실패했을 때 쓰는 기본 문구"""
+    return {
+        "greeting": "서로가 마주 보며 다져온 사랑을 이제 함께 한곳을 바라보며 걸어가고자 합니다.",
+        "invitation": f"{groom_name}, {bride_name} 두 사람의 새로운 시작을 축복해 주시면 감사하겠습니다.",
+        "location": f"{venue}에서 뵙겠습니다." if venue else "",
+        "closing": "귀한 걸음 하시어 자리를 빛내 주세요.",
+    }
+
+
+def render_page(
+    kind: str,
+    *,
+    style_image: Optional[bytes] = None,
+    tone: Optional[str] = None,
+    texts: Optional[Dict[str, str]] = None,
+    photo: Optional[bytes] = None,
+    map_image: Optional[bytes] = None,
+    page: int = 0,
+    **info: str,
+) -> bytes:
+    """
+    대체 페이지 PNG
+
+    Args:
+        kind: cover / content / location, 그 밖의 값(greeting, invitation, closing 등)은 texts[kind] 한 문단
+        style_image: 스타일 이미지 바이트 (대표 색 추출)
+        tone: 테두리 선택용 톤
+        texts: 생성된 문구 {"greeting", "invitation", "location", ...}
+        photo: 커버에 넣을 웨딩 사진
+        map_image: 장소 페이지 지도
+        **info: groom_name, bride_name, groom_father, ..., venue, address, wedding_date, wedding_time
+    """
+    texts = texts or {}
+    canvas = background(style_image, tone)
+    if kind == "cover":
+        return typesetting.render_cover_page(
+            canvas, groom_name=info.get("groom_name", ""), bride_name=info.get("bride_name", ""),
+            photo=photo, size=PAGE_SIZE,
+        )
+    if kind == "content":
+        return typesetting.render_content_page(
+            canvas,
+            greeting=texts.get("greeting", ""),
+            invitation=texts.get("invitation", ""),
+            groom_name=info.get("groom_name", ""),
+            bride_name=info.get("bride_name", ""),
+            groom_father=info.get("groom_father") or "",
+            groom_mother=info.get("groom_mother") or "",
+            bride_father=info.get("bride_father") or "",
+            bride_mother=info.get("bride_mother") or "",
+            size=PAGE_SIZE,
+        )
+    if kind == "location":
+        return typesetting.render_location_page(
+            canvas,
+            wedding_date=info.get("wedding_date", ""),
+            wedding_time=info.get("wedding_time", ""),
+            venue=info.get("venue", ""),
+            address=info.get("address", ""),
+            location_text=texts.get("location", ""),
+            map_image=map_image,
+            size=PAGE_SIZE,
+        )
+    blocks = [typesetting.TextBlock(texts.get(kind, ""), size=52)]
+    if info.get("groom_name") and info.get("bride_name"):
+        blocks[0].gap_after = 120
+        blocks.append(typesetting.TextBlock(f"{info['groom_name']} ♥ {info['bride_name']}", size=44))
+    return typesetting.render_text_page(canvas, blocks, page=page, size=PAGE_SIZE)
+
+
+def mark(pipeline: str, reason: str, pages: int = 1) -> None:
+    """대체 페이지 사용 기록 (메트릭 + 현재 span 의 degraded_pages)"""
+    metrics.DEGRADED_PAGES.labels(pipeline, reason).inc(pages)
+    span = current_span()
+    if span is not None:
+        span.add("degraded_pages", pages)
+    logger.warning("serving degraded page", extra={"fields": {"pipeline": pipeline, "reason": reason, "pages": pages}})
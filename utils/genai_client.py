@@ -2,15 +2,60 @@
 Google GenAI 클라이언트 유틸리티
 
 SSL 인증서 오류 해결을 위한 설정 포함
+
+API 키 풀:
+    GEMINI_API_KEYS 에 키를 여러 개 넣으면 (서로 다른 프로젝트의 키면 쿼터도 따로) 키마다 클라이언트
+    (연결 풀 포함)를 따로 만들고, get_genai_client() 가 호출마다 가중치 대비 진행 중 호출이 가장 적은
+    키를 고릅니다 (같으면 최근 1분 호출 수가 적은 키). 429(RESOURCE_EXHAUSTED)를 받은 키는
+    KEY_COOLDOWN 초부터 연속 429 마다 두 배로(최대 KEY_COOLDOWN_MAX) 쉬게 하고, 성공하면 초기화합니다.
+    모든 키가 쉬는 중이면 가장 먼저 풀리는 키를 씁니다.
+
+    Files API 업로드와 cachedContents 는 키(프로젝트)에 묶이므로, 한 모델 호출 안에서는
+    use_client(client) 로 키를 고정하고 utils/style_assets.py / utils/context_cache.py 는
+    key_owner() 로 키별 항목을 구분합니다.
+
+    client = get_genai_client()
+    with use_client(client):          # 이 안의 get_genai_client() 는 같은 클라이언트
+        part = style_assets.registry.part_for_bytes(style_bytes)
+        client.models.generate_content(...)
+
+환경 변수:
+    GEMINI_API_KEY     : 키 하나 (GEMINI_API_KEYS 가 없을 때)
+    GEMINI_API_KEYS    : 쉼표로 구분한 키 목록, 키 뒤에 ":가중치" (기본 1, 예: "AIza...:2,AIza...")
+                         가중치는 키별 쿼터 비율 (분당 한도가 두 배인 프로젝트면 2)
+    KEY_COOLDOWN       : 429 후 첫 휴식 시간 (초, 기본 30)
+    KEY_COOLDOWN_MAX   : 연속 429 시 최대 휴식 시간 (초, 기본 300)
 """
 
+import hashlib
 import json
 import os
+import re
 import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from functools import lru_cache
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils import metrics
+from utils.log import get_logger
+from utils.tracing import record_usage, set_attributes
+
+logger = get_logger(__name__)
+
+if TYPE_CHECKING:
+    from google import genai
+
+
+KEY_COOLDOWN = float(os.environ.get("KEY_COOLDOWN", "30"))
+KEY_COOLDOWN_MAX = float(os.environ.get("KEY_COOLDOWN_MAX", "300"))
 
-from google import genai
+# 키별 최근 호출 수를 세는 구간 (초)
+_USAGE_WINDOW = 60.0
 
 
 class MissingGeminiKeyError(RuntimeError):
@@ -27,8 +72,237 @@ def _get_api_key() -> str:
     return api_key
 
 
-@lru_cache(maxsize=1)
-def _build_client(api_key: str) -> genai.Client:
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """모델 호출 오류가 쿼터 초과(429)인지"""
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error)
+    return "RESOURCE_EXHAUSTED" in message or message.startswith("429")
+
+
+@dataclass
+class PooledKey:
+    """풀에 있는 API 키 하나의 사용량/휴식 상태 (KeyPool 의 lock 안에서만 변경)"""
+
+    name: str  # 로그/메트릭용 이름 (키 해시 앞자리, 키 자체는 남기지 않음)
+    api_key: str
+    weight: float = 1.0
+    in_flight: int = 0
+    calls: int = 0
+    rate_limited: int = 0
+    strikes: int = 0  # 연속 429 수
+    cooldown_until: float = 0.0
+    recent: Deque[float] = field(default_factory=deque)  # 최근 _USAGE_WINDOW 초 호출 시각
+
+    def load(self, now: float) -> Tuple[float, float]:
+        while self.recent and self.recent[0] < now - _USAGE_WINDOW:
+            self.recent.popleft()
+        return self.in_flight / self.weight, len(self.recent) / self.weight
+
+
+def _parse_keys() -> List[PooledKey]:
+    raw = os.environ.get("GEMINI_API_KEYS", "")
+    keys = []
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        api_key, _, weight = entry.partition(":")
+        try:
+            value = float(weight) if weight else 1.0
+        except ValueError:
+            logger.warning("invalid key weight", extra={"fields": {"key": _key_hash(api_key), "weight": weight}})
+            value = 1.0
+        keys.append(PooledKey(name=_key_hash(api_key)[:8], api_key=api_key, weight=max(value, 0.01)))
+    if not keys:
+        api_key = _get_api_key()
+        keys.append(PooledKey(name=_key_hash(api_key)[:8], api_key=api_key))
+    return keys
+
+
+class KeyPool:
+    """API 키별 클라이언트와 사용량 (스레드 안전)"""
+
+    def __init__(self, keys: List[PooledKey]):
+        self.keys = keys
+        self._lock = threading.Lock()
+        self._clients: Dict[str, "PooledClient"] = {}
+
+    def select(self) -> PooledKey:
+        """쉬는 중이 아닌 키 중 가중치 대비 가장 한가한 키"""
+        now = time.monotonic()
+        with self._lock:
+            available = [key for key in self.keys if key.cooldown_until <= now]
+            if not available:
+                key = min(self.keys, key=lambda k: k.cooldown_until)
+                logger.warning("all API keys cooling down", extra={"fields": {
+                    "key": key.name, "remaining": round(key.cooldown_until - now, 1),
+                }})
+                return key
+            return min(available, key=lambda k: k.load(now))
+
+    def client(self, key: Optional[PooledKey] = None) -> "PooledClient":
+        key = key or self.select()
+        client = self._clients.get(key.name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key.name)
+                if client is None:
+                    client = PooledClient(_build_client(key.api_key), self, key)
+                    self._clients[key.name] = client
+        return client
+
+    def begin(self, key: PooledKey) -> None:
+        with self._lock:
+            key.in_flight += 1
+            key.calls += 1
+            key.recent.append(time.monotonic())
+        metrics.GENAI_KEY_IN_FLIGHT.labels(key.name).inc()
+
+    def end(self, key: PooledKey, error: Optional[BaseException] = None, abandoned: bool = False) -> None:
+        """호출 종료 기록 (abandoned: 스트림을 끝까지 읽지 않고 닫음, 429 연속 횟수에 영향 없음)"""
+        limited = error is not None and is_rate_limited(error)
+        with self._lock:
+            key.in_flight -= 1
+            if limited:
+                key.rate_limited += 1
+                key.strikes += 1
+                cooldown = min(KEY_COOLDOWN_MAX, KEY_COOLDOWN * 2 ** (key.strikes - 1))
+                key.cooldown_until = time.monotonic() + cooldown
+            elif error is None and not abandoned:
+                key.strikes = 0
+        metrics.GENAI_KEY_IN_FLIGHT.labels(key.name).dec()
+        outcome = "abandoned" if abandoned else "rate_limited" if limited else "error" if error is not None else "ok"
+        metrics.GENAI_KEY_CALLS.labels(key.name, outcome).inc()
+        if limited:
+            logger.warning("API key rate limited, cooling down", extra={"fields": {
+                "key": key.name, "strikes": key.strikes, "cooldown": cooldown,
+            }})
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        stats = []
+        with self._lock:
+            for key in self.keys:
+                key.load(now)
+                stats.append({
+                    "key": key.name,
+                    "weight": key.weight,
+                    "in_flight": key.in_flight,
+                    "calls": key.calls,
+                    "calls_last_minute": len(key.recent),
+                    "rate_limited": key.rate_limited,
+                    "cooldown": round(max(0.0, key.cooldown_until - now), 1),
+                })
+        return stats
+
+
+class _TrackedModels:
+    """client.models 호출을 키 사용량으로 기록 (스트림은 다 읽거나 닫을 때까지 진행 중)"""
+
+    def __init__(self, models: Any, pool: KeyPool, key: PooledKey):
+        self._models = models
+        self._pool = pool
+        self._key = key
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._models, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            set_attributes(api_key=self._key.name)
+            if name.endswith("_stream"):
+                # 스트림 SDK 메서드는 제너레이터라 첫 next() 에서 요청을 보냄 → 그때부터 진행 중으로 기록
+                return self._track_stream(attr(*args, **kwargs))
+            self._pool.begin(self._key)
+            try:
+                result = attr(*args, **kwargs)
+            except BaseException as e:
+                self._pool.end(self._key, e)
+                raise
+            self._pool.end(self._key)
+            return result
+
+        return call
+
+    def _track_stream(self, stream: Iterator[Any]) -> Iterator[Any]:
+        # begin 을 제너레이터 안에서 호출: 한 번도 읽지 않고 닫히거나 버려진 스트림은 기록하지 않음
+        self._pool.begin(self._key)
+        outcome: Optional[BaseException] = None
+        abandoned = False
+        try:
+            yield from stream
+        except GeneratorExit:
+            # 호출 측이 필요한 만큼 받고 닫음 (성공/실패로 세지 않음)
+            abandoned = True
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            raise
+        except BaseException as e:
+            outcome = e
+            raise
+        finally:
+            self._pool.end(self._key, outcome, abandoned=abandoned)
+
+
+class PooledClient:
+    """키 하나의 genai.Client (models 호출만 풀 사용량에 기록, 나머지는 그대로 위임)"""
+
+    def __init__(self, client: "genai.Client", pool: KeyPool, key: PooledKey):
+        self._client = client
+        self.key = key
+        self.models = _TrackedModels(client.models, pool, key)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+_pool: Optional[KeyPool] = None
+_pool_lock = threading.Lock()
+_pinned: ContextVar[Optional[Any]] = ContextVar("genai_client", default=None)
+
+
+def get_key_pool() -> KeyPool:
+    """API 키 풀 (첫 사용 시 환경 변수에서 생성)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = KeyPool(_parse_keys())
+                if len(_pool.keys) > 1:
+                    logger.info("API key pool", extra={"fields": {"keys": [k.name for k in _pool.keys]}})
+    return _pool
+
+
+@contextmanager
+def use_client(client: Any) -> Iterator[Any]:
+    """이 블록 안의 get_genai_client() 가 client 를 돌려주도록 고정 (업로드/캐시가 같은 키에 묶이도록)"""
+    token = _pinned.set(client)
+    try:
+        yield client
+    finally:
+        _pinned.reset(token)
+
+
+def key_owner() -> str:
+    """현재 키(프로젝트)를 구분하는 해시 (Files API / cachedContents 항목 키에 사용)"""
+    key = getattr(_pinned.get(), "key", None)
+    if key is None:
+        try:
+            key = get_key_pool().keys[0]
+        except MissingGeminiKeyError:
+            return _key_hash("")
+    return _key_hash(key.api_key)
+
+
+@lru_cache(maxsize=None)
+def _build_client(api_key: str) -> "genai.Client":
     """
     Google GenAI 클라이언트를 생성합니다.
 
@@ -38,6 +312,9 @@ def _build_client(api_key: str) -> genai.Client:
     import os
     import ssl
 
+    # google-genai 는 import 에 수백 ms 가 걸려 첫 클라이언트 생성 시점에 로드
+    from google import genai
+
     # 1. SSL 검증 완전히 무시 설정 (사용자 요청: verify=False 방식의 전역 적용)
     # macOS 및 특정 환경에서 SSL 오류를 방지하기 위해 검증을 비활성화합니다.
     try:
@@ -53,7 +330,7 @@ def _build_client(api_key: str) -> genai.Client:
     os.environ['REQUESTS_CA_BUNDLE'] = cert_path
     os.environ['GRPC_DEFAULT_SSL_ROOTS_FILE_PATH'] = cert_path
     
-    print(f"🔧 Gemini Client initializing (SSL Verification Disabled)")
+    logger.info("Gemini client initializing (SSL verification disabled)")
 
     # 3. HTTP 클라이언트 설정
     # v1alpha에서 일부 모델(imagen-3.0-generate-002 등)이 404가 발생할 수 있어
@@ -63,15 +340,30 @@ def _build_client(api_key: str) -> genai.Client:
         "api_version": "v1beta", 
     }
 
+    # 4. 로컬 대역 서버 등 다른 엔드포인트 사용 (부하/장애 테스트용)
+    # 예: GEMINI_BASE_URL=http://127.0.0.1:8787 (benchmarks/gemini_standin.py)
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    if base_url:
+        http_options["base_url"] = base_url
+        logger.info("Gemini base URL override", extra={"fields": {"base_url": base_url}})
+
     return genai.Client(
         api_key=api_key,
         http_options=http_options
     )
 
 
-def get_genai_client() -> genai.Client:
-    """캐시된 Google GenAI 클라이언트를 반환합니다."""
-    return _build_client(_get_api_key())
+def get_genai_client() -> "genai.Client":
+    """
+    Google GenAI 클라이언트를 반환합니다.
+
+    use_client() 블록 안이면 고정된 클라이언트, 아니면 키 풀에서 가장 한가한 키의 클라이언트
+    (키마다 한 번 만들어 재사용).
+    """
+    pinned = _pinned.get()
+    if pinned is not None:
+        return pinned
+    return get_key_pool().client()
 
 
 def extract_text_response(response: Any) -> str:
@@ -119,91 +411,193 @@ def extract_text_response(response: Any) -> str:
     raise ValueError("Gemini 응답에서 텍스트를 추출할 수 없습니다.")
 
 
-def parse_json_response(response: Any) -> Dict[str, Any]:
+def iter_inline_images(stream: Iterable[Any]) -> Iterator[Tuple[bytes, str]]:
     """
-    Gemini 응답에서 JSON 객체를 파싱합니다.
+    generate_content_stream 응답에서 이미지 파트만 도착 순서대로 꺼냅니다.
+
+    청크 객체를 모아두지 않고 바로 흘려보내며, 텍스트 파트와 중간 사고(thought)
+    이미지는 즉시 버립니다. 호출 측은 받은 이미지를 곧바로 저장소로 넘기면 됩니다.
+
+    Args:
+        stream: client.models.generate_content_stream(...) 의 반환값
+
+    Yields:
+        Tuple[bytes, str]: (이미지 바이트, MIME 타입)
+    """
+    for chunk in stream:
+        record_usage(getattr(chunk, "usage_metadata", None))
+        for candidate in getattr(chunk, "candidates", None) or []:
+            finish_reason = getattr(candidate, "finish_reason", None)
+            if finish_reason:
+                set_attributes(finish_reason=str(finish_reason))
+            if finish_reason and str(finish_reason) not in ("STOP", "FinishReason.STOP"):
+                logger.warning("non-STOP finish reason", extra={"fields": {"finish_reason": str(finish_reason)}})
+                # 안전성 등급 전체는 샘플링된 DEBUG 로그로만 남김
+                logger.debug("safety ratings", extra={"fields": {"safety": str(getattr(candidate, 'safety_ratings', None))}})
+
+            content = getattr(candidate, "content", None)
+            for part in (getattr(content, "parts", None) or []):
+                if getattr(part, "thought", False):
+                    continue
+                inline = getattr(part, "inline_data", None)
+                if inline is not None and inline.data:
+                    yield inline.data, inline.mime_type or "image/png"
+
+
+# 선택적 고속 JSON 파서 (orjson 설치 시 사용, 없으면 표준 json)
+try:
+    import orjson as _orjson
+
+    def _fast_loads(text: str) -> Any:
+        return _orjson.loads(text)
+except ImportError:  # pragma: no cover - orjson은 선택 의존성
+    _orjson = None
+    _fast_loads = json.loads
+
+# 문자열 리터럴("...", 이스케이프 포함)과 중괄호만 토큰으로 인식
+# 문자열 내부의 { } 는 하나의 문자열 토큰으로 통째로 건너뛰므로 깊이 계산에 영향을 주지 않습니다.
+_JSON_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]', re.DOTALL)
+# 유효한 JSON 객체는 "{" 다음에 키 문자열 또는 "}" 가 와야 함 (예외 없이 빠르게 걸러내기용)
+_OBJECT_START_RE = re.compile(r'\{\s*["}]')
+_CODE_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+
+
+def _strip_code_fence(text: str) -> str:
+    """```json ... ``` 코드 블록이 있으면 내부 내용만 반환합니다."""
+    if "```" not in text:
+        return text
+    match = _CODE_FENCE_RE.search(text)
+    if match:
+        return match.group(1).strip()
+    # 닫히지 않은 코드 블록 (스트리밍 도중 잘린 응답 등)
+    stripped = text.strip("`\n ")
+    if stripped.startswith(("json", "JSON")):
+        stripped = stripped[4:]
+    return stripped.strip()
+
+
+def iter_json_objects(text: str) -> Iterator[Any]:
+    """
+    텍스트에서 최상위 JSON 객체들을 순서대로 추출합니다.
+
+    정규식 토크나이저로 문자열 리터럴을 통째로 건너뛰며 중괄호 깊이를 추적하고,
+    최상위에서 닫히는 구간마다 한 번씩만 디코딩합니다. 전체 비용은 입력 길이에 선형입니다.
+
+    Note:
+        전체 텍스트에 ``JSONDecoder.raw_decode(text, idx)`` 를 반복 호출하면
+        실패할 때마다 JSONDecodeError 가 줄 번호 계산을 위해 ``text[:idx]`` 를 다시 훑어
+        입력이 커질수록 제곱 비용이 됩니다. 그래서 구간을 먼저 잘라낸 뒤 디코딩합니다.
+
+    Args:
+        text: JSON 객체가 섞여 있는 텍스트
+
+    Yields:
+        파싱된 JSON 값 (대부분 dict)
+
+    Raises:
+        json.JSONDecodeError: 최상위 객체가 끝까지 닫히지 않은 경우 (잘린 응답).
+            안쪽의 온전한 객체를 결과로 내보내면 형식이 틀린 값이 성공으로 캐시되므로
+            호출 측이 재시도/대체할 수 있게 실패시킵니다.
+    """
+    depth = 0
+    start = -1
+    for token in _JSON_TOKEN_RE.finditer(text):
+        ch = token.group()
+        if ch == "{":
+            if depth == 0:
+                start = token.start()
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0 and _OBJECT_START_RE.match(text, start):
+                try:
+                    yield _fast_loads(text[start:token.end()])
+                except ValueError:
+                    pass
+
+    if depth > 0:
+        raise json.JSONDecodeError("Unterminated object", text, start)
+
+
+def _merge_json_values(values: List[Any]) -> Dict[str, Any]:
+    """여러 JSON 값(리스트 포함)을 하나의 딕셔너리로 병합합니다."""
+    merged: Dict[str, Any] = {}
+    for value in values:
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            if isinstance(item, dict):
+                merged.update(item)
+            else:
+                merged[str(len(merged))] = item
+    return merged
+
+
+def _parse_json_objects(raw: str, exc: ValueError) -> Any:
+    """여러 객체가 이어지거나 깨진 텍스트에서 추출한 객체들을 병합합니다."""
+    # 문자열 내부 괄호를 올바르게 무시하며 개별 객체 추출
+    objects = list(iter_json_objects(raw))
+    if not objects:
+        if isinstance(exc, json.JSONDecodeError):
+            raise exc
+        raise json.JSONDecodeError(str(exc), raw, 0) from exc
+    return objects[0] if len(objects) == 1 else _merge_json_values(objects)
+
+
+def parse_json_text(raw: str) -> Dict[str, Any]:
+    """
+    모델이 출력한 텍스트에서 JSON 객체를 파싱합니다.
 
     - ```json ... ``` 형식의 코드 블록 제거
     - 리스트를 반환하면 딕셔너리로 병합
-    - 여러 JSON 객체를 병합
+    - 앞뒤 설명 문구가 붙거나 여러 JSON 객체가 이어진 경우 병합
 
     Args:
-        response: Gemini API 응답 객체
+        raw: 모델 출력 텍스트
 
     Returns:
         Dict[str, Any]: 파싱된 JSON 객체
 
     Raises:
-        ValueError: JSON 파싱에 실패한 경우
+        ValueError: JSON 파싱에 실패한 경우 (json.JSONDecodeError 포함)
     """
-    raw = extract_text_response(response).strip()
-
-    # 코드 블록 제거 (```json ... ```)
-    if raw.startswith("```"):
-        raw = raw.strip("`\n ")
-        if raw.startswith("json"):
-            raw = raw[4:]
-        raw = raw.strip()
-
-    def attempt_load(text: str) -> Dict[str, Any]:
-        """JSON 로드 시도"""
-        return json.loads(text)
-
-    def split_objects(text: str):
-        """여러 JSON 객체를 분리"""
-        objs = []
-        depth = 0
-        buffer = []
-        for ch in text:
-            if ch == '{':
-                depth += 1
-            if depth > 0:
-                buffer.append(ch)
-            if ch == '}':
-                depth -= 1
-                if depth == 0 and buffer:
-                    objs.append(''.join(buffer))
-                    buffer = []
-        return objs
+    raw = _strip_code_fence(raw.strip())
 
     try:
-        data = attempt_load(raw)
-    except json.JSONDecodeError:
-        # 괄호 범위 재조정
+        data = _fast_loads(raw)
+    except ValueError as exc:
+        # 괄호 범위 재조정 (앞뒤 설명 문구만 붙은 단일 객체)
         start = raw.find("{")
         end = raw.rfind("}") + 1
-        cleaned = raw[start:end] if start != -1 and end != -1 else raw
         try:
-            data = attempt_load(cleaned)
-        except json.JSONDecodeError:
-            # 여러 객체 분리 시도
-            objects = split_objects(cleaned)
-            if objects:
-                merged: Dict[str, Any] = {}
-                for obj in objects:
-                    try:
-                        parsed = json.loads(obj)
-                    except json.JSONDecodeError:
-                        continue
-                    if isinstance(parsed, dict):
-                        merged.update(parsed)
-                    else:
-                        merged[str(len(merged))] = parsed
-                data = merged
-            else:
-                raise
+            data = _fast_loads(raw[start:end]) if 0 <= start < end else None
+        except ValueError:
+            data = None
+        if data is None:
+            data = _parse_json_objects(raw, exc)
 
     # 리스트를 딕셔너리로 변환
     if isinstance(data, list):
-        merged: Dict[str, Any] = {}
-        for idx, item in enumerate(data):
-            if isinstance(item, dict):
-                merged.update(item)
-            else:
-                merged[str(idx)] = item
-        data = merged
+        data = _merge_json_values([data])
 
     if not isinstance(data, dict):
         raise ValueError("Gemini 응답이 JSON 객체가 아닙니다.")
 
     return data
+
+
+def parse_json_response(response: Any) -> Dict[str, Any]:
+    """
+    Gemini 응답에서 JSON 객체를 파싱합니다.
+
+    텍스트 추출 후 ``parse_json_text`` 로 위임합니다.
+
+    Args:
+        response: Gemini API 응답 객체
+
+    Returns:
+        Dict[str, Any]: 파싱된 JSON 객체
+
+    Raises:
+        ValueError: JSON 파싱에 실패한 경우
+    """
+    return parse_json_text(extract_text_response(response))
@@ -0,0 +1,124 @@
+"""
+Idempotency-Key 처리 유틸리티 (생성 API 중복 실행 방지)
+
+- 같은 요청 본문이 동시에 들어오면 한 번만 실행하고 결과를 나눠 받습니다 (utils/singleflight.py).
+- Idempotency-Key 헤더가 있으면 (테넌트별) 성공 응답을 IDEMPOTENCY_TTL 동안 저장해 두고
+  같은 키의 재요청에 그대로 재생합니다 (응답 헤더 Idempotent-Replayed: true).
+  같은 키로 다른 본문이 오면 IdempotencyConflict (409).
+- 다른 워커가 같은 키를 실행 중이면 공유 캐시를 폴링해 그 결과를 받습니다.
+  선점 기록은 IDEMPOTENCY_WAIT 후 만료되므로 워커가 죽어도 영구히 막히지 않습니다.
+
+실패 응답(success=false)은 저장하지 않으므로 같은 키로 다시 시도할 수 있습니다.
+저장소는 utils/shared_cache.py 이며, SHARED_CACHE_PATH=off 이면 워커 내 합치기만 동작합니다.
+
+환경 변수:
+    IDEMPOTENCY_TTL   : 성공 응답 재생 기간 초 (기본 3600)
+    IDEMPOTENCY_WAIT  : 다른 워커 실행 결과를 기다리는 최대 초 (기본 300)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.log import get_logger
+from utils.shared_cache import shared_cache
+from utils.singleflight import AsyncSingleFlight
+
+logger = get_logger(__name__)
+
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "3600"))
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", "300"))
+_POLL_INTERVAL = 0.5
+
+_RESULTS = "idempotency"
+_LOCKS = "idempotency-lock"
+
+
+class IdempotencyConflict(Exception):
+    """같은 Idempotency-Key 로 다른 요청 본문이 들어온 경우"""
+
+
+def fingerprint(payload: Any) -> str:
+    """요청 본문의 정규화 해시 (키 순서/공백과 무관)"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _lookup(key: str, fp: str, poll: bool = False) -> Optional[Dict[str, Any]]:
+    # 폴링 중에는 캐시 조회 메트릭을 남기지 않음
+    if poll:
+        raw = shared_cache.peek(_RESULTS, key)
+        stored = None if raw is None else json.loads(raw)
+    else:
+        stored = shared_cache.get_json(_RESULTS, key)
+    if stored is None:
+        return None
+    if stored["fingerprint"] != fp:
+        raise IdempotencyConflict(key)
+    return stored["body"]
+
+
+def _store(key: str, fp: str, body: Dict[str, Any]) -> None:
+    # 장애 대체 페이지가 섞인 응답은 재생하지 않음 (복구 후 재시도하면 정상 결과를 받도록)
+    if body.get("success") and not body.get("degraded"):
+        shared_cache.set_json(_RESULTS, key, {"fingerprint": fp, "body": body}, ttl=IDEMPOTENCY_TTL)
+
+
+async def _wait_other_worker(key: str, fp: str) -> Optional[Dict[str, Any]]:
+    """다른 워커가 선점한 키의 결과 대기 (선점이 풀렸는데 결과가 없으면 None → 직접 실행)"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(_POLL_INTERVAL)
+        body = _lookup(key, fp, poll=True)
+        if body is not None:
+            return body
+        if shared_cache.peek(_LOCKS, key) is None:
+            return None
+    return None
+
+
+async def execute(
+    flight: AsyncSingleFlight,
+    idempotency_key: Optional[str],
+    fp: str,
+    factory: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Tuple[Dict[str, Any], str]:
+    """
+    중복 제거 후 실행
+
+    Returns:
+        (응답 본문, 처리 방식) - 처리 방식은 executed / coalesced / replayed
+
+    Raises:
+        IdempotencyConflict: 같은 키로 다른 본문이 온 경우
+    """
+    if not idempotency_key:
+        body, shared = await flight.do(f"body:{fp}", factory)
+        return body, "coalesced" if shared else "executed"
+
+    stored = _lookup(idempotency_key, fp)
+    if stored is not None:
+        return stored, "replayed"
+
+    async def run_claimed() -> Tuple[Dict[str, Any], str]:
+        while not shared_cache.add(_LOCKS, idempotency_key, fp.encode(), ttl=IDEMPOTENCY_WAIT):
+            owner = shared_cache.peek(_LOCKS, idempotency_key)
+            if owner is not None and owner.decode() != fp:
+                raise IdempotencyConflict(idempotency_key)
+            logger.info("waiting for idempotent request on another worker", extra={"fields": {"key": idempotency_key}})
+            body = await _wait_other_worker(idempotency_key, fp)
+            if body is not None:
+                return body, "replayed"
+        try:
+            body = await factory()
+            _store(idempotency_key, fp, body)
+            return body, "executed"
+        finally:
+            shared_cache.delete(_LOCKS, idempotency_key)
+
+    # 같은 워커 안에서는 키+본문 단위로 합침 (본문이 다르면 선점 확인에서 409)
+    (body, how), shared = await flight.do(f"key:{idempotency_key}:{fp}", run_claimed)
+    return body, "coalesced" if shared and how == "executed" else how
@@ -0,0 +1,48 @@
+"""
+청첩장 전체 결과 캐시 (선택)
+
+같은 예약으로 같은 입력의 생성이 반복될 때 (새로고침, 백엔드 재시도 등) 이미지 3장을 다시
+생성하지 않고 이전 결과(페이지 URL + 문구)를 바로 돌려줍니다.
+
+캐시 키 = sha256(
+    정규화한 요청 본문 (이미지 URL 제외) + 테넌트,
+    웨딩/스타일 이미지 내용 해시 (URL 이 달라도 같은 이미지면 적중),
+    모델 id + 프롬프트 템플릿 버전 (nanobanana_api.pipeline_version)
+)
+
+요청 본문에 "forceRegenerate": true 를 넣으면 캐시를 무시하고 새로 생성한 뒤 캐시를 갱신합니다.
+3페이지가 모두 생성된 결과만 저장합니다. 저장소는 utils/shared_cache.py (워커 간 공유).
+
+환경 변수:
+    INVITATION_CACHE_TTL : 보관 초 (기본 0 = 끔). S3 수명 주기 정책보다 짧게 설정하세요.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from utils.shared_cache import shared_cache
+
+NAMESPACE = "invitation"
+
+
+def cache_key(request_payload: Dict[str, Any], images_base64: Dict[str, str], pipeline: Dict[str, Any]) -> str:
+    """결과에 영향을 주는 입력 전체의 해시"""
+    material = {
+        "request": request_payload,
+        "images": {
+            name: hashlib.sha256(data.encode("ascii")).hexdigest() if data else None
+            for name, data in sorted(images_base64.items())
+        },
+        "pipeline": pipeline,
+    }
+    canonical = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    return shared_cache.get_json(NAMESPACE, key)
+
+
+def put(key: str, data: Dict[str, Any]) -> None:
+    shared_cache.set_json(NAMESPACE, key, data)
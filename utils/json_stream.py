@@ -0,0 +1,159 @@
+"""
+스트리밍 JSON 증분 파서
+
+generate_content_stream 으로 조각(chunk) 단위로 도착하는 JSON 텍스트를 받아,
+필드 값이 완성되는 즉시 (경로, 값) 이벤트로 돌려줍니다.
+전체 응답을 기다리지 않고 첫 인사말부터 화면에 보여주기 위한 용도입니다.
+"""
+
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# 구조 문자 또는 문자열 시작 위치 탐색
+_STRUCTURAL_RE = re.compile(r'[{}\[\],:"]')
+# 닫힌 문자열 리터럴 (이스케이프 포함). 닫히지 않았으면 매칭되지 않음
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+JsonPath = Tuple[Any, ...]
+
+
+class _Frame:
+    """현재 열려 있는 객체/배열 하나의 파싱 상태"""
+
+    __slots__ = ("kind", "key", "index", "expect_key", "value_done")
+
+    def __init__(self, kind: str):
+        self.kind = kind            # "{" 또는 "["
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "{"
+        self.value_done = False
+
+
+class IncrementalJSONParser:
+    """
+    조각 단위로 들어오는 JSON 텍스트를 증분 파싱합니다.
+
+    ``feed()`` 는 이번 조각으로 새로 완성된 스칼라 값(문자열, 숫자 등)을
+    ``(경로, 값)`` 목록으로 반환합니다. 경로는 최상위 키와 배열 인덱스의 튜플입니다.
+
+    Example:
+        >>> parser = IncrementalJSONParser()
+        >>> parser.feed('{"greetings": ["첫 인사", "두')
+        [(('greetings', 0), '첫 인사')]
+        >>> parser.feed('번째 인사"], "location": "1층"}')
+        [(('greetings', 1), '두번째 인사'), (('location',), '1층')]
+        >>> parser.result
+        {'greetings': ['첫 인사', '두번째 인사'], 'location': '1층'}
+
+    Args:
+        max_depth: 이벤트로 내보낼 최대 경로 길이 (기본 2: 최상위 필드와 그 배열 원소)
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.result: Any = None
+        self._buf = ""
+        self._pos = 0               # 다음에 검사할 버퍼 위치
+        self._last_end = 0          # 마지막으로 처리한 토큰의 끝 위치
+        self._root_start = -1
+        self._stack: List[_Frame] = []
+
+    @property
+    def done(self) -> bool:
+        """최상위 JSON 값이 완성되었는지 여부"""
+        return self.result is not None
+
+    def feed(self, chunk: str) -> List[Tuple[JsonPath, Any]]:
+        """
+        새 조각을 추가하고 완성된 값들을 반환합니다.
+
+        Args:
+            chunk: 스트림에서 받은 텍스트 조각
+
+        Returns:
+            List[Tuple[JsonPath, Any]]: 이번 조각으로 완성된 (경로, 값) 목록
+        """
+        if self.done or not chunk:
+            return []
+
+        self._buf += chunk
+        events: List[Tuple[JsonPath, Any]] = []
+        buf = self._buf
+
+        while not self.done:
+            match = _STRUCTURAL_RE.search(buf, self._pos)
+            if match is None:
+                break
+            ch = match.group()
+            start = match.start()
+
+            if ch == '"':
+                string_match = _STRING_RE.match(buf, start)
+                if string_match is None:
+                    # 문자열이 아직 닫히지 않음 - 다음 조각을 기다림
+                    break
+                self._pos = string_match.end()
+                if self._stack:
+                    self._on_string(start, string_match.end(), events)
+                self._last_end = self._pos
+                continue
+
+            self._pos = match.end()
+            if not self._stack:
+                # 루트 이전의 잡음(```json 등)은 무시
+                if ch in "{[":
+                    self._root_start = start
+                    self._stack.append(_Frame(ch))
+                self._last_end = self._pos
+                continue
+
+            frame = self._stack[-1]
+            if ch in "{[":
+                self._stack.append(_Frame(ch))
+            elif ch == ":":
+                frame.expect_key = False
+            elif ch == ",":
+                self._flush_scalar(start, events)
+                if frame.kind == "{":
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+                frame.value_done = False
+            else:  # "}" 또는 "]"
+                self._flush_scalar(start, events)
+                self._stack.pop()
+                if self._stack:
+                    self._stack[-1].value_done = True
+                else:
+                    self.result = json.loads(buf[self._root_start:match.end()])
+            self._last_end = self._pos
+
+        return events
+
+    def _path(self) -> JsonPath:
+        return tuple(f.key if f.kind == "{" else f.index for f in self._stack)
+
+    def _emit(self, value: Any, events: List[Tuple[JsonPath, Any]]) -> None:
+        frame = self._stack[-1]
+        frame.value_done = True
+        if len(self._stack) <= self.max_depth:
+            events.append((self._path(), value))
+
+    def _on_string(self, start: int, end: int, events: List[Tuple[JsonPath, Any]]) -> None:
+        frame = self._stack[-1]
+        value = json.loads(self._buf[start:end])
+        if frame.kind == "{" and frame.expect_key:
+            frame.key = value
+            return
+        self._emit(value, events)
+
+    def _flush_scalar(self, end: int, events: List[Tuple[JsonPath, Any]]) -> None:
+        """직전 토큰과 현재 구분자 사이의 숫자/true/false/null 값을 처리"""
+        frame = self._stack[-1]
+        if frame.value_done:
+            return
+        text = self._buf[self._last_end:end].strip()
+        if text:
+            self._emit(json.loads(text), events)
@@ -0,0 +1,198 @@
+"""
+구조화(JSON) 로깅 유틸리티
+
+요청 경로의 print 를 대체합니다. 로그 레코드는 큐에 넣기만 하고 실제 stdout 쓰기는
+별도 리스너 스레드가 처리하므로 이벤트 루프를 막지 않습니다. 큐가 가득 차면 기다리지 않고 버립니다.
+
+    from utils.log import get_logger
+    logger = get_logger(__name__)
+    logger.info("page generated", extra={"fields": {"page": 1, "bytes": 12345}})
+
+- 모든 레코드에 request_id / trace_id 가 자동으로 붙습니다 (요청 미들웨어가 설정).
+- DEBUG 레코드(파트별 상세, 안전성 등급 등)는 요청 단위로 샘플링합니다.
+- 긴 문자열은 잘라내고 bytes 는 길이만 남깁니다 (이미지/base64 가 로그로 새지 않도록).
+
+환경 변수:
+    LOG_LEVEL              : 기본 INFO
+    LOG_FORMAT             : json(기본) / text
+    LOG_DEBUG_SAMPLE_RATE  : LOG_LEVEL 미만(DEBUG) 로그를 남길 요청 비율 (기본 0.01, 0 이면 끔)
+    LOG_QUEUE_SIZE         : 큐 크기 (기본 10000)
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import zlib
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+ROOT_LOGGER = "wedding"
+MAX_VALUE_CHARS = 300
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """wedding.* 네임스페이스 로거 (uvicorn 로거와 섞이지 않음)"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def set_request_id(request_id: Optional[str]):
+    """현재 컨텍스트의 상관관계 ID 설정 (reset 용 토큰 반환)"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def _compact(value: Any) -> Any:
+    """로그에 큰 페이로드가 들어가지 않도록 축약"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+        return f"{value[:MAX_VALUE_CHARS]}…(+{len(value) - MAX_VALUE_CHARS} chars)"
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value[:20]]
+    return value
+
+
+class _ContextFilter(logging.Filter):
+    """request_id / trace_id 를 레코드에 붙이고, 설정 레벨 미만 레코드는 요청 단위로 샘플링"""
+
+    def __init__(self, level: int, debug_sample_rate: float):
+        super().__init__()
+        self.level = level
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = _request_id.get()
+        record.request_id = request_id
+        if not hasattr(record, "trace_id"):
+            from utils.tracing import current_trace
+
+            trace = current_trace()
+            record.trace_id = trace.trace_id if trace else None
+
+        if record.levelno < self.level:
+            # 같은 요청의 DEBUG 로그는 모두 남기거나 모두 버림
+            key = request_id or str(record.thread)
+            bucket = zlib.crc32(key.encode()) % 10000 / 10000
+            return bucket < self.debug_sample_rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """한 줄에 JSON 객체 1개"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _compact(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(_compact(fields))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    """로컬 개발용 한 줄 텍스트"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={_compact(v)}" for k, v in fields.items())
+        if getattr(record, "request_id", None):
+            line += f" [{record.request_id}]"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """큐가 가득 차면 호출 스레드를 막지 않고 버림"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 메시지 포맷은 리스너 스레드에서 하되, 컨텍스트 값(request_id 등)은 필터에서 이미 붙어 있음
+        return record
+
+
+def configure_logging() -> None:
+    """wedding.* 로거에 큐 핸들러 + 백그라운드 리스너 연결 (여러 번 호출해도 1회만 적용)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    sample_rate = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.environ.get("LOG_FORMAT", "json") == "text":
+        stream_handler.setFormatter(_TextFormatter())
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter(level, sample_rate))
+
+    # 샘플링이 켜져 있으면 DEBUG 레코드도 필터까지 내려보냄
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(min(level, logging.DEBUG) if sample_rate > 0 else level)
+    logger.handlers[:] = [queue_handler]
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+
+def _reinit_after_fork() -> None:
+    """
+    fork 된 자식(gunicorn --preload 워커)에는 리스너 스레드가 따라오지 않으므로
+    새 큐/리스너로 다시 구성 (부모 큐에 남은 레코드는 부모가 씀)
+    """
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def shutdown_logging() -> None:
+    """남은 레코드를 모두 쓰고 리스너 종료"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,339 @@
+"""
+요청별 이미지 버퍼 메모리 집계 / 전역 메모리 예산 / tracemalloc 진단
+
+nanobanana 요청 하나는 원본 바이트, base64 문자열, 디코딩된 PIL 이미지, 이전 페이지 결과물,
+SDK 응답 등 수 MB 짜리 이미지를 동시에 여러 벌 들고 있습니다.
+
+요청별 집계:
+    파이프라인이 큰 버퍼를 잡거나 놓을 때 이름표별 크기를 기록합니다. 같은 이름표는 덮어쓰므로
+    (체인의 이전 페이지 등) 현재 보유량과 요청 중 최대치(peak)가 나옵니다.
+
+        memory.track("wedding_b64", len(wedding_image_base64))
+        memory.track("decode", image.width * image.height * 4)
+        memory.track("decode", 0)   # 놓음
+
+    요청이 끝나면 peak 를 루트 span 의 image_bytes_peak 와 model_api_request_image_bytes_peak 히스토그램에 남깁니다
+    (span 속성은 app/main.py 미들웨어가 기록).
+
+전역 예산:
+    이미지 경로 요청은 시작 전에 예상 사용량(경로별 최근 peak 의 EWMA, 처음엔 MEMORY_REQUEST_ESTIMATE_MB)을
+    예약합니다. 예약 합계가 MEMORY_BUDGET_MB 를 넘으면 앞 요청이 끝날 때까지 대기열에서 기다리고,
+    MEMORY_WAIT_TIMEOUT 을 넘기면 429 + Retry-After 입니다. 진행 중인 요청이 없으면 예상치가 예산보다
+    커도 받습니다. 예산은 워커별입니다.
+
+진단 (/admin/memory, /admin/tracemalloc, ADMIN_TOKEN 필요):
+    start_tracemalloc() / stop_tracemalloc(), tracemalloc_report(diff=True) 로 직전 스냅숏 대비
+    증가량 상위 할당 위치를 봅니다 (누수 추적, 포드 크기 산정).
+
+환경 변수:
+    MEMORY_BUDGET_MB            : 워커당 이미지 버퍼 예산 (기본 1024, 0 이면 끔)
+    MEMORY_REQUEST_ESTIMATE_MB  : 관측 전 요청당 예상치 (기본 96)
+    MEMORY_WAIT_TIMEOUT         : 예산 대기 최대 시간(초, 기본 30)
+    TRACEMALLOC_FRAMES          : 기동 시 tracemalloc 시작 (프레임 수, 기본 0 = 시작 안 함)
+"""
+
+import asyncio
+import contextvars
+import linecache
+import math
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from utils import admission, metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+_MB = 1024 * 1024
+
+BUDGET_BYTES = int(float(os.environ.get("MEMORY_BUDGET_MB", "1024")) * _MB)
+ESTIMATE_BYTES = int(float(os.environ.get("MEMORY_REQUEST_ESTIMATE_MB", "96")) * _MB)
+WAIT_TIMEOUT = float(os.environ.get("MEMORY_WAIT_TIMEOUT", "30"))
+
+# 예산을 적용할 경로 (이미지를 다루는 경로)
+BUDGET_PATHS = ("/api/generate-invitation", "/api/generate-invitation-test")
+
+
+# ---------------------------------------------------------------------------
+# 요청별 집계
+# ---------------------------------------------------------------------------
+
+class MemoryAccount:
+    """요청 하나가 보유한 이미지 버퍼 (이름표별 바이트, 스레드 안전)"""
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.held: Dict[str, int] = {}
+        self.current = 0
+        self.peak = 0
+        self.peak_held: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def track(self, label: str, nbytes: int) -> None:
+        with self._lock:
+            previous = self.held.pop(label, 0)
+            if nbytes > 0:
+                self.held[label] = nbytes
+            self.current += nbytes - previous
+            if self.current > self.peak:
+                self.peak = self.current
+                self.peak_held = dict(self.held)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"path": self.path, "current": self.current, "peak": self.peak, "held": dict(self.held)}
+
+
+_current_account: contextvars.ContextVar[Optional[MemoryAccount]] = contextvars.ContextVar("memory_account", default=None)
+_accounts: "set[MemoryAccount]" = set()
+_accounts_lock = threading.Lock()
+
+
+def track(label: str, nbytes: int) -> None:
+    """현재 요청의 이미지 버퍼 기록 (요청 밖이면 무시, 0 이면 놓음)"""
+    account = _current_account.get()
+    if account is not None:
+        account.track(label, nbytes)
+
+
+def image_bytes(image) -> int:
+    """디코딩된 PIL 이미지의 픽셀 버퍼 크기 추정"""
+    if image is None:
+        return 0
+    return image.width * image.height * len(image.getbands())
+
+
+# ---------------------------------------------------------------------------
+# 전역 예산
+# ---------------------------------------------------------------------------
+
+class Reservation:
+    """예산 예약 (요청 본문 전송까지 끝나면 release)"""
+
+    def __init__(self, budget: "MemoryBudget", account: MemoryAccount, reserved: int):
+        self._budget = budget
+        self.account = account
+        self.reserved = reserved
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._budget._release(self)
+
+
+class MemoryBudget:
+    """이미지 버퍼 예약 합계가 예산을 넘지 않게 요청 시작을 늦춤 (이벤트 루프 안에서만 사용)"""
+
+    def __init__(self, budget: int = BUDGET_BYTES, estimate: int = ESTIMATE_BYTES):
+        self.budget = budget
+        self.default_estimate = estimate
+        self.estimates: Dict[str, float] = {}
+        self.reserved = 0
+        self.active = 0
+        self.waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+
+    def estimate(self, path: str) -> int:
+        return int(self.estimates.get(path, self.default_estimate))
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.active == 0 or self.reserved + nbytes <= self.budget
+
+    async def reserve(self, path: str) -> Reservation:
+        """
+        경로의 예상 사용량을 예약하고 요청별 집계를 시작 (contextvar, 스레드풀에도 전달)
+
+        Raises:
+            admission.Overloaded: MEMORY_WAIT_TIMEOUT 안에 예산이 나지 않음
+        """
+        account = MemoryAccount(path)
+        nbytes = 0
+        if self.budget > 0 and path in BUDGET_PATHS:
+            nbytes = self.estimate(path)
+            if self.waiters or not self._fits(nbytes):
+                await self._wait(path, nbytes)
+            else:
+                self._take(nbytes)
+        # 미들웨어 컨텍스트에 설정 → 엔드포인트/스레드풀(copy_context)까지 전달
+        _current_account.set(account)
+        with _accounts_lock:
+            _accounts.add(account)
+        return Reservation(self, account, nbytes)
+
+    def _take(self, nbytes: int) -> None:
+        self.reserved += nbytes
+        self.active += 1
+        metrics.MEMORY_RESERVED.set(self.reserved)
+
+    async def _wait(self, path: str, nbytes: int) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, nbytes)
+        self.waiters.append(entry)
+        metrics.MEMORY_WAITING.inc()
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                waiter.cancel()
+                metrics.ADMISSION_REJECTIONS.labels("memory", "budget").inc()
+                logger.warning("memory budget exhausted", extra={"fields": {
+                    "path": path, "reserved": self.reserved, "budget": self.budget, "waiting": len(self.waiters),
+                }})
+                raise admission.Overloaded("memory", "budget", min(120, max(1, math.ceil(WAIT_TIMEOUT))))
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 넘겨받은 예약을 되돌림
+                self._return(nbytes)
+            waiter.cancel()
+            raise
+        finally:
+            if entry in self.waiters:
+                self.waiters.remove(entry)
+                # 맨 앞 대기자가 빠졌으면 뒤 대기자가 들어갈 수 있는지 다시 확인
+                self._wake()
+            metrics.MEMORY_WAITING.dec()
+            metrics.ADMISSION_WAIT.labels("memory").observe(time.monotonic() - start)
+
+    def _return(self, nbytes: int) -> None:
+        self.reserved -= nbytes
+        self.active -= 1
+        metrics.MEMORY_RESERVED.set(self.reserved)
+        self._wake()
+
+    def _wake(self) -> None:
+        # 앞에서부터 들어갈 수 있는 만큼 깨움 (FIFO, 앞 요청이 안 맞으면 뒤도 기다림)
+        while self.waiters:
+            waiter, nbytes = self.waiters[0]
+            if waiter.done():
+                self.waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                return
+            self.waiters.popleft()
+            self._take(nbytes)
+            waiter.set_result(None)
+
+    def _release(self, reservation: Reservation) -> None:
+        account = reservation.account
+        with _accounts_lock:
+            _accounts.discard(account)
+        _record_peak(account)
+        if reservation.reserved:
+            # 예상치는 관측 peak 의 EWMA (0 이면 경로가 이미지를 안 다룬 경우라 반영 안 함)
+            if account.peak:
+                previous = self.estimates.get(account.path, self.default_estimate)
+                self.estimates[account.path] = previous + 0.2 * (account.peak - previous)
+            self._return(reservation.reserved)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "reserved": self.reserved,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "estimates": {path: self.estimate(path) for path in BUDGET_PATHS},
+        }
+
+
+def _record_peak(account: MemoryAccount) -> None:
+    if account.peak:
+        metrics.REQUEST_IMAGE_BYTES.labels(account.path).observe(account.peak)
+
+
+budget = MemoryBudget()
+
+
+def in_flight() -> List[Dict[str, Any]]:
+    """진행 중인 요청별 보유량 (큰 순)"""
+    with _accounts_lock:
+        accounts = list(_accounts)
+    return sorted((a.to_dict() for a in accounts), key=lambda a: a["current"], reverse=True)
+
+
+def rss_bytes() -> Optional[int]:
+    """현재 RSS (Linux /proc, 없으면 None)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# tracemalloc
+# ---------------------------------------------------------------------------
+
+_snapshot: Optional[tracemalloc.Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def start_tracemalloc(frames: int = 10) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info("tracemalloc started", extra={"fields": {"frames": frames}})
+
+
+def stop_tracemalloc() -> None:
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped")
+
+
+def _format_stat(stat, group: str) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    entry = {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    if group == "lineno":
+        entry["line"] = linecache.getline(frame.filename, frame.lineno).strip()
+    elif group == "traceback":
+        entry["traceback"] = stat.traceback.format()
+    return entry
+
+
+def tracemalloc_report(top: int = 20, group: str = "lineno", diff: bool = False) -> Dict[str, Any]:
+    """
+    스냅숏을 찍어 상위 할당 위치 보고 (diff=True 면 직전 스냅숏 대비 증가량 순)
+
+    찍은 스냅숏은 다음 diff 의 기준이 됩니다.
+    """
+    global _snapshot
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    with _snapshot_lock:
+        previous, _snapshot = _snapshot, snapshot
+
+    current, peak = tracemalloc.get_traced_memory()
+    report: Dict[str, Any] = {"tracing": True, "traced_current": current, "traced_peak": peak, "group": group}
+    if diff and previous is not None:
+        stats = snapshot.compare_to(previous, group)
+        report["diff"] = True
+    else:
+        stats = snapshot.statistics(group)
+        report["diff"] = False
+    report["top"] = [_format_stat(stat, group) for stat in stats[:top]]
+    return report
+
+
+_startup_frames = int(os.environ.get("TRACEMALLOC_FRAMES", "0"))
+if _startup_frames > 0:
+    start_tracemalloc(_startup_frames)
@@ -0,0 +1,272 @@
+"""
+Prometheus 메트릭 유틸리티
+
+prometheus_client 는 requirements.txt 에 포함되어 있습니다. 설치되지 않은 환경(최소 설치 로컬 개발 등)에서는
+모든 메트릭이 no-op 이 되고 /metrics 는 503 을 반환합니다.
+
+여러 uvicorn 워커에서 올바르게 합산하려면 서버 시작 전에 빈 디렉터리를 지정하세요
+(prometheus_client multiprocess 모드, 워커마다 mmap 파일에 기록 후 /metrics 에서 합산):
+
+    rm -rf /tmp/prom_multiproc && mkdir -p /tmp/prom_multiproc
+    PROMETHEUS_MULTIPROC_DIR=/tmp/prom_multiproc uvicorn app.main:app --workers 4
+
+단계/모델/저장소 지연은 utils.tracing 의 span 종료 이벤트에서 자동으로 집계합니다.
+endpoint 라벨은 루트 span 의 endpoint 속성(등록된 /api 라우트, 그 외 "other")으로 시계열 수가 고정됩니다.
+캐시 적중률은 cache_requests_total{result="hit"} / sum(cache_requests_total) 로 계산합니다.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Optional, Tuple
+
+from utils import usage  # noqa: F401 - 비용(cost_usd) 리스너를 메트릭 리스너보다 먼저 등록
+from utils.tracing import Span, add_span_listener
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+except ImportError:  # pragma: no cover - prometheus_client는 선택 의존성
+    CONTENT_TYPE_LATEST = "text/plain; charset=utf-8"
+    generate_latest = None
+
+
+class _NoopMetric:
+    """prometheus_client 미설치 시 사용하는 빈 메트릭"""
+
+    def labels(self, *args: Any, **kwargs: Any) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+ENABLED = generate_latest is not None
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# 이미지 생성은 수십 초가 걸리므로 버킷을 길게 잡음
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180)
+_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _histogram(name: str, doc: str, labels: Tuple[str, ...], buckets=_LATENCY_BUCKETS):
+    if not ENABLED:
+        return _NoopMetric()
+    return Histogram(name, doc, labels, buckets=buckets)
+
+
+def _counter(name: str, doc: str, labels: Tuple[str, ...]):
+    if not ENABLED:
+        return _NoopMetric()
+    return Counter(name, doc, labels)
+
+
+def _gauge(name: str, doc: str, labels: Tuple[str, ...], mode: str = "livesum"):
+    if not ENABLED:
+        return _NoopMetric()
+    return Gauge(name, doc, labels, multiprocess_mode=mode)
+
+
+REQUEST_LATENCY = _histogram(
+    "model_api_request_duration_seconds", "API 요청 처리 시간 (본문 전송 완료까지)",
+    ("endpoint", "method", "status"),
+)
+STAGE_LATENCY = _histogram(
+    "model_api_stage_duration_seconds", "파이프라인 단계별 소요 시간 (trace span 기준)", ("stage",),
+)
+MODEL_CALLS = _counter(
+    "model_api_model_calls_total", "모델 호출 수", ("model", "outcome", "finish_reason"),
+)
+MODEL_TOKENS = _counter(
+    "model_api_model_tokens_total", "모델 호출 토큰 수", ("model", "endpoint", "kind"),
+)
+MODEL_COST = _counter(
+    "model_api_model_cost_usd_total", "가격표 기준 모델 호출 비용 (USD)", ("model", "endpoint"),
+)
+BUDGET_REJECTIONS = _counter(
+    "model_api_budget_rejections_total", "테넌트 일일 예산 초과로 거절된 요청 수", (),
+)
+MODEL_LATENCY = _histogram(
+    "model_api_model_call_duration_seconds", "모델 호출 소요 시간", ("model", "outcome"),
+)
+IN_FLIGHT = _gauge(
+    "model_api_generations_in_flight", "처리 중인 생성 요청 수", ("endpoint",),
+)
+EXECUTOR_BUSY = _gauge(
+    "model_api_executor_busy_threads", "사용 중인 워커 스레드 수", ("pool",),
+)
+EXECUTOR_CAPACITY = _gauge(
+    "model_api_executor_capacity_threads", "스레드풀 최대 스레드 수", ("pool",),
+)
+EXECUTOR_QUEUE = _gauge(
+    "model_api_executor_queue_depth", "스레드풀 대기 작업 수", ("pool",),
+)
+STORAGE_BYTES = _counter(
+    "model_api_storage_upload_bytes_total", "저장소 업로드 바이트", ("backend",),
+)
+STORAGE_LATENCY = _histogram(
+    "model_api_storage_upload_duration_seconds", "저장소 업로드 소요 시간", ("backend", "outcome"),
+)
+CACHE_REQUESTS = _counter(
+    "model_api_cache_requests_total", "캐시 조회 수", ("cache", "result"),
+)
+DEGRADED_PAGES = _counter(
+    "model_api_degraded_pages_total", "모델 대신 로컬 대체 렌더러로 만든 페이지 수", ("pipeline", "reason"),
+)
+ADMISSION_REJECTIONS = _counter(
+    "model_api_admission_rejections_total", "레인 포화로 429 를 돌려준 요청 수", ("lane", "reason"),
+)
+ADMISSION_QUEUE = _gauge(
+    "model_api_admission_queue_depth", "레인 대기열에서 자리를 기다리는 요청 수", ("lane",),
+)
+ADMISSION_WAIT = _histogram(
+    "model_api_admission_wait_seconds", "레인 대기열 대기 시간", ("lane",),
+)
+BROWNOUT_REQUESTS = _counter(
+    "model_api_brownout_requests_total", "입장한 요청 수 (브라운아웃 단계별)", ("lane", "level"),
+)
+MEMORY_RESERVED = _gauge(
+    "model_api_memory_reserved_bytes", "메모리 예산 중 예약된 이미지 버퍼 바이트 (utils/memory.py)", (),
+)
+MEMORY_WAITING = _gauge(
+    "model_api_memory_waiting_requests", "메모리 예산이 나기를 기다리는 요청 수", (),
+)
+REQUEST_IMAGE_BYTES = _histogram(
+    "model_api_request_image_bytes_peak", "요청별 이미지 버퍼 최대 보유량 (바이트)", ("endpoint",),
+    buckets=tuple(mb * 1024 * 1024 for mb in (1, 4, 16, 32, 64, 128, 256, 512, 1024)),
+)
+GENAI_KEY_CALLS = _counter(
+    "model_api_genai_key_calls_total", "API 키별 모델 호출 수 (utils/genai_client.py 키 풀)", ("key", "outcome"),
+)
+GENAI_KEY_IN_FLIGHT = _gauge(
+    "model_api_genai_key_in_flight", "API 키별 진행 중 모델 호출 수", ("key",),
+)
+SINGLEFLIGHT = _counter(
+    "model_api_singleflight_total", "동시 실행 합치기 (leader: 실제 실행, shared: 결과 공유)", ("flight", "role"),
+)
+EVENT_LOOP_LAG = _histogram(
+    "model_api_event_loop_lag_seconds", "이벤트 루프 지연 (예정 대비 늦게 깨어난 시간)", (), buckets=_LAG_BUCKETS,
+)
+EVENT_LOOP_LAG_MAX = _gauge(
+    "model_api_event_loop_lag_max_seconds", "최근 샘플의 이벤트 루프 지연", (), mode="livemax",
+)
+
+_MODEL_STAGES = ("text.generate", "page.model_call")
+_CONTEXT_CACHE_STAGES = ("context_cache.create", "context_cache.extend")
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """캐시 조회 결과 기록"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_singleflight(flight: str, shared: bool) -> None:
+    """single-flight 실행/공유 기록"""
+    SINGLEFLIGHT.labels(flight, "shared" if shared else "leader").inc()
+
+
+def _observe_span(s: Span) -> None:
+    """tracing 의 span 종료 이벤트를 메트릭으로 변환"""
+    seconds = s.duration_ms / 1000
+    attrs = s.attributes
+    outcome = "error" if s.error else "ok"
+
+    if s.parent_id is None:
+        status = attrs.get("http_status", 500 if s.error else 200)
+        REQUEST_LATENCY.labels(attrs.get("endpoint", s.name), attrs.get("http_method", ""), str(status)).observe(seconds)
+        return
+
+    STAGE_LATENCY.labels(s.name).observe(seconds)
+    if s.name in _MODEL_STAGES:
+        model = str(attrs.get("model", "unknown"))
+        MODEL_CALLS.labels(model, outcome, str(attrs.get("finish_reason", ""))).inc()
+        MODEL_LATENCY.labels(model, outcome).observe(seconds)
+        endpoint = str(s.trace.root.attributes.get("endpoint", "none"))
+        for kind in ("input", "cached", "output", "image_output", "thinking"):
+            tokens = attrs.get(f"{kind}_tokens")
+            if tokens:
+                MODEL_TOKENS.labels(model, endpoint, kind).inc(tokens)
+        if attrs.get("cost_usd"):
+            MODEL_COST.labels(model, endpoint).inc(attrs["cost_usd"])
+    elif s.name in _CONTEXT_CACHE_STAGES:
+        # 컨텍스트 캐시 보관 비용도 모델 비용에 합산
+        if attrs.get("cost_usd"):
+            endpoint = str(s.trace.root.attributes.get("endpoint", "none"))
+            MODEL_COST.labels(str(attrs.get("model", "unknown")), endpoint).inc(attrs["cost_usd"])
+    elif s.name == "storage.upload":
+        backend = str(attrs.get("backend", "unknown"))
+        STORAGE_LATENCY.labels(backend, outcome).observe(seconds)
+        if not s.error:
+            STORAGE_BYTES.labels(backend).inc(attrs.get("bytes_in", 0))
+
+
+if ENABLED:
+    add_span_listener(_observe_span)
+
+
+def _sample_executors(loop: asyncio.AbstractEventLoop) -> None:
+    """anyio 스레드풀(동기 엔드포인트/StreamingResponse)과 asyncio 기본 executor 포화도 샘플링"""
+    try:
+        import anyio.to_thread
+
+        stats = anyio.to_thread.current_default_thread_limiter().statistics()
+        EXECUTOR_BUSY.labels("anyio").set(stats.borrowed_tokens)
+        EXECUTOR_CAPACITY.labels("anyio").set(stats.total_tokens)
+        EXECUTOR_QUEUE.labels("anyio").set(stats.tasks_waiting)
+    except Exception:
+        pass
+
+    # run_in_executor(None, ...) 가 쓰는 기본 ThreadPoolExecutor (내부 속성이라 방어적으로 접근)
+    executor = getattr(loop, "_default_executor", None)
+    if executor is not None:
+        threads = len(getattr(executor, "_threads", ()))
+        idle = getattr(getattr(executor, "_idle_semaphore", None), "_value", 0)
+        EXECUTOR_BUSY.labels("asyncio_default").set(max(0, threads - idle))
+        EXECUTOR_CAPACITY.labels("asyncio_default").set(getattr(executor, "_max_workers", 0))
+        EXECUTOR_QUEUE.labels("asyncio_default").set(executor._work_queue.qsize())
+
+
+async def sample_runtime(interval: float = 1.0) -> None:
+    """이벤트 루프 지연과 스레드풀 상태를 주기적으로 기록 (startup 에서 백그라운드 태스크로 실행)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_MAX.set(lag)
+        _sample_executors(loop)
+
+
+def render_metrics() -> Tuple[Optional[bytes], str]:
+    """/metrics 응답 본문과 Content-Type (미설치 시 본문 None)"""
+    if not ENABLED:
+        return None, CONTENT_TYPE_LATEST
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """워커 종료 시 livesum/livemax 게이지에서 해당 프로세스 값을 제외 (gunicorn child_exit 에서는 워커 pid 전달)"""
+    if ENABLED and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
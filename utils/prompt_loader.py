@@ -2,14 +2,145 @@
 프롬프트 로더 유틸리티
 
 프롬프트를 md/json 파일로 관리하고 런타임에 동적으로 로드하는 모듈
+
+프롬프트 조각(fragment):
+    요청마다 일부만 필요한 구간은 태그를 단 조각으로 감싸 두면, 렌더링 전에 요청 변수와
+    맞지 않는 조각을 제거합니다 (예: 선택한 테두리 사양, 선택한 톤 가이드만 전송).
+
+    <!-- fragment border_design_id=border1|classic_gold -->
+    ## border1 (클래식 프레임)
+    ...
+    <!-- /fragment -->
+
+    - key=a|b : 변수 key 가 a 또는 b 일 때만 포함. 변수가 없거나 어느 조각에도 없는 값이면
+                같은 key 의 조각을 모두 포함 (모르는 값으로 정보를 잃지 않도록)
+    - flag    : 변수 flag 가 참일 때만 포함 (예: diagram - ASCII 레이아웃 도식)
+
+    PromptLoader.assemble() 은 가지치기 전후의 추정 토큰 수를 함께 돌려주고 현재 trace span 에
+    prompt_tokens / prompt_tokens_full 로 누적합니다. 파일별 비교는 python -m utils.prompt_loader.
 """
 
 import os
 import json
-from typing import Dict, Any
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, Set, Tuple
 from pathlib import Path
 from jinja2 import Template
 
+from utils.tracing import current_span
+
+_FRAGMENT_RE = re.compile(
+    r"<!--\s*fragment\s+(?P<tags>.*?)\s*-->[ \t]*\n?(?P<body>.*?)<!--\s*/fragment\s*-->[ \t]*\n?",
+    re.DOTALL,
+)
+
+
+@lru_cache(maxsize=256)
+def _read_file(path: str, mtime_ns: int) -> str:
+    """파일 내용 캐시 (수정 시각이 바뀌면 다시 읽음)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def read_text_cached(path: str) -> str:
+    """프롬프트 파일을 읽되, 변경되지 않았으면 메모리 캐시에서 반환"""
+    return _read_file(str(path), os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=256)
+def _compile_template(content: str) -> Template:
+    """Jinja2 템플릿 컴파일 결과 캐시 (같은 원문이면 재컴파일하지 않음)"""
+    return Template(content)
+
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수 (영문 4자, 한글 등은 1.5자당 1토큰)"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + int((len(text) - ascii_chars) / 1.5)
+
+
+def _parse_tags(raw: str) -> Dict[str, Set[str]]:
+    """태그 파싱: tone=formal|classic diagram → {"tone": {"formal", "classic"}, "diagram": set()}"""
+    tags: Dict[str, Set[str]] = {}
+    for token in raw.split():
+        key, _, values = token.partition("=")
+        tags[key] = {v.lower() for v in values.split("|") if v}
+    return tags
+
+
+@lru_cache(maxsize=256)
+def _prune(content: str, selected: Tuple[Tuple[str, str], ...]) -> Tuple[str, int]:
+    matches = list(_FRAGMENT_RE.finditer(content))
+    if not matches:
+        return content, 0
+
+    parsed = [_parse_tags(m.group("tags")) for m in matches]
+    known: Dict[str, Set[str]] = {}
+    for tags in parsed:
+        for key, values in tags.items():
+            known.setdefault(key, set()).update(values)
+    selectors = dict(selected)
+
+    def keep(tags: Dict[str, Set[str]]) -> bool:
+        for key, values in tags.items():
+            value = selectors.get(key, "")
+            if not values:
+                if not value:
+                    return False
+            elif value in known[key] and value not in values:
+                return False
+        return True
+
+    parts = []
+    dropped = 0
+    pos = 0
+    for match, tags in zip(matches, parsed):
+        parts.append(content[pos:match.start()])
+        if keep(tags):
+            parts.append(match.group("body"))
+        else:
+            dropped += 1
+        pos = match.end()
+    parts.append(content[pos:])
+    return "".join(parts), dropped
+
+
+def prune_fragments(content: str, variables: Dict[str, Any] = None) -> Tuple[str, int]:
+    """
+    요청 변수와 맞지 않는 조각을 제거하고 조각 태그를 지웁니다.
+
+    Returns:
+        (가지친 템플릿, 제외된 조각 수)
+    """
+    selected = tuple(sorted(
+        (key, str(value).lower() if not isinstance(value, bool) else ("1" if value else ""))
+        for key, value in (variables or {}).items()
+        if isinstance(value, (str, bool, int))
+    ))
+    return _prune(content, selected)
+
+
+def strip_fragment_tags(content: str) -> str:
+    """모든 조각을 포함한 원문 (가지치기 전 비교용)"""
+    return _FRAGMENT_RE.sub(lambda m: m.group("body"), content)
+
+
+@dataclass
+class AssembledPrompt:
+    """조립된 프롬프트와 가지치기 전후 추정 토큰 수"""
+
+    text: str
+    tokens: int
+    full_tokens: int
+    dropped: int
+
+
+def combine_prompts(system_prompt: str, task_prompt: str) -> str:
+    """시스템 프롬프트와 태스크 프롬프트를 구분선으로 결합"""
+    return f"{system_prompt}\n\n---\n\n{task_prompt}"
+
 
 class PromptLoader:
     """프롬프트 템플릿 로더"""
@@ -43,19 +174,40 @@ class PromptLoader:
             ...     {"tone": "romantic", "groom_name": "홍길동"}
             ... )
         """
+        return self.assemble(path, variables).text
+
+    def assemble(self, path: str, variables: Dict[str, Any] = None) -> AssembledPrompt:
+        """
+        요청에 맞는 조각만 남겨 프롬프트를 렌더링하고 가지치기 전후 토큰 수를 기록합니다.
+
+        Args:
+            path: base_path 기준 상대 경로
+            variables: 템플릿 변수 (조각 선택에도 사용)
+
+        Returns:
+            AssembledPrompt(text, tokens, full_tokens, dropped)
+        """
         file_path = self.base_path / path
 
         if not file_path.exists():
             raise FileNotFoundError(f"프롬프트 파일을 찾을 수 없습니다: {file_path}")
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            template_content = f.read()
+        template_content = read_text_cached(file_path)
+        pruned, dropped = prune_fragments(template_content, variables)
+        full = strip_fragment_tags(template_content) if dropped else pruned
 
         if variables:
-            template = Template(template_content)
-            return template.render(**variables)
+            text = _compile_template(pruned).render(**variables)
+            full_text = _compile_template(full).render(**variables) if dropped else text
+        else:
+            text = full_text = pruned
 
-        return template_content
+        assembled = AssembledPrompt(text, estimate_tokens(text), estimate_tokens(full_text), dropped)
+        current = current_span()
+        if current is not None:
+            current.add("prompt_tokens", assembled.tokens)
+            current.add("prompt_tokens_full", assembled.full_tokens)
+        return assembled
 
     def load_schema(self, path: str) -> Dict[str, Any]:
         """
@@ -76,8 +228,26 @@ class PromptLoader:
         if not file_path.exists():
             raise FileNotFoundError(f"스키마 파일을 찾을 수 없습니다: {file_path}")
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        # 호출 측에서 수정해도 캐시가 오염되지 않도록 매번 새 dict 로 파싱
+        return json.loads(read_text_cached(file_path))
+
+    def warmup(self) -> int:
+        """
+        base_path 아래 모든 md/json 파일을 미리 읽고 md 는 Jinja2 로 컴파일합니다.
+
+        Returns:
+            처리한 파일 수
+        """
+        count = 0
+        for file_path in sorted(self.base_path.rglob("*")):
+            if file_path.suffix == ".md":
+                _compile_template(read_text_cached(file_path))
+            elif file_path.suffix == ".json":
+                json.loads(read_text_cached(file_path))
+            else:
+                continue
+            count += 1
+        return count
 
     def load_combined(self,
                       system_path: str,
@@ -105,7 +275,7 @@ class PromptLoader:
         system_prompt = self.load_prompt(system_path)
         task_prompt = self.load_prompt(task_path, variables)
 
-        return f"{system_prompt}\n\n---\n\n{task_prompt}"
+        return combine_prompts(system_prompt, task_prompt)
 
 
 class GeminiPromptBuilder:
@@ -132,6 +302,8 @@ class GeminiPromptBuilder:
         Returns:
             {
                 "prompt": "최종 프롬프트",
+                "system": "시스템 프롬프트",
+                "task": "태스크 프롬프트",
                 "schema": {...}  # JSON 스키마
             }
         """
@@ -149,16 +321,16 @@ class GeminiPromptBuilder:
             "address": address,
         }
 
-        prompt = self.loader.load_combined(
-            "invitation/system.md",
-            "invitation/text_generate.md",
-            variables
-        )
+        # 시스템 프롬프트는 요청마다 같으므로 컨텍스트 캐시 대상으로 따로 반환
+        system = self.loader.load_prompt("invitation/system.md")
+        task = self.loader.load_prompt("invitation/text_generate.md", variables)
 
         schema = self.loader.load_schema("invitation/text_schema.json")
 
         return {
-            "prompt": prompt,
+            "prompt": combine_prompts(system, task),
+            "system": system,
+            "task": task,
             "schema": schema
         }
 
@@ -195,8 +367,9 @@ class NanobananaPromptBuilder:
                           groom_mother: str,
                           bride_father: str,
                           bride_mother: str,
-                          border_design_id: str) -> str:
-        """페이지 2 (인사말 & 초대) 프롬프트 생성"""
+                          border_design_id: str,
+                          tone: str = None) -> str:
+        """페이지 2 (인사말 & 초대) 프롬프트 생성 (tone 을 주면 해당 톤의 색상 팔레트만 포함)"""
         variables = {
             "greeting_text": greeting_text,
             "invitation_text": invitation_text,
@@ -208,6 +381,8 @@ class NanobananaPromptBuilder:
             "bride_mother": bride_mother,
             "border_design_id": border_design_id,
         }
+        if tone:
+            variables["tone"] = tone
 
         return self.loader.load_combined(
             "nanobanana/system.md",
@@ -314,3 +489,17 @@ if __name__ == "__main__":
         border_design_id="border1"
     )
     print(page1[:500])
+
+    # 3. 조각 가지치기 전후 토큰 수
+    print("\n" + "="*50 + "\n")
+    print("✂️  프롬프트 가지치기 (추정 토큰, 전 → 후):")
+    loader = PromptLoader()
+    samples = {
+        "invitation/text_generate.md": {"tone": "romantic"},
+        "nanobanana/page1_cover.md": {"border_design_id": "border2"},
+        "nanobanana/page2_content.md": {"border_design_id": "border2", "tone": "romantic"},
+        "nanobanana/page3_location.md": {"border_design_id": "border2"},
+    }
+    for path, variables in samples.items():
+        assembled = loader.assemble(path, variables)
+        print(f"  {path}: {assembled.full_tokens} → {assembled.tokens} (제외 조각 {assembled.dropped}개)")
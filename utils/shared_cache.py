@@ -0,0 +1,228 @@
+"""
+워커 간 공유 캐시 유틸리티 (SQLite WAL)
+
+멀티 워커(gunicorn -w N)에서는 프로세스 메모리 캐시가 워커마다 따로 생겨 적중률이 1/N 로
+떨어집니다. 같은 호스트의 모든 워커가 SQLite 파일 하나를 WAL 모드(동시 읽기 + 단일 쓰기)로
+공유해 다운로드한 이미지, 지도, 생성 문구를 재사용합니다.
+
+    from utils.shared_cache import shared_cache
+    data = shared_cache.get("image", url)
+    if data is None:
+        data = download(url)
+        shared_cache.set("image", url, data)
+
+캐시 오류(디스크 가득 참, 잠금 시간 초과 등)는 경고만 남기고 미스로 처리합니다.
+
+환경 변수:
+    SHARED_CACHE_PATH    : SQLite 파일 경로 (기본 <tempdir>/wedding-model-cache.sqlite3, "off" 이면 끔)
+    SHARED_CACHE_MAX_MB  : 최대 용량, 넘으면 오래 안 쓴 항목부터 삭제 (기본 512)
+    IMAGE_CACHE_TTL      : 다운로드 이미지 보관 초 (기본 3600, 적중 시 ETag/Last-Modified 로 재검증)
+    MAP_CACHE_TTL        : 지도 이미지 보관 초 (기본 604800)
+    TEXT_CACHE_TTL       : 생성 문구 보관 초 (기본 0 = 캐시 안 함, 같은 입력에 같은 문구가 나가므로 선택)
+    INVITATION_CACHE_TTL : 청첩장 전체 결과 보관 초 (기본 0, utils/invitation_cache.py)
+    RENDER_CACHE_TTL     : hybrid 렌더링의 커버 URL/배경 이미지 보관 초 (기본 86400, nanobanana_api.py)
+    STYLE_FEATURES_TTL   : 스타일 이미지 특징(팔레트 등) 보관 초 (기본 2592000, utils/style_features.py)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TTLS: Dict[str, int] = {
+    "image": int(os.environ.get("IMAGE_CACHE_TTL", "3600")),
+    "map": int(os.environ.get("MAP_CACHE_TTL", str(7 * 24 * 3600))),
+    "text": int(os.environ.get("TEXT_CACHE_TTL", "0")),
+    "invitation": int(os.environ.get("INVITATION_CACHE_TTL", "0")),
+    "render": int(os.environ.get("RENDER_CACHE_TTL", "86400")),
+    "style": int(os.environ.get("STYLE_FEATURES_TTL", str(30 * 24 * 3600))),
+}
+
+# 매 조회마다 쓰기가 생기지 않도록 접근 시각은 이 간격 이상 지났을 때만 갱신
+_TOUCH_INTERVAL = 60.0
+# 이 횟수만큼 쓸 때마다 용량 확인
+_EVICT_EVERY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+
+def _default_path() -> str:
+    return os.path.join(tempfile.gettempdir(), "wedding-model-cache.sqlite3")
+
+
+class SharedCache:
+    """네임스페이스별 bytes 캐시 (스레드/프로세스 안전)"""
+
+    def __init__(self, path: Optional[str], max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _conn(self) -> sqlite3.Connection:
+        # 스레드마다, 그리고 fork 이후에는 프로세스마다 새 연결
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, ns: str, key: str) -> Optional[bytes]:
+        """캐시된 값 (없거나 만료되면 None)"""
+        if not self.enabled or DEFAULT_TTLS.get(ns, 1) <= 0:
+            return None
+        hashed = self._key(key)
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE ns = ? AND key = ?", (ns, hashed)
+            ).fetchone()
+            if row is not None and row[1] < now:
+                conn.execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, hashed))
+                row = None
+            elif row is not None and now - row[2] > _TOUCH_INTERVAL:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE ns = ? AND key = ?", (now, ns, hashed))
+        except sqlite3.Error as e:
+            logger.warning("shared cache read failed", extra={"fields": {"ns": ns, "error": str(e)}})
+            row = None
+        metrics.record_cache(ns, row is not None)
+        return None if row is None else bytes(row[0])
+
+    def set(self, ns: str, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """값 저장 (ttl 미지정 시 네임스페이스 기본값, 0 이하면 저장 안 함)"""
+        ttl = DEFAULT_TTLS.get(ns, 3600) if ttl is None else ttl
+        if not self.enabled or ttl <= 0:
+            return
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (ns, key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (ns, self._key(key), value, len(value), now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.warning("shared cache write failed", extra={"fields": {"ns": ns, "error": str(e)}})
+
+    def add(self, ns: str, key: str, value: bytes, ttl: float) -> bool:
+        """키가 없거나 만료된 경우에만 저장 (워커 간 선점용, 저장했으면 True)"""
+        if not self.enabled:
+            return True
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM entries WHERE ns = ? AND key = ? AND expires_at < ?", (ns, self._key(key), now))
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO entries (ns, key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (ns, self._key(key), value, len(value), now + ttl, now),
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return inserted == 1
+        except sqlite3.Error as e:
+            logger.warning("shared cache add failed", extra={"fields": {"ns": ns, "error": str(e)}})
+            return True
+
+    def peek(self, ns: str, key: str) -> Optional[bytes]:
+        """만료되지 않은 값 조회 (접근 시각/메트릭을 건드리지 않음, 선점 상태 확인용)"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM entries WHERE ns = ? AND key = ? AND expires_at >= ?", (ns, self._key(key), time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return None if row is None else bytes(row[0])
+
+    def get_json(self, ns: str, key: str) -> Optional[Any]:
+        raw = self.get(ns, key)
+        return None if raw is None else json.loads(raw)
+
+    def set_json(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(ns, key, json.dumps(value, ensure_ascii=False).encode("utf-8"), ttl)
+
+    def delete(self, ns: str, key: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._conn().execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, self._key(key)))
+        except sqlite3.Error as e:
+            logger.warning("shared cache delete failed", extra={"fields": {"ns": ns, "error": str(e)}})
+
+    def evict(self) -> int:
+        """만료 항목 삭제 후, 최대 용량을 넘으면 오래 안 쓴 항목부터 삭제 (삭제 수 반환)"""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for rowid, size in conn.execute("SELECT rowid, size FROM entries ORDER BY accessed_at"):
+                stale.append((rowid,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM entries WHERE rowid = ?", stale)
+            removed += len(stale)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        rows = self._conn().execute("SELECT ns, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY ns").fetchall()
+        return {
+            "enabled": True,
+            "path": self.path,
+            "namespaces": {ns: {"entries": count, "bytes": size} for ns, count, size in rows},
+        }
+
+
+def _from_env() -> SharedCache:
+    path = os.environ.get("SHARED_CACHE_PATH", _default_path())
+    if path.lower() in ("", "off", "0"):
+        path = None
+    return SharedCache(path, int(float(os.environ.get("SHARED_CACHE_MAX_MB", "512")) * 1024 * 1024))
+
+
+shared_cache = _from_env()
@@ -0,0 +1,98 @@
+"""
+동시 실행 합치기(single-flight) 유틸리티
+
+같은 키의 작업이 이미 실행 중이면 새로 실행하지 않고 그 결과(또는 예외)를 함께 받습니다.
+백엔드 재시도로 같은 청첩장 생성이 겹치거나, 같은 스타일 이미지/지도를 여러 요청이 동시에
+받으러 갈 때 모델 호출과 다운로드를 1회로 줄입니다. 프로세스(워커) 안에서만 합쳐지며,
+워커 간 중복은 utils/idempotency.py 가 공유 캐시로 막습니다.
+
+    _downloads = SingleFlight("image_download")
+    content, shared = _downloads.do(url, fetch, url)
+
+    _invitations = AsyncSingleFlight("invitation")
+    body, shared = await _invitations.do(key, lambda: build_body(...))
+
+토큰/비용은 실제로 실행한 요청(leader)의 trace 에만 기록됩니다.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """스레드용 (동기 함수)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, bool]:
+        """(결과, 다른 호출의 결과를 공유받았는지)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.record_singleflight(self.name, shared=True)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        metrics.record_singleflight(self.name, shared=False)
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """이벤트 루프용 (코루틴). 먼저 온 요청이 끊겨도 작업은 끝까지 실행되어 나머지에게 전달됨"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """(결과, 다른 호출의 결과를 공유받았는지)"""
+        task = self._tasks.get(key)
+        # 다른 이벤트 루프의 태스크는 기다릴 수 없음 (테스트 클라이언트 등)
+        shared = task is not None and task.get_loop() is asyncio.get_running_loop()
+        if not shared:
+            # 태스크는 현재 컨텍스트(leader 의 trace/request_id)를 복사해 실행됨
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._tasks.pop(key) if self._tasks.get(key) is t else None)
+        metrics.record_singleflight(self.name, shared=shared)
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
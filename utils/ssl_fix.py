@@ -15,24 +15,29 @@ import urllib3
 from requests.adapters import HTTPAdapter
 from urllib3.util.ssl_ import create_urllib3_context
 
-# SNI(Server Name Indication) 강제 비활성화 (TLSV1_UNRECOGNIZED_NAME 오류 해결책)
-try:
-    import urllib3.util.ssl_
-    urllib3.util.ssl_.HAS_SNI = False
-    
-    # 더 깊은 레벨에서의 SNI 비활성화 및 SSL 컨텍스트 패치
-    from urllib3.util import ssl_ as urllib3_ssl
-    _original_create_urllib3_context = urllib3_ssl.create_urllib3_context
-    
-    def patched_create_urllib3_context(*args, **kwargs):
-        context = _original_create_urllib3_context(*args, **kwargs)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        return context
-    
-    urllib3_ssl.create_urllib3_context = patched_create_urllib3_context
-except Exception:
-    pass
+_configured = False
+
+
+def _patch_urllib3():
+    """SNI(Server Name Indication) 강제 비활성화 (TLSV1_UNRECOGNIZED_NAME 오류 해결책)"""
+    try:
+        import urllib3.util.ssl_
+        urllib3.util.ssl_.HAS_SNI = False
+
+        # 더 깊은 레벨에서의 SNI 비활성화 및 SSL 컨텍스트 패치
+        from urllib3.util import ssl_ as urllib3_ssl
+        _original_create_urllib3_context = urllib3_ssl.create_urllib3_context
+
+        def patched_create_urllib3_context(*args, **kwargs):
+            context = _original_create_urllib3_context(*args, **kwargs)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            return context
+
+        urllib3_ssl.create_urllib3_context = patched_create_urllib3_context
+    except Exception:
+        pass
+
 
 class TLSAdapter(HTTPAdapter):
     """
@@ -52,8 +57,16 @@ class TLSAdapter(HTTPAdapter):
 def configure_ssl_globally():
     """
     전역 SSL 설정을 구성합니다.
-    애플리케이션 시작 시 한 번 호출하세요.
+    애플리케이션 시작 시 한 번 호출하세요. (import 만으로는 아무것도 패치하지 않으며,
+    여러 번 호출해도 한 번만 적용됩니다)
     """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    _patch_urllib3()
+
     # 1. certifi CA 번들 사용
     cert_path = certifi.where()
     os.environ['SSL_CERT_FILE'] = cert_path
@@ -169,11 +182,9 @@ def test_ssl_connection(url: str = "https://www.google.com") -> bool:
         return False
 
 
-# 애플리케이션 시작 시 자동 설정
-configure_ssl_globally()
-
-
 if __name__ == "__main__":
+    configure_ssl_globally()
+
     print("=" * 80)
     print("SSL 설정 테스트")
     print("=" * 80)
@@ -0,0 +1,263 @@
+"""
+스타일 이미지 Files API 등록 유틸리티
+
+나노바나나 파이프라인은 한 청첩장에 스타일 이미지를 페이지마다(3회) 인라인으로 보내고,
+스타일 카탈로그는 소수의 이미지를 수천 명이 함께 씁니다. 스타일 이미지를 내용 해시 기준으로
+Gemini Files API 에 한 번만 올려 두고, 모델 요청 contents 에는 바이트 대신 file URI 를 넣습니다.
+
+    from utils import style_assets
+    contents = [prompt, wedding_img, style_assets.registry.part(style_image_base64)]
+
+- 키: sha256(이미지 바이트) + API 키 (업로드 파일은 키의 프로젝트에 속함)
+- 업로드 파일은 48시간 뒤 만료되므로, 만료 STYLE_ASSET_REFRESH_MARGIN 초 전부터는 다시 올립니다.
+- 핸들은 공유 캐시(utils/shared_cache.py, "style-asset")로 워커 간에 나누고,
+  같은 이미지의 동시 업로드는 single-flight 로 1회만 실행합니다.
+- 업로드가 실패하면 인라인으로 보내고 STYLE_ASSET_RETRY 초 동안 다시 시도하지 않습니다.
+  모델 호출이 파일을 찾지 못하면(만료/삭제) invalidate() 후 인라인으로 재시도하면 됩니다.
+
+오프라인 테스트/벤치마크에서는 OfflineFiles 를 files 백엔드로 넣은 레지스트리를 쓰세요
+(benchmarks/stubs.py 가 patched_backends 안에서 교체합니다).
+
+환경 변수:
+    STYLE_ASSETS                : files (기본) 또는 inline (항상 인라인 전송)
+    STYLE_ASSET_REFRESH_MARGIN  : 만료 몇 초 전부터 재업로드할지 (기본 3600)
+    STYLE_ASSET_RETRY           : 업로드 실패 후 재시도까지 초 (기본 60)
+"""
+
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from utils.genai_client import get_genai_client, key_owner
+from utils.log import get_logger
+from utils.shared_cache import shared_cache
+from utils.singleflight import SingleFlight
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = get_logger(__name__)
+
+STYLE_ASSETS = os.environ.get("STYLE_ASSETS", "files").lower()
+REFRESH_MARGIN = float(os.environ.get("STYLE_ASSET_REFRESH_MARGIN", "3600"))
+RETRY_AFTER = float(os.environ.get("STYLE_ASSET_RETRY", "60"))
+
+# Files API 보관 기간 (응답에 expiration_time 이 없을 때 사용)
+FILE_LIFETIME = 48 * 3600
+# 업로드 직후 PROCESSING 상태면 ACTIVE 가 될 때까지 기다리는 최대 초
+_ACTIVE_WAIT = 10.0
+
+NAMESPACE = "style-asset"
+
+
+@dataclass
+class StyleAsset:
+    """업로드된 스타일 이미지 핸들"""
+
+    name: str
+    uri: str
+    mime_type: str
+    expires_at: float
+    size: int
+
+    def fresh(self, now: Optional[float] = None) -> bool:
+        return self.expires_at - (now or time.time()) > REFRESH_MARGIN
+
+
+def sniff_mime_type(data: bytes) -> str:
+    """이미지 매직 바이트로 MIME 타입 추정 (모르면 image/png)"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "image/png"
+
+
+def _expires_at(file: Any) -> float:
+    expiration = getattr(file, "expiration_time", None)
+    if expiration is None:
+        return time.time() + FILE_LIFETIME
+    return expiration.timestamp()
+
+
+def _is_active(file: Any) -> bool:
+    state = getattr(file, "state", None)
+    return state is None or str(getattr(state, "value", state)) in ("ACTIVE", "STATE_UNSPECIFIED")
+
+
+def is_missing_file_error(error: BaseException) -> bool:
+    """모델 호출 오류가 만료/삭제된 파일 참조 때문인지"""
+    message = str(error)
+    return ("403" in message or "404" in message or "PERMISSION_DENIED" in message or "NOT_FOUND" in message) \
+        and "file" in message.lower()
+
+
+class StyleAssetRegistry:
+    """내용 해시 → Files API 핸들 (스레드 안전)"""
+
+    def __init__(self, files: Optional[Callable[[], Any]] = None, shared: bool = True, enabled: bool = True):
+        # files: client.files 와 같은 객체를 돌려주는 함수 (기본은 Gemini 클라이언트의 files)
+        self._files = files or (lambda: get_genai_client().files)
+        self._shared = shared
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._assets: Dict[str, StyleAsset] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._uploads = SingleFlight("style_asset_upload")
+
+    @staticmethod
+    def _key(digest: str) -> str:
+        owner = key_owner()
+        return f"{owner}:{digest}"
+
+    def resolve(self, data: bytes) -> Optional[StyleAsset]:
+        """업로드된 핸들 (없거나 곧 만료되면 업로드, 실패하면 None)"""
+        if not self.enabled:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        key = self._key(digest)
+        now = time.time()
+
+        with self._lock:
+            asset = self._assets.get(key)
+            if asset is not None and asset.fresh(now):
+                return asset
+            if self._failed_until.get(key, 0) > now:
+                return None
+
+        if self._shared:
+            stored = shared_cache.get_json(NAMESPACE, key)
+            if stored is not None:
+                asset = StyleAsset(**stored)
+                if asset.fresh(now):
+                    with self._lock:
+                        self._assets[key] = asset
+                    return asset
+
+        try:
+            asset, _ = self._uploads.do(key, self._upload, key, digest, data)
+        except Exception as e:
+            logger.warning("style asset upload failed, sending inline", extra={"fields": {"sha256": digest[:16], "error": str(e)}})
+            with self._lock:
+                self._failed_until[key] = time.time() + RETRY_AFTER
+            return None
+        return asset
+
+    def _upload(self, key: str, digest: str, data: bytes) -> StyleAsset:
+        mime_type = sniff_mime_type(data)
+        files = self._files()
+        with span("style_asset.upload", bytes_in=len(data), mime_type=mime_type):
+            file = files.upload(
+                file=io.BytesIO(data),
+                config={"mime_type": mime_type, "display_name": f"style-{digest[:16]}"},
+            )
+            deadline = time.monotonic() + _ACTIVE_WAIT
+            while not _is_active(file) and time.monotonic() < deadline:
+                time.sleep(0.5)
+                file = files.get(name=file.name)
+            if not _is_active(file):
+                raise RuntimeError(f"uploaded file not active: {file.name} ({file.state})")
+
+        asset = StyleAsset(
+            name=file.name,
+            uri=file.uri,
+            mime_type=getattr(file, "mime_type", None) or mime_type,
+            expires_at=_expires_at(file),
+            size=len(data),
+        )
+        logger.info("style asset uploaded", extra={"fields": {"sha256": digest[:16], "name": asset.name, "bytes": len(data)}})
+        with self._lock:
+            self._assets[key] = asset
+            self._failed_until.pop(key, None)
+        if self._shared:
+            # 워커 간 공유 항목은 재업로드 시점에 맞춰 만료
+            shared_cache.set_json(NAMESPACE, key, asdict(asset), ttl=asset.expires_at - REFRESH_MARGIN - time.time())
+        return asset
+
+    def invalidate(self, data: bytes) -> None:
+        """파일이 만료/삭제된 것으로 확인되면 핸들을 버림 (다음 호출 때 다시 업로드)"""
+        key = self._key(hashlib.sha256(data).hexdigest())
+        with self._lock:
+            self._assets.pop(key, None)
+        if self._shared:
+            shared_cache.delete(NAMESPACE, key)
+
+    def part(self, image_base64: Optional[str]) -> Optional["types.Part"]:
+        """모델 contents 에 넣을 Part (등록 실패 시 인라인 바이트)"""
+        if not image_base64:
+            return None
+        data = base64.b64decode(image_base64)
+        return self.part_for_bytes(data)
+
+    def part_for_bytes(self, data: bytes, inline: bool = False) -> "types.Part":
+        from google.genai import types
+
+        asset = None if inline else self.resolve(data)
+        if asset is None:
+            return types.Part.from_bytes(data=data, mime_type=sniff_mime_type(data))
+        return types.Part.from_uri(file_uri=asset.uri, mime_type=asset.mime_type)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "assets": len(self._assets),
+                "bytes": sum(a.size for a in self._assets.values()),
+                "failed": sum(1 for until in self._failed_until.values() if until > time.time()),
+            }
+
+
+class OfflineFiles:
+    """
+    client.files 의 오프라인 대역 (upload / get / delete)
+
+    네트워크 없이 업로드를 메모리에 기록하고 File 과 같은 모양의 객체를 돌려줍니다.
+    lifetime 을 짧게 주면 만료 전 재업로드 동작을 확인할 수 있습니다.
+    """
+
+    def __init__(self, lifetime: float = FILE_LIFETIME, on_upload: Optional[Callable[[int], None]] = None):
+        self.lifetime = lifetime
+        self.on_upload = on_upload
+        self.uploads = 0
+        self.files: Dict[str, Any] = {}
+
+    def upload(self, *, file: Any, config: Any = None) -> Any:
+        from datetime import datetime, timezone
+
+        data = file.read() if hasattr(file, "read") else open(file, "rb").read()
+        config = config or {}
+        mime_type = config.get("mime_type") if isinstance(config, dict) else getattr(config, "mime_type", None)
+        name = f"files/offline-{uuid.uuid4().hex[:12]}"
+        if self.on_upload:
+            self.on_upload(len(data))
+        self.uploads += 1
+        self.files[name] = SimpleNamespace(
+            name=name,
+            uri=f"offline://{name}",
+            mime_type=mime_type or sniff_mime_type(data),
+            size_bytes=len(data),
+            state="ACTIVE",
+            expiration_time=datetime.fromtimestamp(time.time() + self.lifetime, tz=timezone.utc),
+        )
+        return self.files[name]
+
+    def get(self, *, name: str) -> Any:
+        if name not in self.files:
+            raise RuntimeError(f"404 NOT_FOUND: file {name} does not exist")
+        return self.files[name]
+
+    def delete(self, *, name: str) -> None:
+        self.files.pop(name, None)
+
+
+registry = StyleAssetRegistry(enabled=STYLE_ASSETS != "inline")
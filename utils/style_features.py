@@ -0,0 +1,312 @@
+"""
+스타일 이미지 특징 추출 (대표 색 팔레트, 밝기/대비/채도/질감) - NumPy 벡터화, 스타일 해시별 캐시
+
+페이지 프롬프트는 스타일을 "Based on the provided style reference image" 로만 설명해서 모델이 매 호출마다
+이미지 전체에서 색을 추론합니다. 스타일 이미지마다 한 번만 특징을 뽑아 캐시하고, 짧은 설명문으로
+프롬프트에 붙입니다 (nanobanana_api.py). 설명문이 있으면 2/3페이지 호출에서 스타일 이미지를 빼는 것도
+선택할 수 있습니다 (STYLE_IMAGE_PAGES=first).
+
+    features = style_features.features_for(style_bytes)      # 캐시 (프로세스 LRU → 공유 캐시 "style")
+    prompt += "\\n" + features.prompt_descriptor()
+    # - Style analysis: palette #F4EDE2 38%, #C8A97E 22%, ...; light, low contrast, muted, warm; smooth texture
+
+- 이미지를 64x64 로 줄인 뒤 (JPEG 는 draft 디코딩) 픽셀을 (이미지 수, 픽셀 수, 3) 배열로 쌓아
+  여러 이미지의 k-means(k-means++ 초기화)를 한 번에 돌립니다. 거리 계산은 |x|² - 2x·c + |c|² 로
+  (이미지, 픽셀, k) 크기만 만듭니다.
+- 카탈로그 일괄 처리 (수천 개): analyze_batch() 가 STYLE_BATCH_SIZE 개씩 묶어 처리하고,
+  python -m utils.style_features <디렉터리|파일...> [--out features.jsonl] 로 공유 캐시를 미리 채웁니다.
+- k-means++ 초기화 난수는 이미지 sha256 으로 시드하고 이미지별로 수렴을 판단하므로, 결과는 묶음 구성과
+  무관하게 이미지 내용으로만 정해집니다 (캐시 키가 내용 해시).
+- NumPy(requirements.txt)가 없는 환경에서는 features_for() 가 None 을 돌려주고 설명문 없이 기존대로 동작합니다.
+
+환경 변수:
+    STYLE_FEATURES_TTL  : 공유 캐시 보관 기간 (초, 기본 30일)
+    STYLE_BATCH_SIZE    : 일괄 처리 묶음 크기 (기본 256)
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy 없는 최소 설치 환경
+    np = None
+
+from utils.log import get_logger
+from utils.shared_cache import shared_cache
+from utils.tracing import span
+
+logger = get_logger(__name__)
+
+# 특징/설명문 형식이 바뀌면 올림 (캐시 키, pipeline_version 에 포함)
+VERSION = 2
+
+ENABLED = np is not None
+THUMB_SIZE = 64
+PALETTE_SIZE = 5
+KMEANS_ITERATIONS = 12
+BATCH_SIZE = int(os.environ.get("STYLE_BATCH_SIZE", "256"))
+
+_LRU_SIZE = 256
+_lru: "OrderedDict[str, StyleFeatures]" = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+@dataclass
+class StyleFeatures:
+    """스타일 이미지 하나의 특징 (값은 0~1, warmth 는 -1~1)"""
+
+    palette: List[Tuple[str, float]]  # (#RRGGBB, 비율) 많이 쓰인 순
+    brightness: float
+    contrast: float
+    saturation: float
+    texture: float
+    warmth: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StyleFeatures":
+        data = dict(data)
+        data["palette"] = [tuple(entry) for entry in data["palette"]]
+        return cls(**data)
+
+    def palette_rgb(self) -> List[Tuple[int, int, int]]:
+        return [tuple(int(color[i:i + 2], 16) for i in (1, 3, 5)) for color, _ in self.palette]
+
+    def prompt_descriptor(self) -> str:
+        """프롬프트에 붙일 한 줄 설명 (영문, 페이지 프롬프트 형식)"""
+        colors = ", ".join(f"{color} {share:.0%}" for color, share in self.palette)
+        brightness = "dark" if self.brightness < 0.35 else "medium" if self.brightness < 0.65 else "light"
+        contrast = "low" if self.contrast < 0.12 else "medium" if self.contrast < 0.25 else "high"
+        saturation = "muted" if self.saturation < 0.2 else "moderately saturated" if self.saturation < 0.45 else "vivid"
+        warmth = "warm" if self.warmth > 0.04 else "cool" if self.warmth < -0.04 else "neutral"
+        texture = "smooth" if self.texture < 0.03 else "fine" if self.texture < 0.08 else "rich, ornate"
+        return (
+            f"- Style analysis (of the style reference): palette {colors}; "
+            f"{brightness}, {contrast} contrast, {saturation}, {warmth} tones; {texture} texture"
+        )
+
+
+def _thumbnail_pixels(image_bytes: bytes) -> Optional["np.ndarray"]:
+    """THUMB_SIZE x THUMB_SIZE RGB 픽셀 (float32 0~1, (픽셀 수, 3)), 디코딩 실패 시 None"""
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("RGB", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+        image = image.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+    except Exception as e:
+        logger.warning("style image decode failed", extra={"fields": {"error": str(e)}})
+        return None
+    return np.asarray(image, dtype=np.float32).reshape(-1, 3) / 255.0
+
+
+def _seed_draws(images: Sequence[bytes], k: int) -> "np.ndarray":
+    """
+    이미지별 k-means++ 초기화 난수 (n, k) - 이미지 sha256 으로 시드
+
+    같은 스타일은 CLI 일괄 처리든 요청 중 단건 분석이든 같은 팔레트가 나오도록 (캐시 키가 내용 해시이므로).
+    """
+    return np.stack([
+        np.random.default_rng(int.from_bytes(hashlib.sha256(data).digest()[:8], "big")).random(k)
+        for data in images
+    ]).astype(np.float32)
+
+
+def _kmeans(pixels: "np.ndarray", k: int, draws: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    이미지 여러 장의 k-means 를 한 번에 (pixels: (n, p, 3), draws: _seed_draws) → (중심 (n, k, 3), 픽셀 수 (n, k))
+
+    이미지마다 수렴하면 그 행은 더 갱신하지 않으므로 결과는 같이 묶인 다른 이미지와 무관합니다.
+    """
+    n, p, _ = pixels.shape
+    rows = np.arange(n)
+    squared = (pixels ** 2).sum(-1)  # (n, p)
+
+    # k-means++ 초기화: 이미 고른 중심에서 먼 픽셀일수록 다음 중심으로 뽑힐 확률이 큼
+    centers = np.empty((n, k, 3), dtype=np.float32)
+    centers[:, 0] = pixels[rows, np.minimum((draws[:, 0] * p).astype(np.int64), p - 1)]
+    nearest = ((pixels - centers[:, :1]) ** 2).sum(-1)
+    for j in range(1, k):
+        cumulative = np.cumsum(nearest, axis=1)
+        targets = draws[:, j] * cumulative[:, -1]
+        index = np.minimum((cumulative < targets[:, None]).sum(1), p - 1)
+        centers[:, j] = pixels[rows, index]
+        nearest = np.minimum(nearest, ((pixels - centers[:, j:j + 1]) ** 2).sum(-1))
+
+    active = np.ones(n, dtype=bool)
+    counts = np.zeros((n, k), dtype=np.float32)
+    for _ in range(KMEANS_ITERATIONS):
+        # |x - c|² = |x|² - 2x·c + |c|²  → (n, p, k), 아직 수렴하지 않은 이미지만
+        x, c = pixels[active], centers[active]
+        distances = squared[active][:, :, None] - 2 * (x @ c.transpose(0, 2, 1)) \
+            + (c ** 2).sum(-1)[:, None, :]
+        labels = distances.argmin(-1)
+        onehot = (labels[:, :, None] == np.arange(k)).astype(np.float32)
+        active_counts = onehot.sum(1)  # (m, k)
+        sums = onehot.transpose(0, 2, 1) @ x
+        # 빈 군집은 이전 중심 유지
+        updated = np.where(active_counts[:, :, None] > 0, sums / np.maximum(active_counts, 1)[:, :, None], c)
+        converged = np.isclose(updated, c, atol=1e-4).all((1, 2))
+        centers[active] = updated
+        counts[active] = active_counts
+        active[np.flatnonzero(active)[converged]] = False
+        if not active.any():
+            break
+
+    return centers, counts
+
+
+def _stats(pixels: "np.ndarray") -> "np.ndarray":
+    """(n, p, 3) → (n, 5): 밝기, 대비, 채도, 질감, 따뜻함"""
+    n = pixels.shape[0]
+    luminance = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)  # (n, p)
+    high = pixels.max(-1)
+    low = pixels.min(-1)
+    saturation = np.where(high > 0, (high - low) / np.maximum(high, 1e-6), 0.0)
+    # 질감: 밝기 기울기 크기 평균 (가로/세로 이웃 차이)
+    grid = luminance.reshape(n, THUMB_SIZE, THUMB_SIZE)
+    gradient = np.abs(np.diff(grid, axis=1)).mean((1, 2)) + np.abs(np.diff(grid, axis=2)).mean((1, 2))
+    warmth = (pixels[:, :, 0] - pixels[:, :, 2]).mean(1)
+    return np.stack([luminance.mean(1), luminance.std(1), saturation.mean(1), gradient, warmth], axis=1)
+
+
+def _to_hex(color: "np.ndarray") -> str:
+    r, g, b = (int(round(float(v) * 255)) for v in np.clip(color, 0, 1))
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+
+def analyze_batch(images: Sequence[bytes]) -> List[Optional[StyleFeatures]]:
+    """
+    스타일 이미지 여러 장의 특징 (캐시 미사용, BATCH_SIZE 개씩 묶어 벡터 연산)
+
+    결과는 이미지 내용으로만 정해집니다 (묶음 구성과 무관). 디코딩에 실패한 이미지는 None.
+    NumPy 가 없으면 모두 None.
+    """
+    if not ENABLED:
+        return [None] * len(images)
+
+    results: List[Optional[StyleFeatures]] = [None] * len(images)
+    for start in range(0, len(images), BATCH_SIZE):
+        chunk = images[start:start + BATCH_SIZE]
+        decoded = [(start + i, _thumbnail_pixels(data)) for i, data in enumerate(chunk)]
+        decoded = [(index, pixels) for index, pixels in decoded if pixels is not None]
+        if not decoded:
+            continue
+        pixels = np.stack([p for _, p in decoded])
+        draws = _seed_draws([images[index] for index, _ in decoded], PALETTE_SIZE)
+        centers, counts = _kmeans(pixels, PALETTE_SIZE, draws)
+        stats = _stats(pixels)
+        shares = counts / counts.sum(1, keepdims=True)
+        order = np.argsort(-shares, axis=1)
+        for row, (index, _) in enumerate(decoded):
+            brightness, contrast, saturation, texture, warmth = (round(float(v), 4) for v in stats[row])
+            results[index] = StyleFeatures(
+                palette=[
+                    (_to_hex(centers[row, j]), round(float(shares[row, j]), 3))
+                    for j in order[row] if shares[row, j] > 0
+                ],
+                brightness=brightness,
+                contrast=contrast,
+                saturation=saturation,
+                texture=texture,
+                warmth=warmth,
+            )
+    return results
+
+
+def _cache_key(digest: str) -> str:
+    return f"v{VERSION}:{digest}"
+
+
+def features_for(image_bytes: Optional[bytes]) -> Optional[StyleFeatures]:
+    """스타일 이미지 특징 (스타일 내용 해시별 캐시: 프로세스 LRU → 공유 캐시 → 분석)"""
+    if not ENABLED or not image_bytes:
+        return None
+    key = _cache_key(hashlib.sha256(image_bytes).hexdigest())
+    with _lru_lock:
+        if key in _lru:
+            _lru.move_to_end(key)
+            return _lru[key]
+
+    cached = shared_cache.get_json("style", key)
+    if cached is not None:
+        features = StyleFeatures.from_dict(cached)
+    else:
+        with span("style.analyze", bytes_in=len(image_bytes)):
+            features = analyze_batch([image_bytes])[0]
+        if features is None:
+            return None
+        shared_cache.set_json("style", key, features.to_dict())
+
+    with _lru_lock:
+        _lru[key] = features
+        while len(_lru) > _LRU_SIZE:
+            _lru.popitem(last=False)
+    return features
+
+
+def _iter_files(targets: Sequence[str]) -> List[str]:
+    files = []
+    for target in targets:
+        if os.path.isdir(target):
+            for root, _, names in os.walk(target):
+                files.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+                )
+        else:
+            files.append(target)
+    return files
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """스타일 카탈로그 일괄 분석 → 공유 캐시 채우기 (+ JSONL 저장)"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="스타일 이미지 특징 일괄 추출")
+    parser.add_argument("targets", nargs="+", help="이미지 파일 또는 디렉터리")
+    parser.add_argument("--out", help="결과 JSONL 경로 (path, sha256, features)")
+    args = parser.parse_args(argv)
+
+    if not ENABLED:
+        raise SystemExit("numpy 가 설치되어 있지 않습니다")
+
+    files = _iter_files(args.targets)
+    start = time.perf_counter()
+    done = failed = 0
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    try:
+        for offset in range(0, len(files), BATCH_SIZE):
+            paths = files[offset:offset + BATCH_SIZE]
+            blobs = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    blobs.append(f.read())
+            for path, data, features in zip(paths, blobs, analyze_batch(blobs)):
+                if features is None:
+                    failed += 1
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                shared_cache.set_json("style", _cache_key(digest), features.to_dict())
+                if out:
+                    out.write(json.dumps({"path": path, "sha256": digest, "features": features.to_dict()}, ensure_ascii=False) + "\n")
+                done += 1
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"{done} styles analyzed, {failed} failed, {elapsed:.1f}s ({elapsed / max(done, 1) * 1000:.1f} ms/style)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+요청 단위 트레이싱 유틸리티
+
+파이프라인 각 단계(요청 파싱, 이미지 다운로드, 문구 생성, 지도, 페이지별 모델 호출,
+이미지 디코드/인코드, 저장소 업로드)를 span 으로 감싸 소요 시간과 속성(model, bytes,
+토큰 사용량, 재시도 횟수)을 기록합니다.
+
+    with start_trace("POST /api/generate-invitation") as trace:
+        with span("text.generate", model="gemini-2.0-flash-exp") as s:
+            ...
+            s.set(output_tokens=123)
+
+환경 변수:
+    TRACE_EXPORT           : "file" / "otlp" (미설정 시 내보내지 않음)
+    TRACE_FILE             : file 모드 출력 경로 (기본 traces.jsonl, 한 줄에 트레이스 1건)
+    OTEL_EXPORTER_OTLP_ENDPOINT : otlp 모드 수집기 주소 (기본 http://localhost:4318, OTLP/HTTP JSON)
+    TRACE_RESPONSE_HEADER  : "1" 이면 응답에 Server-Timing 요약 헤더 추가
+"""
+
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+SERVICE_NAME = "wedding-os-model"
+
+
+class Span:
+    """단계 1개의 구간 기록"""
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace: "Trace", parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> "Span":
+        """속성 추가 (None 값은 무시)"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+        return self
+
+    def add(self, key: str, amount: float = 1) -> "Span":
+        """누적 속성 증가 (재시도 횟수, 바이트 수 등)"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """요청 1건에 속한 span 모음"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = Span(name, self, None, attributes)
+
+    def _record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+        for listener in _span_listeners:
+            try:
+                listener(span)
+            except Exception as e:
+                logger.warning("span listener failed", extra={"fields": {"error": str(e)}})
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """루트 span 을 닫고 설정된 exporter 로 내보냅니다."""
+        if self.root.end_ns is not None:
+            return
+        self.root.error = error
+        self.root.end_ns = time.time_ns()
+        self._record(self.root)
+        _export(self)
+
+    def server_timing(self) -> str:
+        """종료된 span 을 이름별로 합산한 Server-Timing 헤더 값"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for s in self.spans:
+                if s is not self.root and s.end_ns is not None:
+                    totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+        items = [f"{name};dur={dur:.1f}" for name, dur in totals.items()]
+        items.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(items)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "spans": spans,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_span_listeners: List[Callable[[Span], None]] = []
+
+
+def add_span_listener(listener: Callable[[Span], None]) -> None:
+    """span 이 끝날 때마다 호출할 함수 등록 (메트릭 집계 등)"""
+    _span_listeners.append(listener)
+
+
+def current_span() -> Optional[Span]:
+    """현재 컨텍스트의 span (트레이스 밖이면 None)"""
+    return _current_span.get()
+
+
+def current_trace() -> Optional[Trace]:
+    current = _current_span.get()
+    return current.trace if current else None
+
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Trace]:
+    """
+    새 트레이스를 시작합니다. 블록을 벗어나면 루트 span 이 닫히고 내보내집니다.
+
+    스트리밍 응답처럼 루트를 나중에 닫아야 하면 begin_trace()/Trace.finish()를 직접 사용하세요.
+    """
+    trace, token = begin_trace(name, **attributes)
+    try:
+        yield trace
+    except BaseException as exc:
+        trace.finish(error=repr(exc))
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.finish()
+
+
+def begin_trace(name: str, **attributes: Any):
+    """트레이스를 시작하고 (trace, contextvar token)을 반환합니다."""
+    trace = Trace(name, attributes)
+    token = _current_span.set(trace.root)
+    return trace, token
+
+
+def end_context(token) -> None:
+    """begin_trace()로 설정한 현재 span 컨텍스트를 되돌립니다."""
+    _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    현재 트레이스 아래에 하위 span 을 엽니다.
+
+    트레이스 밖(스크립트 직접 실행 등)에서 호출하면 기록만 하고 내보내지 않습니다.
+    예외는 span 에 기록한 뒤 그대로 다시 발생합니다.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        trace = Trace(name, attributes)
+        current = trace.root
+    else:
+        trace = parent.trace
+        current = Span(name, trace, parent.span_id, attributes)
+
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = repr(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        if parent is not None:
+            trace._record(current)
+
+
+def record_span(name: str, start_ns: int, error: Optional[str] = None, **attributes: Any) -> None:
+    """
+    이미 끝난 구간을 현재 span 아래에 기록합니다.
+
+    제너레이터처럼 yield 를 사이에 두고 컨텍스트가 바뀌는 코드에서는 span() 대신
+    시작 시각(time.time_ns())만 잡아두었다가 이 함수로 남깁니다.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    done = Span(name, parent.trace, parent.span_id, attributes)
+    done.start_ns = start_ns
+    done.end_ns = time.time_ns()
+    done.error = error
+    parent.trace._record(done)
+
+
+def set_attributes(**attributes: Any) -> None:
+    """현재 span 에 속성 추가 (트레이스 밖이면 무시)"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def record_usage(usage_metadata: Any) -> None:
+    """Gemini usage_metadata 의 토큰 수를 현재 span 에 기록"""
+    current = _current_span.get()
+    if current is None or usage_metadata is None:
+        return
+    current.set(
+        input_tokens=getattr(usage_metadata, "prompt_token_count", None),
+        output_tokens=getattr(usage_metadata, "candidates_token_count", None),
+        thinking_tokens=getattr(usage_metadata, "thoughts_token_count", None),
+        total_tokens=getattr(usage_metadata, "total_token_count", None),
+        cached_tokens=getattr(usage_metadata, "cached_content_token_count", None),
+    )
+    # 출력 토큰 중 이미지 모달리티 (이미지 출력은 단가가 다름)
+    for detail in getattr(usage_metadata, "candidates_tokens_details", None) or []:
+        if "IMAGE" in str(getattr(detail, "modality", "")):
+            current.set(image_output_tokens=getattr(detail, "token_count", None))
+
+
+def record_response(response: Any) -> None:
+    """generate_content 응답의 토큰 수와 첫 후보의 finish_reason 을 현재 span 에 기록"""
+    record_usage(getattr(response, "usage_metadata", None))
+    candidates = getattr(response, "candidates", None) or []
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    if finish_reason:
+        set_attributes(finish_reason=str(finish_reason))
+
+
+def response_header_enabled() -> bool:
+    return os.environ.get("TRACE_RESPONSE_HEADER", "") in ("1", "true", "yes")
+
+
+# --- Exporters ---
+
+_export_queue: "queue.Queue[Trace]" = queue.Queue(maxsize=1000)
+_export_thread: Optional[threading.Thread] = None
+_export_lock = threading.Lock()
+
+
+def _export(trace: Trace) -> None:
+    """요청 경로를 막지 않도록 백그라운드 스레드로 넘깁니다 (큐가 가득 차면 버림)."""
+    if not os.environ.get("TRACE_EXPORT"):
+        return
+    _ensure_export_thread()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        logger.warning("trace export queue full - dropping trace")
+
+
+def _ensure_export_thread() -> None:
+    global _export_thread
+    with _export_lock:
+        if _export_thread is None or not _export_thread.is_alive():
+            _export_thread = threading.Thread(target=_export_worker, name="trace-exporter", daemon=True)
+            _export_thread.start()
+
+
+def _export_worker() -> None:
+    while True:
+        trace = _export_queue.get()
+        mode = os.environ.get("TRACE_EXPORT", "")
+        try:
+            if mode == "file":
+                _write_file(trace)
+            elif mode == "otlp":
+                _post_otlp(trace)
+        except Exception as e:
+            logger.warning("trace export failed", extra={"fields": {"mode": mode, "error": str(e)}})
+
+
+def _write_file(trace: Trace) -> None:
+    path = os.environ.get("TRACE_FILE", "traces.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace: Trace, s: Span) -> Dict[str, Any]:
+    item = {
+        "traceId": trace.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 2 if s is trace.root else 1,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        item["parentSpanId"] = s.parent_id
+    return item
+
+
+def _post_otlp(trace: Trace) -> None:
+    import requests
+
+    endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+    with trace._lock:
+        spans = [_otlp_span(trace, s) for s in trace.spans]
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "utils.tracing"}, "spans": spans}],
+        }]
+    }
+    response = requests.post(f"{endpoint}/v1/traces", json=payload, timeout=5)
+    response.raise_for_status()
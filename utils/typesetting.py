@@ -0,0 +1,461 @@
+"""
+청첩장 페이지 로컬 조판(typesetting) 유틸리티 (Pillow)
+
+하이브리드 렌더링(nanobanana_api 의 RENDER_MODE=hybrid)에서 모델이 만든 배경 위에 2페이지(인사말/초대)와
+3페이지(예식 정보/지도)의 문구를 직접 그립니다. 모델이 한글을 그리다 깨뜨리는 일이 없고, 문구만 바뀐
+재렌더링은 모델 호출 없이 바로 끝납니다.
+
+    from utils import typesetting
+    if typesetting.available():
+        png = typesetting.render_content_page(background_png, greeting=..., invitation=..., ...)
+
+- 글꼴: TYPESET_FONTS 에 준 파일, 저장소의 fonts/ 디렉터리, 시스템 한글 글꼴 순으로 찾습니다.
+  글자마다 그 글자가 들어 있는 첫 글꼴로 그립니다 (글꼴 대체).
+- 줄바꿈: 어절(공백) 단위로 채우고, 한 어절이 한 줄보다 길면 음절 단위로 나눕니다.
+  닫는 문장부호(. , ! ? 」 등)는 줄 첫머리에 오지 않고, 여는 괄호는 줄 끝에 남지 않습니다.
+- 글리프 캐시: 글꼴별 글자 포함 여부와 글자 폭을 캐시해 같은 글자를 다시 측정하지 않습니다.
+- 문구가 영역을 넘치면 글자 크기를 단계적으로 줄이고, 배경이 복잡하면 반투명 패널을 깔고 씁니다.
+
+한글 글꼴이 없으면 available() 이 False 이고, 호출 측은 모델이 글자까지 그리는 방식으로 돌아갑니다.
+글꼴 파일이 하나도 없으면 Pillow 기본 글꼴로 그립니다 (장애 대체 페이지용, utils/degraded.py).
+배경은 이미지 바이트나 PIL 이미지를 받고, size 를 주면 그 크기로 그립니다 (글자 크기는 비례 조정).
+
+환경 변수:
+    TYPESET_FONTS : 글꼴 파일 경로 목록 (os.pathsep 구분, 앞쪽 우선, .ttf/.otf/.ttc)
+"""
+
+import io
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageStat
+
+from utils.log import get_logger
+from utils.tracing import span
+
+logger = get_logger(__name__)
+
+# 조판 결과가 달라지는 수정을 하면 올림 (결과 캐시 키에 반영)
+VERSION = 1
+
+# 출력 크기 (이미지 모델의 3:4 2K 출력과 같음)
+PAGE_SIZE = (1536, 2048)
+
+_SYSTEM_FONTS = (
+    "/usr/share/fonts/truetype/nanum/NanumMyeongjo.ttf",
+    "/usr/share/fonts/truetype/nanum/NanumGothic.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSerifCJK-Regular.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSerifCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",
+    "/Library/Fonts/AppleMyungjo.ttf",
+    "C:/Windows/Fonts/malgun.ttf",
+)
+_LOCAL_FONT_DIR = Path(__file__).parent.parent / "fonts"
+_FONT_SUFFIXES = (".ttf", ".otf", ".ttc")
+
+# 이 글자를 그릴 수 있는 글꼴이 있어야 조판을 사용
+_PROBE = "가"
+# 어느 글꼴에도 없는 코드 포인트 (.notdef 글리프 비교용)
+_MISSING = "\uffff"
+_PROBE_SIZE = 24
+
+_NO_LINE_START = set(".,!?:;)]}…~%'\"”’」』〉》、。")
+_NO_LINE_END = set("([{“‘「『〈《")
+
+_INK_DARK = (51, 51, 51)
+_INK_LIGHT = (255, 255, 255)
+_PAPER = (254, 252, 247)
+
+# FreeType 글꼴 객체는 스레드 간에 공유하지 않도록 렌더링을 직렬화 (페이지당 수십 ms)
+_render_lock = threading.Lock()
+
+Background = Union[bytes, Image.Image, None]
+
+
+@lru_cache(maxsize=1)
+def font_paths() -> Tuple[str, ...]:
+    """사용할 글꼴 파일 목록 (우선순위 순, 존재하는 파일만)"""
+    configured = [p for p in os.environ.get("TYPESET_FONTS", "").split(os.pathsep) if p]
+    local = []
+    if _LOCAL_FONT_DIR.is_dir():
+        local = sorted(str(p) for p in _LOCAL_FONT_DIR.iterdir() if p.suffix.lower() in _FONT_SUFFIXES)
+    candidates = dict.fromkeys(configured + local + list(_SYSTEM_FONTS))
+    return tuple(p for p in candidates if os.path.isfile(p))
+
+
+@lru_cache(maxsize=64)
+def _font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    # 빈 경로는 Pillow 기본 글꼴 (글꼴 파일이 하나도 없을 때)
+    return ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+
+
+@lru_cache(maxsize=16)
+def _notdef(path: str) -> bytes:
+    return bytes(_font(path, _PROBE_SIZE).getmask(_MISSING))
+
+
+@lru_cache(maxsize=65536)
+def _has_glyph(path: str, ch: str) -> bool:
+    """글꼴에 글자가 있는지 (.notdef 와 같은 모양으로 그려지면 없음)"""
+    if ch.isspace():
+        return True
+    return bytes(_font(path, _PROBE_SIZE).getmask(ch)) != _notdef(path)
+
+
+@lru_cache(maxsize=65536)
+def _advance(path: str, size: int, ch: str) -> float:
+    return _font(path, size).getlength(ch)
+
+
+def available() -> bool:
+    """한글을 그릴 수 있는 글꼴 파일이 있는지"""
+    return any(_has_glyph(path, _PROBE) for path in font_paths())
+
+
+class FontSet:
+    """한 글자 크기의 대체 글꼴 목록"""
+
+    def __init__(self, size: int, paths: Sequence[str] = None):
+        self.size = size
+        self.paths = tuple(paths or font_paths()) or ("",)
+        ascent, descent = _font(self.paths[0], size).getmetrics()
+        self.ascent = ascent
+        self.height = ascent + descent
+
+    def path_for(self, ch: str) -> str:
+        for path in self.paths:
+            if _has_glyph(path, ch):
+                return path
+        return self.paths[0]
+
+    def runs(self, text: str) -> List[Tuple[str, str]]:
+        """같은 글꼴로 그릴 연속 구간 [(글꼴 경로, 문자열)]"""
+        runs: List[Tuple[str, str]] = []
+        for ch in text:
+            path = self.path_for(ch)
+            if runs and runs[-1][0] == path:
+                runs[-1] = (path, runs[-1][1] + ch)
+            else:
+                runs.append((path, ch))
+        return runs
+
+    def width(self, text: str) -> float:
+        return sum(_advance(self.path_for(ch), self.size, ch) for ch in text)
+
+    def draw(self, draw: ImageDraw.ImageDraw, x: float, baseline: float, text: str, fill) -> None:
+        # 글꼴마다 높이가 달라도 기준선(baseline)을 맞춤
+        for path, run in self.runs(text):
+            font = _font(path, self.size)
+            draw.text((x, baseline), run, font=font, fill=fill, anchor="ls")
+            x += font.getlength(run)
+
+
+def _break_word(word: str, measure: Callable[[str], float], max_width: float) -> List[str]:
+    """한 줄보다 긴 어절을 음절 단위로 나눔 (줄머리 금칙 문자는 앞줄 끝에 붙임)"""
+    pieces: List[str] = []
+    current = ""
+    for ch in word:
+        if current and measure(current + ch) > max_width and ch not in _NO_LINE_START:
+            carry = ""
+            while len(current) > 1 and current[-1] in _NO_LINE_END:
+                carry = current[-1] + carry
+                current = current[:-1]
+            pieces.append(current)
+            current = carry
+        current += ch
+    pieces.append(current)
+    return pieces
+
+
+def wrap_text(text: str, measure: Callable[[str], float], max_width: float) -> List[str]:
+    """
+    한국어 줄바꿈
+
+    Args:
+        text: 문구 (줄바꿈 문자는 그대로 유지)
+        measure: 문자열 폭을 돌려주는 함수
+        max_width: 줄 최대 폭
+
+    Returns:
+        줄 목록
+    """
+    lines: List[str] = []
+    for paragraph in text.replace("\r\n", "\n").split("\n"):
+        words = paragraph.split()
+        if not words:
+            lines.append("")
+            continue
+        line = ""
+        for word in words:
+            candidate = f"{line} {word}" if line else word
+            if measure(candidate) <= max_width or (line and word[0] in _NO_LINE_START):
+                line = candidate
+                continue
+            carry = ""
+            if line:
+                # 여는 괄호만 남은 어절은 다음 줄로
+                head, _, tail = line.rpartition(" ")
+                if head and tail and all(ch in _NO_LINE_END for ch in tail):
+                    line, carry = head, tail
+                lines.append(line)
+            word = f"{carry} {word}" if carry else word
+            if measure(word) <= max_width:
+                line = word
+                continue
+            pieces = _break_word(word, measure, max_width)
+            lines.extend(pieces[:-1])
+            line = pieces[-1]
+        lines.append(line)
+    return lines
+
+
+@dataclass
+class TextBlock:
+    """세로로 쌓는 문단 하나 (크기는 PAGE_SIZE 기준 px)"""
+
+    text: str
+    size: int
+    line_spacing: float = 1.6
+    gap_after: int = 56
+    divider_after: bool = False
+
+
+def _layout(blocks: Sequence[TextBlock], width: float, scale: float):
+    laid = []
+    height = 0.0
+    for block in blocks:
+        if not block.text:
+            continue
+        fonts = FontSet(max(12, int(block.size * scale)))
+        lines = wrap_text(block.text, fonts.width, width)
+        line_height = fonts.height * block.line_spacing
+        laid.append((block, fonts, lines, line_height))
+        height += line_height * len(lines) + block.gap_after * scale
+    if laid:
+        height -= laid[-1][0].gap_after * scale
+    return laid, height
+
+
+def _fit(blocks: Sequence[TextBlock], box: Tuple[int, int, int, int], base: float):
+    """영역에 들어갈 때까지 글자 크기를 줄여 배치 (최소 절반 크기)"""
+    width = box[2] - box[0]
+    scale = base
+    laid, height = _layout(blocks, width, scale)
+    while height > box[3] - box[1] and scale > base / 2:
+        scale *= 0.9
+        laid, height = _layout(blocks, width, scale)
+    return laid, height, scale
+
+
+def _ink(image: Image.Image, box: Tuple[int, int, int, int]) -> Tuple[Tuple[int, int, int], bool]:
+    """글자색과 반투명 패널 필요 여부 (영역의 밝기/복잡도 기준)"""
+    stat = ImageStat.Stat(image.crop(box).convert("L"))
+    mean, stddev = stat.mean[0], stat.stddev[0]
+    if stddev > 48:
+        return _INK_DARK, True
+    return (_INK_DARK if mean >= 128 else _INK_LIGHT), False
+
+
+def _panel(image: Image.Image, box: Tuple[int, int, int, int], padding: int = 48) -> Image.Image:
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    x0, y0, x1, y1 = box
+    ImageDraw.Draw(overlay).rounded_rectangle(
+        (x0 - padding, y0 - padding, x1 + padding, y1 + padding), radius=padding, fill=(*_PAPER, 200),
+    )
+    return Image.alpha_composite(image.convert("RGBA"), overlay).convert("RGB")
+
+
+def _draw_blocks(image: Image.Image, blocks: Sequence[TextBlock], box: Tuple[int, int, int, int]) -> Image.Image:
+    """블록들을 영역 안 세로 가운데에 가운데 정렬로 그림"""
+    base = image.width / PAGE_SIZE[0]
+    laid, height, scale = _fit(blocks, box, base)
+    x0, y0, x1, y1 = box
+    top = y0 + max(0.0, (y1 - y0 - height) / 2)
+    used = (x0, int(top), x1, int(top + height))
+    ink, busy = _ink(image, used)
+    if busy:
+        image = _panel(image, used, padding=int(48 * base))
+
+    draw = ImageDraw.Draw(image)
+    y = top
+    for block, fonts, lines, line_height in laid:
+        for line in lines:
+            baseline = y + (line_height - fonts.height) / 2 + fonts.ascent
+            fonts.draw(draw, x0 + (x1 - x0 - fonts.width(line)) / 2, baseline, line, ink)
+            y += line_height
+        gap = block.gap_after * scale
+        if block.divider_after:
+            center = (x0 + x1) / 2
+            draw.line((center - 60 * scale, y + gap / 2, center + 60 * scale, y + gap / 2), fill=ink, width=max(1, int(2 * base)))
+        y += gap
+    return image
+
+
+@lru_cache(maxsize=4)
+def _fitted(background: bytes, size: Tuple[int, int]) -> Image.Image:
+    # 2/3페이지가 같은 배경을 쓰므로 디코딩/리사이즈 결과를 재사용
+    image = Image.open(io.BytesIO(background)).convert("RGB")
+    return ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def _canvas(background: Background, size: Tuple[int, int] = PAGE_SIZE) -> Image.Image:
+    """배경을 size 로 맞춤 (가운데 기준 자르기, 없으면 단색 종이)"""
+    if background is None or background == b"":
+        return Image.new("RGB", size, _PAPER)
+    if isinstance(background, Image.Image):
+        return ImageOps.fit(background.convert("RGB"), size, Image.LANCZOS)
+    return _fitted(background, size).copy()
+
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    # 압축률보다 응답 시간 우선 (기본 6 대비 크기는 조금 크고 인코딩은 빠름)
+    image.save(buffer, format="PNG", compress_level=3)
+    return buffer.getvalue()
+
+
+def _box(left: float, top: float, right: float, bottom: float, size: Tuple[int, int] = PAGE_SIZE) -> Tuple[int, int, int, int]:
+    width, height = size
+    return int(width * left), int(height * top), int(width * right), int(height * bottom)
+
+
+def parents_line(father: str, mother: str, relation: str, name: str) -> str:
+    """예: "홍판서 · 김씨의 아들 홍길동" (부모 이름이 없으면 이름만)"""
+    parents = " · ".join(p for p in (father, mother) if p)
+    return f"{parents}의 {relation} {name}" if parents else name
+
+
+def format_date(value: str) -> str:
+    """2026-03-21 → 2026년 3월 21일 토요일 (형식을 모르면 그대로)"""
+    try:
+        date = datetime.strptime(value.strip(), "%Y-%m-%d")
+    except (AttributeError, ValueError):
+        return value or ""
+    weekday = "월화수목금토일"[date.weekday()]
+    return f"{date.year}년 {date.month}월 {date.day}일 {weekday}요일"
+
+
+def format_time(value: str) -> str:
+    """14:30 → 오후 2시 30분 (형식을 모르면 그대로)"""
+    try:
+        time = datetime.strptime(value.strip(), "%H:%M")
+    except (AttributeError, ValueError):
+        return value or ""
+    period = "오전" if time.hour < 12 else "오후"
+    hour = time.hour % 12 or 12
+    return f"{period} {hour}시" + (f" {time.minute}분" if time.minute else "")
+
+
+def render_content_page(
+    background: Background,
+    *,
+    greeting: str,
+    invitation: str,
+    groom_name: str,
+    bride_name: str,
+    groom_father: str = "",
+    groom_mother: str = "",
+    bride_father: str = "",
+    bride_mother: str = "",
+    size: Tuple[int, int] = PAGE_SIZE,
+) -> bytes:
+    """2페이지 (인사말 & 초대): 배경 위에 문구와 혼주 이름을 그린 PNG"""
+    blocks = [
+        TextBlock(greeting, size=52, divider_after=True, gap_after=120),
+        TextBlock(invitation, size=48, gap_after=140),
+        TextBlock(parents_line(groom_father, groom_mother, "아들", groom_name), size=44, gap_after=24),
+        TextBlock(parents_line(bride_father, bride_mother, "딸", bride_name), size=44),
+    ]
+    with span("page.compose", page=2) as s, _render_lock:
+        image = _draw_blocks(_canvas(background, size), blocks, _box(0.14, 0.14, 0.86, 0.86, size))
+        data = _encode(image)
+        s.set(bytes_out=len(data))
+    return data
+
+
+def render_location_page(
+    background: Background,
+    *,
+    wedding_date: str,
+    wedding_time: str,
+    venue: str,
+    address: str,
+    location_text: str = "",
+    map_image: Optional[bytes] = None,
+    size: Tuple[int, int] = PAGE_SIZE,
+) -> bytes:
+    """3페이지 (장소 안내): 예식 일시/장소 문구와 지도(있으면 하단, 둥근 모서리)를 그린 PNG"""
+    blocks = [
+        TextBlock(format_date(wedding_date), size=60, gap_after=20),
+        TextBlock(format_time(wedding_time), size=48, divider_after=True, gap_after=100),
+        TextBlock(venue, size=56, gap_after=24),
+        TextBlock(address, size=40, gap_after=48),
+        TextBlock(location_text, size=40),
+    ]
+    with span("page.compose", page=3, map=map_image is not None) as s, _render_lock:
+        image = _canvas(background, size)
+        if map_image:
+            image = _draw_blocks(image, blocks, _box(0.14, 0.10, 0.86, 0.52, size))
+            image = _paste_rounded(image, map_image, _box(0.14, 0.56, 0.86, 0.90, size), radius=int(24 * size[0] / PAGE_SIZE[0]))
+        else:
+            image = _draw_blocks(image, blocks, _box(0.14, 0.14, 0.86, 0.86, size))
+        data = _encode(image)
+        s.set(bytes_out=len(data))
+    return data
+
+
+def render_cover_page(
+    background: Background,
+    *,
+    groom_name: str,
+    bride_name: str,
+    photo: Optional[bytes] = None,
+    size: Tuple[int, int] = PAGE_SIZE,
+) -> bytes:
+    """1페이지 (커버): 사진(있으면 상단, 둥근 모서리)과 신랑 ♥ 신부 이름을 그린 PNG"""
+    blocks = [TextBlock(f"{groom_name} ♥ {bride_name}", size=72)]
+    with span("page.compose", page=1, photo=photo is not None) as s, _render_lock:
+        image = _canvas(background, size)
+        if photo:
+            image = _paste_rounded(image, photo, _box(0.12, 0.10, 0.88, 0.74, size), radius=int(24 * size[0] / PAGE_SIZE[0]))
+            image = _draw_blocks(image, blocks, _box(0.12, 0.78, 0.88, 0.90, size))
+        else:
+            image = _draw_blocks(image, blocks, _box(0.12, 0.14, 0.88, 0.86, size))
+        data = _encode(image)
+        s.set(bytes_out=len(data))
+    return data
+
+
+def render_text_page(
+    background: Background,
+    blocks: Sequence[TextBlock],
+    *,
+    page: int = 0,
+    size: Tuple[int, int] = PAGE_SIZE,
+) -> bytes:
+    """임의의 문단들을 가운데 정렬로 그린 PNG"""
+    with span("page.compose", page=page) as s, _render_lock:
+        image = _draw_blocks(_canvas(background, size), blocks, _box(0.14, 0.14, 0.86, 0.86, size))
+        data = _encode(image)
+        s.set(bytes_out=len(data))
+    return data
+
+
+def _paste_rounded(image: Image.Image, picture: bytes, box: Tuple[int, int, int, int], radius: int = 24) -> Image.Image:
+    x0, y0, x1, y1 = box
+    tile = Image.open(io.BytesIO(picture)).convert("RGB")
+    tile = ImageOps.contain(tile, (x1 - x0, y1 - y0), Image.LANCZOS)
+    mask = Image.new("L", tile.size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, tile.size[0] - 1, tile.size[1] - 1), radius=radius, fill=255)
+    left = x0 + (x1 - x0 - tile.size[0]) // 2
+    top = y0 + (y1 - y0 - tile.size[1]) // 2
+    image.paste(tile, (left, top), mask)
+    return image
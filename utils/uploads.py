@@ -0,0 +1,180 @@
+"""
+업로드 이미지 수신 제한 / 축소 (multipart, /api/generate-invitation-test)
+
+업로드 파일을 통째로 read() 한 뒤 base64 로 바꾸면 30MB 사진 하나가 작업 전부터 70MB 가량을 씁니다.
+이 모듈은 다음 순서로 메모리를 묶어 둡니다.
+
+1. UploadLimitMiddleware: Content-Length 가 한도를 넘으면 본문을 읽기 전에 413.
+   Content-Length 없이(chunked) 들어오면 받은 바이트를 세다가 한도를 넘는 순간 413.
+   multipart 파서는 파일을 청크 단위로 SpooledTemporaryFile(1MB 초과분은 디스크)에 씁니다.
+2. read_image(): 파일별 바이트 한도 확인 → 헤더만 읽어 형식/가로세로 확인(픽셀 한도 초과 시 413,
+   이미지가 아니면 415) → 한 변이 UPLOAD_MAX_SIDE 보다 크면 축소. JPEG 는 draft 모드로 디코딩 단계에서
+   1/2~1/8 크기로 읽어 원본 해상도 전체를 메모리에 펼치지 않습니다. 작은 이미지는 원본 바이트 그대로.
+3. 디코딩/축소는 스레드풀에서, 동시에 UPLOAD_DECODE_CONCURRENCY 개까지만 실행.
+
+    app.add_middleware(UploadLimitMiddleware, paths=("/api/generate-invitation-test",))
+    image_bytes = await uploads.read_image(wedding_image)   # UploadRejected(413/415) 가능
+
+환경 변수:
+    UPLOAD_MAX_MB              : 파일 하나 최대 크기 (기본 20)
+    UPLOAD_MAX_REQUEST_MB      : 요청 본문 전체 최대 크기 (기본 45, 파일 2개 + 폼 필드)
+    UPLOAD_MAX_PIXELS          : 가로×세로 최대 픽셀 수 (기본 40000000)
+    UPLOAD_MAX_SIDE            : 긴 변이 이보다 크면 축소 (기본 2048, 생성 해상도 2K 기준)
+    UPLOAD_DECODE_CONCURRENCY  : 동시 디코딩/축소 수 (기본 2)
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import threading
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from utils.log import get_logger
+from utils.tracing import span
+
+logger = get_logger(__name__)
+
+_MB = 1024 * 1024
+
+MAX_FILE_BYTES = int(float(os.environ.get("UPLOAD_MAX_MB", "20")) * _MB)
+MAX_REQUEST_BYTES = int(float(os.environ.get("UPLOAD_MAX_REQUEST_MB", "45")) * _MB)
+MAX_PIXELS = int(os.environ.get("UPLOAD_MAX_PIXELS", "40000000"))
+MAX_SIDE = int(os.environ.get("UPLOAD_MAX_SIDE", "2048"))
+
+_decode_slots = threading.BoundedSemaphore(max(1, int(os.environ.get("UPLOAD_DECODE_CONCURRENCY", "2"))))
+
+
+class UploadRejected(HTTPException):
+    """업로드 거절 (413: 너무 큼, 415: 이미지 아님)"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(status_code=status_code, detail=message)
+        self.message = message
+
+
+def rejection_response(exc: UploadRejected) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"success": False, "error": exc.message})
+
+
+def _too_large(what: str, limit: int) -> UploadRejected:
+    return UploadRejected(413, f"{what} 크기가 너무 큽니다 (최대 {limit / _MB:.0f}MB)")
+
+
+class UploadLimitMiddleware:
+    """
+    지정 경로의 요청 본문 크기 제한 (ASGI 미들웨어)
+
+    Content-Length 로 먼저 거르고, 실제로 받은 바이트도 세어 한도를 넘으면 UploadRejected 를 올립니다
+    (폼 파싱 중이면 FastAPI 가 그대로 413 응답으로 바꿈).
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: Optional[int] = None):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes or MAX_REQUEST_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > self.max_bytes:
+                    logger.warning("upload rejected", extra={"fields": {"bytes": declared, "limit": self.max_bytes}})
+                    await rejection_response(_too_large("요청 본문", self.max_bytes))(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    logger.warning("upload rejected while streaming", extra={"fields": {"limit": self.max_bytes}})
+                    raise _too_large("요청 본문", self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _file_size(upload: UploadFile) -> int:
+    if upload.size is not None:
+        return upload.size
+    file = upload.file
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def _ingest(upload: UploadFile) -> bytes:
+    """스풀 파일에서 이미지를 확인하고 필요하면 축소 (스레드에서 실행)"""
+    from PIL import Image, UnidentifiedImageError
+
+    size = _file_size(upload)
+    if size > MAX_FILE_BYTES:
+        raise _too_large(upload.filename or "파일", MAX_FILE_BYTES)
+
+    file = upload.file
+    file.seek(0)
+    with _decode_slots, span("upload.ingest", bytes_in=size) as s:
+        try:
+            # open 은 헤더만 읽음 (픽셀 디코딩 전)
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            raise UploadRejected(413, "이미지 해상도가 너무 큽니다")
+        except (UnidentifiedImageError, OSError):
+            raise UploadRejected(415, f"이미지 파일이 아닙니다: {upload.filename or ''}")
+
+        width, height = image.size
+        s.set(width=width, height=height, format=image.format)
+        if width * height > MAX_PIXELS:
+            raise UploadRejected(413, f"이미지 해상도가 너무 큽니다 ({width}x{height}, 최대 {MAX_PIXELS} 픽셀)")
+
+        if max(width, height) <= MAX_SIDE:
+            file.seek(0)
+            return file.read()
+
+        # JPEG 는 디코딩 단계에서 축소 (DCT 스케일링, 원본 해상도 버퍼를 만들지 않음)
+        fmt = "JPEG" if image.format == "JPEG" else "PNG"
+        image.draft("RGB", (MAX_SIDE, MAX_SIDE))
+        image.thumbnail((MAX_SIDE, MAX_SIDE))
+        if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        if fmt == "JPEG":
+            image.save(out, format="JPEG", quality=90)
+        else:
+            image.save(out, format="PNG", compress_level=3)
+        data = out.getvalue()
+        s.set(resized_to=f"{image.width}x{image.height}", bytes_out=len(data))
+        return data
+
+
+async def read_image(upload: Optional[UploadFile]) -> Optional[bytes]:
+    """
+    업로드 이미지를 한도 확인 후 (필요하면 축소해) 바이트로 반환
+
+    Raises:
+        UploadRejected: 파일/픽셀 한도 초과(413), 이미지 아님(415)
+    """
+    if upload is None:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, _ingest, upload)
+    finally:
+        await upload.close()
@@ -0,0 +1,205 @@
+"""
+토큰 사용량 / 비용 집계 유틸리티
+
+모델 호출 span 에 기록된 토큰 수(utils.tracing.record_usage)로 비용을 계산해 span 에
+cost_usd 속성을 붙이고, 요청이 끝나면 테넌트별 일일 사용액에 합산합니다.
+
+가격표는 100만 토큰당 USD (이미지 생성 전용 모델은 장당 USD) 입니다.
+cached_input 은 컨텍스트 캐시에서 읽은 입력 토큰 단가, cache_storage 는 캐시 보관 단가(시간당)입니다.
+PRICE_TABLE_FILE 로 JSON 파일을 지정하면 모델별로 덮어씁니다:
+
+    {"gemini-3-pro-image-preview": {"input": 2.0, "output": 12.0, "image_output": 120.0},
+     "imagen-4.0-generate-001": {"per_image": 0.04}}
+
+테넌트 예산 (X-Tenant-ID 헤더 기준, 날짜가 바뀌면 초기화):
+    TENANT_DAILY_BUDGET_USD : 기본 일일 한도 (미설정 시 무제한)
+    TENANT_BUDGETS          : 테넌트별 한도 JSON (예: {"acme": 50, "trial": 1})
+
+사용액은 프로세스 메모리에 보관하므로 멀티 워커에서는 워커별로 집계됩니다.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from utils.log import get_logger
+from utils.tracing import Span, Trace, add_span_listener
+
+logger = get_logger(__name__)
+
+# 2025년 공개 가격 기준 (100만 토큰당 USD). 변경 시 PRICE_TABLE_FILE 로 덮어쓰기
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "gemini-2.0-flash-exp": {"input": 0.10, "output": 0.40, "cached_input": 0.025, "cache_storage": 1.0},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40, "cached_input": 0.025, "cache_storage": 1.0},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached_input": 0.03, "cache_storage": 1.0},
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.0, "cached_input": 0.125, "cache_storage": 4.5},
+    "gemini-3-pro-preview": {"input": 2.0, "output": 12.0, "cached_input": 0.20, "cache_storage": 4.5},
+    "gemini-3-pro-image-preview": {"input": 2.0, "output": 12.0, "image_output": 120.0,
+                                   "cached_input": 0.20, "cache_storage": 4.5},
+    "imagen-4.0-generate-001": {"per_image": 0.04},
+}
+
+_TOKEN_KEYS = ("input_tokens", "cached_tokens", "output_tokens", "image_output_tokens", "thinking_tokens")
+
+
+def _load_prices() -> Dict[str, Dict[str, float]]:
+    prices = {model: dict(entry) for model, entry in DEFAULT_PRICES.items()}
+    path = os.environ.get("PRICE_TABLE_FILE")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for model, entry in json.load(f).items():
+                prices.setdefault(model, {}).update(entry)
+    return prices
+
+
+PRICES = _load_prices()
+
+
+def _price_for(model: str) -> Optional[Dict[str, float]]:
+    """모델명 정규화 후 가격표 조회 ("models/" 접두사 제거, 버전 접미사는 앞부분 일치)"""
+    name = model[len("models/"):] if model.startswith("models/") else model
+    if name in PRICES:
+        return PRICES[name]
+    for known in sorted(PRICES, key=len, reverse=True):
+        if name.startswith(known):
+            return PRICES[known]
+    return None
+
+
+def call_cost(model: str, attrs: Dict[str, Any]) -> Optional[float]:
+    """모델 호출 1건의 비용 (가격표에 없는 모델이면 None)"""
+    price = _price_for(model)
+    if price is None:
+        return None
+    if "per_image" in price:
+        return price["per_image"] * attrs.get("images", 0)
+
+    output_tokens = attrs.get("output_tokens", 0) or 0
+    image_tokens = attrs.get("image_output_tokens", 0) or 0
+    thinking_tokens = attrs.get("thinking_tokens", 0) or 0
+    text_tokens = max(0, output_tokens - image_tokens)
+    # 입력 토큰 중 컨텍스트 캐시에서 읽은 부분은 캐시 단가
+    cached_tokens = attrs.get("cached_tokens", 0) or 0
+    input_tokens = max(0, (attrs.get("input_tokens", 0) or 0) - cached_tokens)
+    cost = (
+        input_tokens * price.get("input", 0)
+        + cached_tokens * price.get("cached_input", price.get("input", 0))
+        # 사고(thinking) 토큰은 출력 단가로 과금
+        + (text_tokens + thinking_tokens) * price.get("output", 0)
+        + image_tokens * price.get("image_output", price.get("output", 0))
+    )
+    return cost / 1_000_000
+
+
+def cache_storage_cost(model: str, tokens: int, seconds: float) -> Optional[float]:
+    """컨텍스트 캐시 tokens 개를 seconds 동안 보관하는 비용 (가격표에 없으면 None)"""
+    price = _price_for(model)
+    if price is None or "cache_storage" not in price:
+        return None
+    return tokens * price["cache_storage"] * seconds / 3600 / 1_000_000
+
+
+def summarize_trace(trace: Optional[Trace]) -> Dict[str, Any]:
+    """요청 1건의 모델 호출별 사용량과 합계 (응답 메타데이터용)"""
+    totals: Dict[str, Any] = {key: 0 for key in _TOKEN_KEYS}
+    totals["cost_usd"] = 0.0
+    calls = []
+    if trace is None:
+        totals["calls"] = calls
+        return totals
+
+    with trace._lock:
+        spans = [
+            s for s in trace.spans
+            if s.parent_id is not None and ("cost_usd" in s.attributes or "input_tokens" in s.attributes)
+        ]
+    for s in spans:
+        attrs = s.attributes
+        call = {"stage": s.name, "model": attrs.get("model")}
+        if "page" in attrs:
+            call["page"] = attrs["page"]
+        for key in _TOKEN_KEYS:
+            if attrs.get(key):
+                call[key] = attrs[key]
+                totals[key] += attrs[key]
+        call["cost_usd"] = round(attrs.get("cost_usd", 0.0), 6)
+        totals["cost_usd"] += attrs.get("cost_usd", 0.0)
+        calls.append(call)
+
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    totals["calls"] = calls
+    return totals
+
+
+class BudgetTracker:
+    """테넌트별 일일 사용액 (로컬 날짜 기준)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spent: Dict[Tuple[str, str], float] = {}
+        self.default_limit = float(os.environ["TENANT_DAILY_BUDGET_USD"]) if os.environ.get("TENANT_DAILY_BUDGET_USD") else None
+        self.limits: Dict[str, float] = json.loads(os.environ.get("TENANT_BUDGETS") or "{}")
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d")
+
+    def limit(self, tenant: str) -> Optional[float]:
+        return self.limits.get(tenant, self.default_limit)
+
+    def spent(self, tenant: str) -> float:
+        with self._lock:
+            return self._spent.get((tenant, self._today()), 0.0)
+
+    def remaining(self, tenant: str) -> Optional[float]:
+        limit = self.limit(tenant)
+        return None if limit is None else max(0.0, limit - self.spent(tenant))
+
+    def exceeded(self, tenant: str) -> bool:
+        limit = self.limit(tenant)
+        return limit is not None and self.spent(tenant) >= limit
+
+    def charge(self, tenant: str, amount: float) -> None:
+        if amount <= 0:
+            return
+        key = (tenant, self._today())
+        with self._lock:
+            # 지난 날짜 항목 정리
+            for old in [k for k in self._spent if k[1] != key[1]]:
+                del self._spent[old]
+            self._spent[key] = self._spent.get(key, 0.0) + amount
+
+
+budgets = BudgetTracker()
+
+
+def _annotate_span(s: Span) -> None:
+    """
+    모델 호출 span 에 cost_usd 를 붙이고, 루트 span 이 닫히면 테넌트 사용액에 합산
+
+    utils.metrics 의 리스너보다 먼저 등록되어야 메트릭에 비용이 반영됩니다
+    (metrics 모듈이 이 모듈을 먼저 import 함).
+    """
+    attrs = s.attributes
+    if s.parent_id is None:
+        tenant = attrs.get("tenant")
+        if tenant:
+            with s.trace._lock:
+                total = sum(child.attributes.get("cost_usd", 0.0) for child in s.trace.spans if child is not s)
+            budgets.charge(tenant, total)
+            attrs["cost_usd"] = round(total, 6)
+        return
+
+    model = attrs.get("model")
+    if not model or not any(key in attrs for key in ("input_tokens", "output_tokens", "images")):
+        return
+    cost = call_cost(str(model), attrs)
+    if cost is None:
+        logger.debug("no price for model", extra={"fields": {"model": model}})
+        return
+    attrs["cost_usd"] = cost
+
+
+add_span_listener(_annotate_span)
@@ -0,0 +1,195 @@
+"""
+기동 워밍업 / 준비 상태(readiness) 유틸리티
+
+배포 직후 첫 요청이 떠안던 초기 비용을 서버 시작 시 미리 치릅니다:
+- 파이프라인 모듈 import (google-genai, boto3, Pillow 등은 첫 사용 시 import 되도록 지연되어 있음)
+- 프롬프트 파일 읽기 + Jinja2 컴파일, 문구 응답 스키마(types.Schema) 변환
+- Pillow PNG/JPEG 코덱 로드
+- Gemini(키 풀의 키마다) / S3 클라이언트 생성 후 가벼운 호출로 keep-alive 연결 선개설 (TLS 핸드셰이크)
+
+/ready 는 워밍업이 끝나기 전까지 503 을 반환합니다 (readinessProbe 용, /health 는 생존 여부만).
+단계가 실패해도 (네트워크 일시 오류, 권한 없음 등) 경고만 남기고 다음 단계로 진행하며,
+실패한 단계의 비용은 첫 요청이 치르게 됩니다. 워커 프로세스마다 따로 실행됩니다.
+
+환경 변수:
+    WARMUP          : 0 이면 워밍업 없이 바로 ready (기본 1)
+    WARMUP_NETWORK  : 0 이면 연결 선개설(Gemini models.get / S3 head_bucket) 생략 (기본 1)
+    WARMUP_MODEL    : 연결 선개설에 조회할 모델 (기본 gemini-2.0-flash-exp)
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _import_pipelines() -> Dict[str, Any]:
+    import gemini_invitation_api  # noqa: F401
+    import gemini_text_api  # noqa: F401
+    import imagen_design_api  # noqa: F401
+    import nanobanana_api  # noqa: F401
+
+    return {}
+
+
+def _compile_prompts() -> Dict[str, Any]:
+    import gemini_text_api
+    from utils.prompt_loader import PromptLoader
+
+    files = PromptLoader().warmup()
+    # 템플릿 렌더링 + JSON Schema → Gemini Schema 변환까지 한 번 실행
+    gemini_text_api._build_text_request(
+        tone="warm", groom_name="", bride_name="", groom_father="", groom_mother="",
+        bride_father="", bride_mother="", venue="", wedding_date="", wedding_time="",
+    )
+    return {"files": files}
+
+
+def _exercise_codecs() -> Dict[str, Any]:
+    from PIL import Image
+
+    Image.init()
+    image = Image.new("RGB", (16, 16), (255, 255, 255))
+    formats = []
+    for fmt in ("PNG", "JPEG"):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt)
+        buffer.seek(0)
+        Image.open(buffer).load()
+        formats.append(fmt)
+    return {"formats": formats}
+
+
+def _connect_gemini(network: bool) -> Dict[str, Any]:
+    from utils.genai_client import get_key_pool
+
+    # 키 풀이면 키마다 클라이언트(연결 풀)가 따로 있으므로 모두 연결
+    pool = get_key_pool()
+    clients = [pool.client(key) for key in pool.keys]
+    if not network:
+        return {"connected": False, "keys": len(clients)}
+    model = os.environ.get("WARMUP_MODEL", "gemini-2.0-flash-exp")
+    for client in clients:
+        client.models.get(model=model)
+    return {"connected": True, "model": model, "keys": len(clients)}
+
+
+def _connect_s3(network: bool) -> Dict[str, Any]:
+    import imagen_design_api
+    import nanobanana_api
+
+    # 업로드하는 파이프라인만 (gemini_invitation_api 는 로컬 저장).
+    # 같은 설정이면 utils.aws 캐시로 같은 클라이언트(같은 연결 풀)가 반환됨
+    targets = {}
+    for module in (nanobanana_api, imagen_design_api):
+        client = module._get_s3_client()
+        targets.setdefault(id(client), (client, module.S3_BUCKET))
+    if not network:
+        return {"clients": len(targets), "connected": False}
+
+    for client, bucket in targets.values():
+        if bucket:
+            client.head_bucket(Bucket=bucket)
+    return {"clients": len(targets), "connected": True}
+
+
+class WarmupState:
+    """워밍업 진행 상태 (/ready 응답)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self.steps[name] = result
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {
+                "ready": self.ready,
+                "elapsed_s": elapsed,
+                "steps": {name: dict(result) for name, result in self.steps.items()},
+            }
+
+
+state = WarmupState()
+
+
+def _steps(network: bool) -> List[Tuple[str, Callable[[], Dict[str, Any]]]]:
+    return [
+        ("imports", _import_pipelines),
+        ("prompts", _compile_prompts),
+        ("codecs", _exercise_codecs),
+        ("gemini", lambda: _connect_gemini(network)),
+        ("s3", lambda: _connect_s3(network)),
+    ]
+
+
+def preload() -> None:
+    """
+    fork 전(gunicorn --preload 마스터)에 실행해도 안전한 단계만 실행
+
+    모듈/프롬프트/코덱은 copy-on-write 로 워커가 공유하고, 클라이언트와 연결은
+    fork 이후 각 워커의 run_warmup 에서 만듭니다 (소켓/스레드는 fork 를 넘길 수 없음).
+    """
+    if os.environ.get("WARMUP", "1") == "0":
+        return
+    for name, step in _steps(network=False)[:3]:
+        try:
+            step()
+        except Exception as e:
+            logger.warning("preload step failed", extra={"fields": {"step": name, "error": repr(e)}})
+
+
+def run_warmup() -> Dict[str, Any]:
+    """워밍업 단계를 순서대로 실행 (동기, 스레드에서 호출)"""
+    state.started_at = time.time()
+    if os.environ.get("WARMUP", "1") == "0":
+        state.finished_at = time.time()
+        state.ready = True
+        return state.to_dict()
+
+    network = os.environ.get("WARMUP_NETWORK", "1") != "0"
+    for name, step in _steps(network):
+        start = time.perf_counter()
+        try:
+            result = {"ok": True, **step()}
+        except Exception as e:
+            result = {"ok": False, "error": repr(e)}
+            logger.warning("warmup step failed", extra={"fields": {"step": name, "error": repr(e)}})
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        state.record(name, result)
+
+    state.finished_at = time.time()
+    state.ready = True
+    summary = state.to_dict()
+    logger.info("warmup finished", extra={"fields": {
+        "elapsed_s": summary["elapsed_s"],
+        "steps": {name: result["ms"] for name, result in summary["steps"].items()},
+        "failed": [name for name, result in summary["steps"].items() if not result["ok"]],
+    }})
+    return summary
+
+
+async def warmup_in_background() -> Dict[str, Any]:
+    """이벤트 루프를 막지 않도록 기본 executor 에서 워밍업 실행 (startup 에서 태스크로 실행)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, contextvars.copy_context().run, run_warmup)
+
+
+def is_ready() -> bool:
+    return state.ready